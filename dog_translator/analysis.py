@@ -0,0 +1,312 @@
+from datetime import datetime
+import numpy as np
+from features import StreamingFeatures, extract_features, extract_features_batch
+from metrics import metrics
+
+# 默认分析阈值，键名与 settings.json 保持一致
+DEFAULT_THRESHOLDS = {
+    'high_freq_threshold': 1000,      # 高频阈值（频谱质心, Hz）
+    'high_volume_threshold': 0.01,    # 高音量阈值
+    'freq_std_threshold': 1000,       # 频率标准差阈值（频谱带宽, Hz）
+    'volume_change_threshold': 0.01   # 音量变化阈值
+}
+
+# 规则分类没有概率输出，使用固定的置信度
+DEFAULT_CONFIDENCE = 0.85
+
+# 没有有效录音数据时使用的默认情绪
+DEFAULT_EMOTIONS = {
+    "happy": 0.7,
+    "hungry": 0.2,
+    "anxious": 0.1
+}
+
+# 规则命中时的情绪得分，顺序与 match_rules 中的规则优先级一致，最后一项为默认值
+RULE_EMOTIONS = [
+    {"excited": 0.9, "happy": 0.7},    # 高频率和大音量变化 -> 兴奋/开心
+    {"anxious": 0.8, "alert": 0.6},    # 频率波动和高音量 -> 焦虑/警觉
+    {"calm": 0.8, "sleepy": 0.6},
+    {"playful": 0.85, "happy": 0.7},
+    {"neutral": 0.5}                   # 没有检测到明显情绪
+]
+
+EMOTION_SUGGESTIONS = {
+    "happy": ["狗狗心情不错，可以和它玩耍互动", "可以给它最喜欢的玩具"],
+    "excited": ["狗狗很兴奋，可以带它出去散步", "可以和它玩投球游戏"],
+    "anxious": ["狗狗可能感到焦虑，多给予安抚和陪伴", "检查周围环境是否有让它紧张的因素"],
+    "alert": ["狗狗处于警觉状态，查看是否有异常情况", "确保环境安全"],
+    "calm": ["狗狗很放松，是互动的好时机", "可以进行一些轻松的训练"],
+    "sleepy": ["狗狗有点困了，可以让它休息", "确保它有舒适的睡觉区域"],
+    "playful": ["狗狗想要玩耍，陪它玩一会儿", "拿出它喜欢的玩具"],
+    "neutral": ["狗狗情绪平静", "保持正常的日常活动"],
+    "hungry": ["狗狗可能饿了，检查是否到喂食时间", "确保食物和水都充足"]
+}
+
+
+def to_float(block):
+    """把整数 PCM 数据转换为 [-1, 1] 范围的 float32，浮点数据原样返回"""
+    block = np.asarray(block)
+    if block.dtype.kind == 'i':
+        scale = float(np.iinfo(block.dtype).max) + 1
+        return block.astype(np.float32) / scale
+    if block.dtype.kind == 'u':  # 8 位 WAV 是无符号的
+        return (block.astype(np.float32) - 128) / 128
+    return block
+
+
+def as_mono(audio):
+    """把 1-D 或 (N, 声道) 的音频转换为一维数组
+
+    单声道时返回原数组的视图，不复制也不转换类型（int16 数据在特征提取时按块换算），
+    多声道时取各声道的平均值（浮点）。
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 2:
+        audio = audio[:, 0] if audio.shape[1] == 1 else to_float(audio).mean(axis=1)
+    return audio
+
+
+def from_float(block, dtype):
+    """把 [-1, 1] 的浮点数据转换为存储类型（int16 时做截断），类型相同时不复制"""
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'i':
+        return np.asarray(block, dtype=dtype)
+    scale = float(np.iinfo(dtype).max) + 1
+    return np.clip(np.asarray(block) * scale, np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+
+
+def stack_clips(clips):
+    """把 (片段数, 采样点) 数组或长短不一的片段列表整理成补零的浮点矩阵和长度数组"""
+    if isinstance(clips, np.ndarray) and clips.ndim == 2:
+        return to_float(clips), np.full(len(clips), clips.shape[1])
+    clips = [as_mono(clip) for clip in clips]
+    lengths = np.array([len(clip) for clip in clips])
+    stacked = np.zeros((len(clips), max(lengths.max(initial=0), 1)), dtype=np.float32)
+    for row, clip in zip(stacked, clips):
+        row[:len(clip)] = to_float(clip)
+    return stacked, lengths
+
+
+def mean_abs(audio, block=1 << 16):
+    """分块计算平均绝对值（换算到 [-1, 1]），不生成与音频等长的临时数组"""
+    total = 0.0
+    for start in range(0, len(audio), block):
+        total += float(np.abs(to_float(audio[start:start + block])).sum(dtype=np.float64))
+    return total / max(len(audio), 1)
+
+
+@metrics.timed("features")
+def compute_features(audio, sample_rate, mfcc=False, analysis_rate=None):
+    """计算规则判断所需的全部特征（audio 为一维或 (N, 声道) 的 float/int16 数组），mfcc=True 时另外计算 MFCC 统计量
+
+    analysis_rate 低于 sample_rate 时逐块降采样并逐块提取特征，不生成整段的降采样副本。
+    """
+    if analysis_rate and sample_rate > analysis_rate:
+        from resample import resample_blocks
+        return compute_features_stream(resample_blocks(audio, sample_rate, analysis_rate), int(analysis_rate), mfcc)
+    audio = as_mono(audio)
+    features = extract_features(audio, sample_rate, mfcc=mfcc)
+    features["volume"] = mean_abs(audio)
+    # np.mean(np.diff(x)) 恰好等于 (x[-1] - x[0]) / (n - 1)，无需生成差分数组
+    if len(audio) > 1:
+        first, last = np.abs(to_float(audio[[0, -1]]))
+        features["volume_change"] = float((last - first) / (len(audio) - 1))
+    else:
+        features["volume_change"] = 0.0
+    features["duration"] = len(audio) / sample_rate
+    return features
+
+
+def compute_features_stream(blocks, sample_rate, mfcc=False):
+    """由依次产出的一维音频块计算与 compute_features 相同的特征"""
+    stream = StreamingFeatures(sample_rate, mfcc=mfcc)
+    total = 0.0
+    first = last = None
+    for block in blocks:
+        if not len(block):
+            continue
+        stream.process(block)
+        total += mean_abs(block) * len(block)
+        if first is None:
+            first = abs(float(to_float(block[:1])[0]))
+        last = abs(float(to_float(block[-1:])[0]))
+    length = stream.length
+    features = stream.features()
+    features["volume"] = total / max(length, 1)
+    features["volume_change"] = (last - first) / (length - 1) if length > 1 else 0.0
+    features["duration"] = length / sample_rate
+    return features
+
+
+@metrics.timed("features")
+def compute_features_batch(clips, sample_rate, lengths, mfcc=False):
+    """批量计算特征，每个特征都是 (片段数,) 数组，沿 axis 1 一次性完成"""
+    features = extract_features_batch(clips, sample_rate, lengths, mfcc=mfcc)
+    magnitude = np.abs(clips)
+    features["volume"] = magnitude.sum(axis=1) / np.maximum(lengths, 1)
+    rows = np.arange(len(clips))
+    last = np.maximum(lengths - 1, 0)
+    features["volume_change"] = np.where(
+        lengths > 1, (magnitude[rows, last] - magnitude[:, 0]) / np.maximum(last, 1), 0.0)
+    features["duration"] = lengths / sample_rate
+    return features
+
+
+def match_rules(features, thresholds):
+    """按优先级匹配规则，返回 RULE_EMOTIONS 的下标
+
+    特征和阈值既可以是标量也可以是数组，按 NumPy 广播规则逐元素判断。
+    """
+    frequency_mean = features["spectral_centroid"]
+    frequency_std = features["spectral_bandwidth"]
+    volume = features["volume"]
+    volume_change_mean = features["volume_change"]
+    high_freq = thresholds['high_freq_threshold']
+    high_volume = thresholds['high_volume_threshold']
+    volume_change = thresholds['volume_change_threshold']
+
+    conditions = [
+        (frequency_mean > high_freq) & (volume_change_mean > volume_change),
+        (frequency_std > thresholds['freq_std_threshold']) & (volume > high_volume),
+        (frequency_mean < high_freq/2) & (volume < high_volume/2),
+        volume_change_mean > volume_change*2
+    ]
+    return np.select(conditions, range(len(conditions)), default=len(conditions))
+
+
+def evaluate_rules(features, thresholds):
+    """根据特征和阈值判断情绪"""
+    return dict(RULE_EMOTIONS[int(match_rules(features, thresholds))])
+
+
+@metrics.timed("suggestions")
+def get_suggestions(emotions):
+    """根据主要情绪生成建议"""
+    primary_emotion = max(emotions.items(), key=lambda x: x[1])[0]
+    if primary_emotion in EMOTION_SUGGESTIONS:
+        return list(EMOTION_SUGGESTIONS[primary_emotion])
+    return ["继续观察狗狗的状态"]
+
+
+def build_result(emotions, features=None, confidence=DEFAULT_CONFIDENCE):
+    """把情绪得分组装成分析结果字典"""
+    return {
+        "timestamp": datetime.now(),
+        "emotions": emotions,
+        "primary_emotion": max(emotions.items(), key=lambda x: x[1]),
+        "confidence": confidence,
+        "suggestions": get_suggestions(emotions),
+        "features": features or {}
+    }
+
+
+def scalar_features(features):
+    """结果中只保留可序列化的标量特征（去掉逐帧包络和 MFCC 向量）"""
+    return {name: value for name, value in features.items() if name not in ("rms_envelope", "mfcc")}
+
+
+def analyze_features(features, thresholds=None, classifier=None):
+    """只根据已提取的特征判断情绪，不涉及 FFT
+
+    classifier 为空时使用阈值规则，否则使用 classifier.predict（见 classifier.py）。
+    """
+    metrics.count("clips_analyzed")
+    if classifier is None:
+        with metrics.timer("rules"):
+            emotions = evaluate_rules(features, thresholds or DEFAULT_THRESHOLDS)
+        return build_result(emotions, scalar_features(features))
+    batch = {name: np.asarray(value)[None] for name, value in features.items() if name != "rms_envelope"}
+    with metrics.timer("rules"):
+        (emotions, confidence), = classifier.predict(batch, thresholds)
+    return build_result(emotions, scalar_features(features), confidence)
+
+
+def analyze(audio, sample_rate, thresholds=None, cache=None, classifier=None, analysis_rate=None):
+    """无状态的分析接口：不依赖任何实例状态，可在线程池或进程池中并发调用
+
+    audio 可以是一维或 (N, 声道) 的 float/int16 数组；
+    返回结果中的 features 只包含可序列化的标量特征。
+    cache 为 FeatureCache 时，内容相同的音频直接复用缓存的特征。
+    analysis_rate 给出时把高于它的音频逐块降采样后提取特征（见 resample.py），特征都以 Hz 为单位，与采样率无关。
+    """
+    if audio is None or len(audio) == 0:
+        return build_result(dict(DEFAULT_EMOTIONS))
+
+    mfcc = getattr(classifier, "needs_mfcc", False)
+    if cache is not None:
+        features = cache.features(audio, sample_rate, mfcc, analysis_rate)
+    else:
+        features = compute_features(audio, sample_rate, mfcc, analysis_rate)
+    return analyze_features(features, thresholds, classifier)
+
+
+def rescore(features_list, thresholds=None):
+    """用新的阈值重新判断一组已提取的特征，所有规则一次向量化完成"""
+    if not features_list:
+        return []
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    columns = {name: np.array([features[name] for features in features_list])
+               for name in ("spectral_centroid", "spectral_bandwidth", "volume", "volume_change")}
+    with metrics.timer("rules"):
+        rule_ids = match_rules(columns, thresholds)
+    return [build_result(dict(RULE_EMOTIONS[rule_id]), features)
+            for rule_id, features in zip(rule_ids, features_list)]
+
+
+def analyze_batch(clips, sample_rate, thresholds=None, classifier=None, analysis_rate=None):
+    """向量化批量分析：clips 为 (片段数, 采样点) 数组或长短不一的片段列表
+
+    所有特征沿 axis 1 一次算完，规则以布尔掩码同时作用于全部片段
+    （或由 classifier 一次批量推理），返回与 analyze 格式相同的结果列表。
+    """
+    if len(clips) == 0:
+        return []
+    if analysis_rate and sample_rate > analysis_rate:
+        from resample import resample
+        if isinstance(clips, np.ndarray) and clips.ndim == 2:
+            clips = resample(clips, sample_rate, analysis_rate, axis=1)
+        else:
+            clips = [resample(as_mono(clip), sample_rate, analysis_rate) for clip in clips]
+        sample_rate = analysis_rate
+    clips, lengths = stack_clips(clips)
+    features = compute_features_batch(clips, sample_rate, lengths, getattr(classifier, "needs_mfcc", False))
+    with metrics.timer("rules"):
+        if classifier is None:
+            rule_ids = match_rules(features, thresholds or DEFAULT_THRESHOLDS)
+            predictions = [(dict(RULE_EMOTIONS[rule_id]), DEFAULT_CONFIDENCE) for rule_id in rule_ids]
+        else:
+            predictions = classifier.predict(features, thresholds)
+    metrics.count("clips_analyzed", len(predictions))
+    features.pop("mfcc", None)
+
+    results = []
+    for i, (emotions, confidence) in enumerate(predictions):
+        if lengths[i] == 0:
+            results.append(build_result(dict(DEFAULT_EMOTIONS)))
+            continue
+        clip_features = {name: float(values[i]) for name, values in features.items()}
+        results.append(build_result(emotions, clip_features, confidence))
+    return results
+
+
+def analyze_channels(audio, sample_rate, thresholds=None, channel_ids=None, classifier=None, analysis_rate=None):
+    """多声道分析：(采样点, 声道) 数组的每个声道单独分析，一次向量化完成
+
+    声道转置成 (声道, 采样点) 矩阵后交给 analyze_batch，
+    每个结果的 channel 字段为对应的声道编号（或 channel_ids 中的来源标识）。
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 1:
+        audio = audio[:, None]
+    clips = np.ascontiguousarray(to_float(audio.T))
+    if channel_ids is None:
+        channel_ids = range(clips.shape[0])
+    elif len(channel_ids) != clips.shape[0]:
+        raise ValueError("channel_ids 的数量与声道数不一致")
+    if clips.shape[1] == 0:
+        results = [build_result(dict(DEFAULT_EMOTIONS)) for _ in range(clips.shape[0])]
+    else:
+        results = analyze_batch(clips, sample_rate, thresholds, classifier, analysis_rate)
+    for result, channel in zip(results, channel_ids):
+        result["channel"] = channel
+    return results
@@ -0,0 +1,40 @@
+import wave
+import numpy as np
+from analysis import from_float, to_float
+
+WRITE_BLOCK = 1 << 16  # 写 WAV 时每次转换的采样点数
+
+
+def read_wav(path):
+    """读取 WAV 文件，尽量使用内存映射避免整体载入"""
+    import scipy.io.wavfile as wav
+    try:
+        return wav.read(path, mmap=True)
+    except ValueError:
+        # 部分格式（如 24 位 PCM）不支持内存映射
+        return wav.read(path)
+
+
+def write_wav(filename, data, sample_rate, dtype="int16"):
+    """把音频写入 WAV 文件
+
+    dtype 为 int16 时按块转换并写入 16 位 PCM（文件大小是 float32 的一半，
+    也不会生成整份 int16 副本）；为 float32 时写 32 位浮点 WAV。
+    """
+    data = np.asarray(data)
+    if np.dtype(dtype) == np.float32:
+        import scipy.io.wavfile as wav
+        wav.write(filename, sample_rate, np.asarray(to_float(data), dtype=np.float32))
+        return
+    if np.dtype(dtype) != np.int16:
+        raise ValueError(f"不支持的 WAV 存储类型: {dtype}")
+
+    with wave.open(filename, "wb") as f:
+        f.setnchannels(1 if data.ndim == 1 else data.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(int(sample_rate))
+        for start in range(0, len(data), WRITE_BLOCK):
+            block = data[start:start + WRITE_BLOCK]
+            if block.dtype != np.int16:
+                block = from_float(to_float(block), np.int16)
+            f.writeframes(np.ascontiguousarray(block, dtype="<i2").tobytes())
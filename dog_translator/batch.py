@@ -0,0 +1,160 @@
+"""批量离线分析：用进程池并行分析目录或通配符匹配到的 WAV 文件
+
+用法示例:
+    python batch.py recordings/ --workers 4 --output results.jsonl
+    python batch.py "archive/**/*.wav" --db dog_records.db
+    python batch.py recordings/ --cache feature_cache.db   # 再次运行时只重新判断规则
+"""
+import argparse
+import functools
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from audio_io import read_wav
+
+
+def find_wav_files(inputs):
+    """把目录、通配符和文件路径展开成排好序的 WAV 文件列表"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*.wav')
+            files.extend(glob.glob(pattern, recursive=True))
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            files.extend(glob.glob(item, recursive=True))
+    return sorted(set(files))
+
+
+@functools.lru_cache(maxsize=None)
+def open_cache(path):
+    """每个工作进程只打开一次特征缓存"""
+    from feature_cache import FeatureCache
+    return FeatureCache(path)
+
+
+@functools.lru_cache(maxsize=None)
+def open_classifier(path):
+    """每个工作进程只加载一次分类模型"""
+    from classifier import load_classifier
+    return load_classifier(path)
+
+
+def analyze_file(path, thresholds=None, cache_path=None, model_path=None, analysis_rate=None):
+    """在工作进程中分析单个文件，返回可序列化为 JSON 的结果（文件按自身的采样率读取）"""
+    from analysis import analyze
+    try:
+        sample_rate, data = read_wav(path)
+        cache = open_cache(cache_path) if cache_path else None
+        classifier = open_classifier(model_path) if model_path else None
+        result = analyze(data, sample_rate, thresholds, cache, classifier, analysis_rate)
+    except Exception as e:
+        return {"file": path, "error": str(e)}
+
+    return {
+        "file": path,
+        "timestamp": result["timestamp"].isoformat(),
+        "sample_rate": int(sample_rate),
+        "emotions": result["emotions"],
+        "primary_emotion": list(result["primary_emotion"]),
+        "confidence": result["confidence"],
+        "suggestions": result["suggestions"],
+        "features": result["features"]
+    }
+
+
+def run_batch(files, workers=None, chunksize=16, output=None, db_path=None, thresholds=None,
+              cache_path=None, model_path=None, analysis_rate=None):
+    """并行分析文件列表，结果写入 JSONL 文件或数据库，返回统计信息
+
+    cache_path 指定特征缓存文件时，已分析过的文件只重新执行规则判断；
+    model_path 指定 .npz 模型时用训练好的分类器代替阈值规则；
+    analysis_rate 给出时，采样率更高的文件先降到该采样率再分析。
+    """
+    db = None
+    if db_path:
+        from database import DogTranslatorDB
+        db = DogTranslatorDB(db_path)
+        db.start_writer()
+
+    out = open(output, 'w', encoding='utf-8') if output else None
+    processed = 0
+    errors = 0
+    start = time.perf_counter()
+    worker = functools.partial(analyze_file, thresholds=thresholds, cache_path=cache_path,
+                               model_path=model_path, analysis_rate=analysis_rate)
+    # workers=1 时直接在当前进程分析，cProfile 和 metrics 才能看到分析函数
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        records = pool.map(worker, files, chunksize=chunksize) if pool else map(worker, files)
+        for record in records:
+            processed += 1
+            if "error" in record:
+                errors += 1
+                print(f"分析失败: {record['file']} ({record['error']})")
+                continue
+            if out:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if db:
+                db.enqueue(record, audio_path=record["file"])
+    finally:
+        if pool:
+            pool.shutdown()
+        if out:
+            out.close()
+        if db:
+            db.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": processed,
+        "errors": errors,
+        "seconds": elapsed,
+        "files_per_sec": processed / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析 WAV 文件中的狗叫声")
+    parser.add_argument('inputs', nargs='+', help="WAV 文件、目录或通配符")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数（默认等于 CPU 核数）")
+    parser.add_argument('--chunksize', type=int, default=16, help="每次分派给工作进程的文件数")
+    parser.add_argument('--output', default=None, help="JSONL 结果文件")
+    parser.add_argument('--db', default=None, help="写入的 sqlite 数据库路径")
+    parser.add_argument('--cache', default=None, help="特征缓存文件路径（sqlite）")
+    parser.add_argument('--model', default=None, help="训练好的分类模型（.npz）")
+    parser.add_argument('--analysis-rate', type=int, default=0,
+                        help="内部分析采样率 (Hz)，例如 16000；默认 0 表示按文件原采样率分析")
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help="用 cProfile 运行并把统计写入 PATH（--workers 1 时包含分析函数）")
+    args = parser.parse_args(argv)
+
+    files = find_wav_files(args.inputs)
+    if not files:
+        print("没有找到 WAV 文件")
+        return 1
+    output = args.output
+    if not output and not args.db:
+        output = 'batch_results.jsonl'
+
+    print(f"找到 {len(files)} 个文件，开始分析...")
+
+    def run():
+        return run_batch(files, args.workers, args.chunksize, output, args.db, cache_path=args.cache,
+                         model_path=args.model, analysis_rate=args.analysis_rate or None)
+
+    if args.profile:
+        from metrics import profile_call
+        stats = profile_call(run, args.profile)
+    else:
+        stats = run()
+    print(f"完成: {stats['files']} 个文件（失败 {stats['errors']} 个），"
+          f"用时 {stats['seconds']:.2f} 秒，吞吐量 {stats['files_per_sec']:.1f} 文件/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
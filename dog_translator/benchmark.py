@@ -0,0 +1,556 @@
+"""可重复的性能基准：全部使用合成音频，无需声卡和图形界面
+
+用法示例:
+    python benchmark.py --output bench.json              # 运行全部基准并保存结果
+    python benchmark.py --quick --only analyze_bark,db   # 缩小规模，只运行部分基准
+    python benchmark.py --compare bench.json             # 与之前的结果比较，变慢超过容差时返回 1
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+from analysis import analyze, analyze_batch
+from database import DogTranslatorDB
+from features import extract_features
+from onset import analyze_events
+
+
+def synth_bark(duration=0.25, sample_rate=44100, f0=550, rng=None):
+    """合成一声狗叫：下滑的谐波啁啾加一点噪声，快起慢落的包络"""
+    rng = rng or np.random.default_rng(0)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = f0 * (1 - 0.3 * t / duration)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    tone = sum(np.sin(k * phase) / k for k in range(1, 5))
+    envelope = np.minimum(1, t / 0.01) * np.exp(-3 * t / duration)
+    noise = rng.standard_normal(len(t)) * 0.1
+    return (0.3 * envelope * (tone + noise)).astype(np.float32)
+
+
+def kennel_audio(duration=60, sample_rate=44100, bark_fraction=0.08, seed=0):
+    """合成犬舍录音：大部分是 -60 dBFS 的底噪，随机位置插入狗叫
+
+    返回 (音频, [(起点, 终点), ...])，位置单位为采样点。
+    """
+    rng = np.random.default_rng(seed)
+    audio = (rng.standard_normal(int(duration * sample_rate)) * 0.001).astype(np.float32)
+    bark_count = int(duration * bark_fraction / 0.25)
+    slots = np.sort(rng.choice(int(duration / 0.5) - 1, bark_count, replace=False))
+    positions = []
+    for slot in slots:
+        bark = synth_bark(0.25, sample_rate, rng.uniform(400, 900), rng)
+        start = int(slot * 0.5 * sample_rate)
+        audio[start:start + len(bark)] += bark
+        positions.append((start, start + len(bark)))
+    return audio, positions
+
+
+SIGNAL_KINDS = ("chirp", "noise_burst", "silence", "barks")
+
+
+def synth_signal(kind, duration=1.0, sample_rate=44100, seed=0):
+    """生成 (采样点, 1) 的 float32 测试信号
+
+    chirp: 300 Hz 到 3 kHz 的线性扫频；noise_burst: 每 0.2 秒一个 50 毫秒的白噪声脉冲；
+    silence: -80 dBFS 的底噪；barks: 底噪中随机插入的合成狗叫（见 kennel_audio）
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+    if kind == "chirp":
+        audio = 0.3 * np.sin(2 * np.pi * (300 * t + (3000 - 300) / (2 * duration) * t * t))
+    elif kind == "noise_burst":
+        gate = (t % 0.2) < 0.05
+        audio = rng.standard_normal(n) * 0.2 * gate
+    elif kind == "silence":
+        audio = rng.standard_normal(n) * 1e-4
+    elif kind == "barks":
+        audio, _ = kennel_audio(duration, sample_rate, bark_fraction=0.3, seed=seed)
+    else:
+        raise ValueError(f"未知的信号类型: {kind}")
+    return np.asarray(audio, dtype=np.float32).reshape(n, 1)
+
+
+def time_call(func, repeat=20):
+    """返回 func 的平均单次耗时（秒），先预热一次"""
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_fft(duration=5, sample_rate=44100):
+    """对比旧的全长复数 FFT 与新的加窗 rfft 特征流水线"""
+    rng = np.random.default_rng(0)
+    recording = (rng.standard_normal((int(duration * sample_rate), 1)) * 0.1).astype(np.float32)
+
+    def old_pipeline():
+        # 旧实现: 对整段信号做复数 FFT，再取模求均值和标准差
+        magnitude = np.abs(np.fft.fft(recording.flatten()))
+        return np.mean(magnitude), np.std(magnitude)
+
+    old = time_call(old_pipeline)
+    new = time_call(lambda: extract_features(recording, sample_rate))
+    return {
+        "samples": len(recording),
+        "old_ms": old * 1000,
+        "new_ms": new * 1000,
+        "speedup": old / new
+    }
+
+
+def bench_analyze_bark(durations=(0.5, 2, 5), sample_rates=(16000, 44100), kinds=SIGNAL_KINDS, repeat=5):
+    """DogTranslator.analyze_bark 在不同信号、时长和采样率下的单次耗时"""
+    from dog_translator import DogTranslator
+    translator = DogTranslator()
+    cases = {}
+    for sample_rate in sample_rates:
+        translator.sample_rate = sample_rate
+        for duration in durations:
+            for kind in kinds:
+                audio = synth_signal(kind, duration, sample_rate)
+                elapsed = time_call(lambda: translator.analyze_bark(audio), repeat)
+                cases[f"{kind}_{duration:g}s_{sample_rate}Hz"] = {
+                    "ms": elapsed * 1000,
+                    "realtime_factor": duration / elapsed
+                }
+    return cases
+
+
+def bench_resample(duration=5, sample_rate=44100, analysis_rate=16000, stream_seconds=10):
+    """按原采样率分析对比先降到 analysis_rate 再分析（整段分析与 50 ms 步长的流式分析）"""
+    from analysis import compute_features
+    from resample import resample
+    from streaming import ArraySource, StreamingAnalyzer
+    audio = synth_signal("barks", duration, sample_rate)[:, 0]
+    reduced = resample(audio, sample_rate, analysis_rate)
+
+    features_native = time_call(lambda: compute_features(audio, sample_rate), 10)
+    features_reduced = time_call(lambda: compute_features(reduced, analysis_rate), 10)
+    resampling = time_call(lambda: resample(audio, sample_rate, analysis_rate), 10)
+    native = time_call(lambda: analyze(audio, sample_rate), 10)
+    reduced_total = time_call(lambda: analyze(audio, sample_rate, analysis_rate=analysis_rate), 10)
+
+    stream_audio = synth_signal("barks", stream_seconds, sample_rate)[:, 0]
+
+    def stream(rate):
+        translator = SimpleNamespace(stream_analysis_rate=rate, analyze_frame=lambda frame, sr: analyze(
+            frame, sr, analysis_rate=rate))
+        return sum(1 for _ in StreamingAnalyzer(translator, ArraySource(stream_audio, sample_rate)))
+
+    stream_native = time_call(lambda: stream(None), 1)
+    stream_reduced = time_call(lambda: stream(analysis_rate), 1)
+    return {
+        "seconds_of_audio": duration,
+        "features_native_ms": features_native * 1000,
+        "features_reduced_ms": features_reduced * 1000,
+        "features_speedup": features_native / features_reduced,
+        "resample_ms": resampling * 1000,
+        "analyze_native_ms": native * 1000,
+        "analyze_reduced_ms": reduced_total * 1000,
+        "analyze_speedup": native / reduced_total,
+        "stream_native_ms": stream_native * 1000,
+        "stream_reduced_ms": stream_reduced * 1000,
+        "stream_speedup": stream_native / stream_reduced
+    }
+
+
+def bench_batch(n_clips=1000, duration=0.25, sample_rate=16000):
+    """对比逐个 analyze 与向量化 analyze_batch 的总耗时"""
+    rng = np.random.default_rng(0)
+    clips = (rng.standard_normal((n_clips, int(duration * sample_rate))) * 0.1).astype(np.float32)
+
+    loop = time_call(lambda: [analyze(clip, sample_rate) for clip in clips], repeat=3)
+    batch = time_call(lambda: analyze_batch(clips, sample_rate), repeat=3)
+    return {
+        "clips": n_clips,
+        "loop_ms": loop * 1000,
+        "batch_ms": batch * 1000,
+        "speedup": loop / batch
+    }
+
+
+def bench_classifier(n_clips=1000, duration=0.25, sample_rate=22050):
+    """softmax 分类器的批量推理耗时（不含特征提取）"""
+    from analysis import compute_features_batch
+    from classifier import SoftmaxClassifier, model_inputs
+    rng = np.random.default_rng(0)
+    clips = (rng.standard_normal((n_clips, int(duration * sample_rate))) * 0.1).astype(np.float32)
+    features = compute_features_batch(clips, sample_rate, np.full(n_clips, clips.shape[1]), mfcc=True)
+    labels = [("calm", "anxious", "playful")[i % 3] for i in range(n_clips)]
+    model = SoftmaxClassifier.fit(model_inputs(features), labels, epochs=20)
+
+    predict = time_call(lambda: model.predict(features), 10)
+    return {
+        "clips": n_clips,
+        "predict_ms": predict * 1000,
+        "per_clip_us": predict / n_clips * 1e6,
+        "clips_per_sec": n_clips / predict
+    }
+
+
+def bench_capture_worker(duration=1.0, sample_rate=44100, interval=0.01):
+    """后台录音和分析期间，模拟的界面事件循环（每 interval 秒 drain 一次）的最长卡顿"""
+    from dog_translator import DogTranslator
+    from streaming import ArraySource
+    from worker import CaptureWorker
+    translator = DogTranslator()
+    translator.max_duration = duration
+    audio = synth_signal("barks", duration, sample_rate)[:, 0]
+    worker = CaptureWorker(translator)
+    start = last = time.perf_counter()
+    worker.start(ArraySource(audio, sample_rate, blocksize=441, realtime=True))
+    worst = 0.0
+    while not worker.drain():
+        now = time.perf_counter()
+        worst = max(worst, now - last - interval)
+        last = now
+        time.sleep(interval)
+    return {
+        "seconds_of_audio": duration,
+        "result_latency_ms": (time.perf_counter() - start - duration) * 1000,
+        "worst_stall_ms": max(worst, 0.0) * 1000
+    }
+
+
+def make_results(count):
+    """生成 count 条时间递增的模拟分析结果"""
+    base = datetime(2025, 1, 1)
+    emotions = [{"calm": 0.8, "sleepy": 0.6}, {"excited": 0.9, "happy": 0.7}, {"neutral": 0.5}]
+    results = []
+    for i in range(count):
+        scores = emotions[i % len(emotions)]
+        results.append({
+            "timestamp": base + timedelta(seconds=i),
+            "emotions": scores,
+            "primary_emotion": max(scores.items(), key=lambda x: x[1]),
+            "confidence": 0.85,
+            "features": {"spectral_centroid": 800.0 + i % 500, "volume": 0.01}
+        })
+    return results
+
+
+def bench_db(count=20000, single_count=500):
+    """数据库写入吞吐量：逐条 save_record 对比后台批量写入线程"""
+    results = make_results(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DogTranslatorDB(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        for result in results[:single_count]:
+            db.save_record(result)
+        single = single_count / (time.perf_counter() - start)
+
+        db.start_writer()
+        start = time.perf_counter()
+        for result in results:
+            db.enqueue(result)
+        db.flush()
+        batched = count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        histogram = db.emotion_histogram()
+        hourly = db.hourly_stats()
+        query_ms = (time.perf_counter() - start) * 1000
+
+        # 历史浏览窗口：第一页与翻到最后一页时的单页耗时应相同（键集分页）
+        start = time.perf_counter()
+        db.fetch_page(200)
+        first_page_ms = (time.perf_counter() - start) * 1000
+        oldest = db.conn.execute('SELECT timestamp, id FROM recordings ORDER BY timestamp, id LIMIT 1 OFFSET 200')
+        before = oldest.fetchone()
+        start = time.perf_counter()
+        db.fetch_page(200, before)
+        last_page_ms = (time.perf_counter() - start) * 1000
+        db.close()
+
+    return {
+        "records": sum(histogram.values()),
+        "hours": len(hourly),
+        "save_record_per_sec": single,
+        "writer_per_sec": batched,
+        "aggregate_query_ms": query_ms,
+        "first_page_ms": first_page_ms,
+        "last_page_ms": last_page_ms
+    }
+
+
+def bench_similarity(n_vectors=1000000, k=10, queries=50, append_batch=10000):
+    """相似狗叫查询：n_vectors 条内存映射的特征向量上的 kNN 延迟，以及增量追加的吞吐量"""
+    from similarity import EMBEDDING_DIM, VectorIndex
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(os.path.join(tmp, 'bench.vectors'))
+        start = time.perf_counter()
+        for first in range(0, n_vectors, append_batch):
+            count = min(append_batch, n_vectors - first)
+            vectors = rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            index.add(np.arange(first + 1, first + count + 1), vectors)
+        append = time.perf_counter() - start
+
+        targets = rng.standard_normal((queries, EMBEDDING_DIM)).astype(np.float32)
+        start = time.perf_counter()
+        index.query(targets[0], k)
+        first_ms = (time.perf_counter() - start) * 1000
+        latencies = []
+        for target in targets:
+            start = time.perf_counter()
+            index.query(target, k)
+            latencies.append(time.perf_counter() - start)
+        del index
+    latencies = np.array(latencies) * 1000
+    return {
+        "vectors": n_vectors,
+        "k": k,
+        "append_per_sec": n_vectors / append,
+        "first_query_ms": first_ms,
+        "query_p50_ms": float(np.median(latencies)),
+        "query_p99_ms": float(np.percentile(latencies, 99))
+    }
+
+
+def bench_export_report(count=100000, formats=("txt", "csv", "jsonl", "html")):
+    """大量历史记录时 export_report 各格式的导出速度"""
+    from dog_translator import DogTranslator
+    from history import AnalysisHistory
+    translator = DogTranslator()
+    translator.analysis_history = AnalysisHistory(max_records=None)
+    for result in make_results(count):
+        translator.analysis_history.append(result)
+
+    report = {"records": count}
+    with tempfile.TemporaryDirectory() as tmp:
+        for format in formats:
+            path = os.path.join(tmp, f"report.{format}")
+            start = time.perf_counter()
+            translator.export_report(format, path)
+            elapsed = time.perf_counter() - start
+            report[format] = {
+                "ms": elapsed * 1000,
+                "records_per_sec": count / elapsed,
+                "bytes": os.path.getsize(path)
+            }
+    return report
+
+
+def bench_visualizer(frames=150, fps=30, sample_rate=44100, max_duration=5):
+    """Agg 后端下模拟录音过程中的实时刷新，统计帧率和 CPU 占用"""
+    from visualizer import AudioVisualizer
+
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal((int(max_duration * sample_rate), 1)) * 0.1).astype(np.float32)
+    translator = SimpleNamespace(sample_rate=sample_rate, max_duration=max_duration, recording=None)
+    visualizer = AudioVisualizer(translator)
+    visualizer.render()
+
+    step = sample_rate // fps
+    interval = 1.0 / fps
+    update_time = 0.0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for frame in range(frames):
+        tick = time.perf_counter()
+        # 每帧新增 1/fps 秒的音频；录满后数据不再变化
+        translator.recording = audio[:min(len(audio), (frame + 1) * step)]
+        visualizer.update_plot(frame)
+        visualizer.render()
+        elapsed = time.perf_counter() - tick
+        update_time += elapsed
+        time.sleep(max(0.0, interval - elapsed))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return {
+        "frames": frames,
+        "ms_per_frame": update_time / frames * 1000,
+        "max_fps": frames / update_time,
+        "cpu_percent": cpu / wall * 100,
+        "frames_skipped": visualizer.frames_skipped
+    }
+
+
+def bench_onset(duration=60, sample_rate=44100):
+    """对比整段按 5 秒窗口分析与只分析检测到的狗叫片段（约 92% 是静音）"""
+    audio, positions = kennel_audio(duration, sample_rate)
+    window = 5 * sample_rate
+
+    def whole():
+        return [analyze(audio[i:i + window], sample_rate) for i in range(0, len(audio), window)]
+
+    full = time_call(whole, repeat=3)
+    gated = time_call(lambda: analyze_events(audio, sample_rate), repeat=3)
+    return {
+        "seconds_of_audio": duration,
+        "barks": len(positions),
+        "detected": len(analyze_events(audio, sample_rate)),
+        "windowed_ms": full * 1000,
+        "gated_ms": gated * 1000,
+        "speedup": full / gated
+    }
+
+
+# 导入分析核心时不应加载的重量级依赖（只在录音、绘图或界面中使用）
+HEAVY_MODULES = ("sounddevice", "matplotlib", "tkinter", "scipy", "soundfile")
+IMPORT_MODULES = ("analysis", "dog_translator", "batch", "streaming", "server", "visualizer")
+
+
+def import_profile(module):
+    """在新的解释器中用 -X importtime 导入 module
+
+    返回 {"ms": 导入总耗时, "without_numpy_ms": 扣除 numpy 后的耗时, "heavy": 被加载的重量级依赖}
+    """
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    cumulative = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, total, name = line[len("import time:"):].split("|")
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total) / 1000
+    loaded = json.loads(process.stdout)
+    return {
+        "ms": cumulative.get(module, 0.0),
+        "without_numpy_ms": cumulative.get(module, 0.0) - cumulative.get("numpy", 0.0),
+        "heavy": sorted({name.split(".")[0] for name in loaded} & set(HEAVY_MODULES))
+    }
+
+
+def bench_import(modules=IMPORT_MODULES, repeat=3):
+    """各模块的冷启动导入耗时（取多次运行的最小值），以及是否误加载了重量级依赖"""
+    report = {}
+    for module in modules:
+        runs = [import_profile(module) for _ in range(repeat)]
+        report[module] = {
+            "ms": min(run["ms"] for run in runs),
+            "without_numpy_ms": min(run["without_numpy_ms"] for run in runs),
+            "heavy": runs[0]["heavy"]
+        }
+    return report
+
+
+# 名称 -> (函数, --quick 时使用的参数)
+BENCHMARKS = {
+    "fft": (bench_fft, {"duration": 1}),
+    "analyze_bark": (bench_analyze_bark, {"durations": (0.5, 2), "sample_rates": (16000,), "repeat": 2}),
+    "resample": (bench_resample, {"duration": 2, "stream_seconds": 2}),
+    "batch": (bench_batch, {"n_clips": 200}),
+    "classifier": (bench_classifier, {"n_clips": 200}),
+    "capture_worker": (bench_capture_worker, {"duration": 0.5}),
+    "db": (bench_db, {"count": 2000, "single_count": 100}),
+    "similarity": (bench_similarity, {"n_vectors": 100000, "queries": 10}),
+    "export_report": (bench_export_report, {"count": 5000}),
+    "visualizer": (bench_visualizer, {"frames": 15}),
+    "onset": (bench_onset, {"duration": 10}),
+    "import": (bench_import, {"repeat": 1})
+}
+
+# 这些后缀的指标越大越好，耗时（ms 或以 _ms 结尾）越小越好，其余指标不参与比较
+HIGHER_IS_BETTER = ("_per_sec", "speedup", "max_fps", "realtime_factor")
+
+
+def environment():
+    """记录运行环境，便于判断两次结果是否可比"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def run_suite(names=None, quick=False):
+    """运行选定的基准，返回 {"environment": ..., "quick": ..., "results": {名称: 结果}}"""
+    names = names or list(BENCHMARKS)
+    results = {}
+    for name in names:
+        func, quick_options = BENCHMARKS[name]
+        results[name] = func(**quick_options) if quick else func()
+    return {"environment": environment(), "quick": quick, "results": results}
+
+
+def flatten(results, prefix=""):
+    """把嵌套的结果展开成 {"a.b.c": 数值}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, tolerance=0.1):
+    """逐项比较两次 run_suite 的结果
+
+    返回 [(指标, 旧值, 新值, 变化比例, 是否退化), ...]；变化比例为正表示变好。
+    """
+    old = flatten(baseline["results"])
+    new = flatten(current["results"])
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        leaf = name.rsplit(".", 1)[-1]
+        if leaf == "ms" or leaf.endswith("_ms"):
+            better = old[name] / new[name] - 1 if new[name] else 0.0
+        elif name.endswith(HIGHER_IS_BETTER):
+            better = new[name] / old[name] - 1 if old[name] else 0.0
+        else:
+            continue
+        rows.append((name, old[name], new[name], better, better < -tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在合成音频上运行性能基准")
+    parser.add_argument('--output', default=None, help="把结果写入 JSON 文件（默认输出到标准输出）")
+    parser.add_argument('--compare', default=None, metavar='BASELINE', help="与之前保存的 JSON 结果比较")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="允许的变慢比例，超过时视为退化")
+    parser.add_argument('--quick', action='store_true', help="缩小规模，快速检查")
+    parser.add_argument('--only', default=None, help=f"逗号分隔的基准名称: {','.join(BENCHMARKS)}")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore", category=UserWarning)  # 缺少中文字体时 matplotlib 的警告
+
+    names = args.only.split(",") if args.only else None
+    unknown = set(names or []) - BENCHMARKS.keys()
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(sorted(unknown))}")
+    report = run_suite(names, args.quick)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        for name, old, new, better, regressed in rows:
+            mark = "退化" if regressed else ""
+            print(f"{name:55s} {old:12.4g} -> {new:12.4g} {better:+8.1%} {mark}")
+        regressions = sum(row[4] for row in rows)
+        print(f"比较了 {len(rows)} 项指标，退化 {regressions} 项（基准提交 {baseline['environment'].get('commit')}）")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
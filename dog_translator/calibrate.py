@@ -0,0 +1,185 @@
+"""阈值校准：在带标签的录音上搜索最佳的四个分析阈值
+
+标签数据可以是按情绪分目录的 WAV 文件（如 data/excited/*.wav），
+也可以是 "文件路径,情绪" 格式的 CSV。特征只提取一次，
+每组阈值作为数组与特征矩阵广播比较，一次判断成千上万组阈值。
+
+用法示例:
+    python calibrate.py data/ --grid 8
+    python calibrate.py labels.csv --random 20000 --save
+"""
+import argparse
+import csv
+import os
+import numpy as np
+from analysis import DEFAULT_THRESHOLDS, RULE_EMOTIONS, as_mono, compute_features, match_rules
+
+# 每条规则给出的主要情绪（与 analyze 结果中的 primary_emotion 一致）
+RULE_PRIMARY = [max(emotions.items(), key=lambda x: x[1])[0] for emotions in RULE_EMOTIONS]
+
+# 搜索范围：(最小值, 最大值)，音量类阈值按对数均匀取值
+SEARCH_RANGES = {
+    'high_freq_threshold': (200, 6000),
+    'high_volume_threshold': (0.001, 0.5),
+    'freq_std_threshold': (200, 6000),
+    'volume_change_threshold': (1e-7, 1e-3)
+}
+LOG_SCALE = ('high_volume_threshold', 'volume_change_threshold')
+FEATURE_NAMES = ("spectral_centroid", "spectral_bandwidth", "volume", "volume_change")
+SWEEP_BLOCK = 1 << 22  # 每次广播比较的 (片段数 x 阈值组数) 上限，用于限制内存
+
+
+def load_labeled(source):
+    """读取带标签的数据集，返回 [(文件路径, 情绪), ...]"""
+    if os.path.isdir(source):
+        items = []
+        for label in sorted(os.listdir(source)):
+            folder = os.path.join(source, label)
+            if os.path.isdir(folder):
+                items.extend((os.path.join(folder, name), label)
+                             for name in sorted(os.listdir(folder)) if name.lower().endswith('.wav'))
+        return items
+    base = os.path.dirname(source)
+    with open(source, newline='', encoding='utf-8') as f:
+        return [(os.path.join(base, row[0]), row[1].strip()) for row in csv.reader(f) if len(row) >= 2]
+
+
+def extract_dataset(items, cache=None, analysis_rate=None):
+    """每个文件只提取一次特征，返回 ({特征名: (片段数,) 数组}, 标签数组)
+
+    analysis_rate 应与分析时使用的一致，校准出的阈值才能直接使用。
+    """
+    from audio_io import read_wav
+    from resample import to_analysis_rate
+    rows = []
+    for path, _ in items:
+        sample_rate, data = read_wav(path)
+        data, sample_rate = to_analysis_rate(as_mono(data), sample_rate, analysis_rate)
+        if cache is not None:
+            features = cache.features(data, sample_rate)
+        else:
+            features = compute_features(as_mono(data), sample_rate)
+        rows.append([features[name] for name in FEATURE_NAMES])
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_NAMES))
+    features = {name: matrix[:, i] for i, name in enumerate(FEATURE_NAMES)}
+    return features, np.array([label for _, label in items])
+
+
+def grid_candidates(steps=8, ranges=SEARCH_RANGES):
+    """在搜索范围内按网格生成阈值组合：{阈值名: (组数,) 数组}"""
+    axes = []
+    for name, (low, high) in ranges.items():
+        if name in LOG_SCALE:
+            axes.append(np.geomspace(low, high, steps))
+        else:
+            axes.append(np.linspace(low, high, steps))
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return {name: grid.ravel() for name, grid in zip(ranges, mesh)}
+
+
+def random_candidates(count=10000, ranges=SEARCH_RANGES, seed=0):
+    """在搜索范围内随机生成阈值组合"""
+    rng = np.random.default_rng(seed)
+    candidates = {}
+    for name, (low, high) in ranges.items():
+        if name in LOG_SCALE:
+            candidates[name] = np.exp(rng.uniform(np.log(low), np.log(high), count))
+        else:
+            candidates[name] = rng.uniform(low, high, count)
+    return candidates
+
+
+def sweep(features, labels, candidates):
+    """评估所有阈值组合
+
+    特征取 (片段数, 1)、阈值取 (1, 组数) 的形状交给 match_rules 广播，
+    返回 (总体准确率 (组数,), {情绪: 该情绪样本的准确率 (组数,)})。
+    """
+    count = len(next(iter(candidates.values())))
+    primary = np.array(RULE_PRIMARY)
+    emotions = sorted(set(labels))
+    label_masks = {emotion: labels == emotion for emotion in emotions}
+    correct_total = np.zeros(count)
+    correct_by_emotion = {emotion: np.zeros(count) for emotion in emotions}
+
+    clip_features = {name: values[:, None] for name, values in features.items()}
+    step = max(1, SWEEP_BLOCK // max(len(labels), 1))
+    for start in range(0, count, step):
+        thresholds = {name: values[None, start:start + step] for name, values in candidates.items()}
+        correct = primary[match_rules(clip_features, thresholds)] == labels[:, None]
+        correct_total[start:start + step] = correct.sum(axis=0)
+        for emotion, mask in label_masks.items():
+            correct_by_emotion[emotion][start:start + step] = correct[mask].sum(axis=0)
+
+    accuracy = correct_total / max(len(labels), 1)
+    per_emotion = {emotion: correct_by_emotion[emotion] / mask.sum() for emotion, mask in label_masks.items()}
+    return accuracy, per_emotion
+
+
+def calibrate(features, labels, candidates):
+    """返回最佳阈值组合及其准确率报告"""
+    accuracy, per_emotion = sweep(features, labels, candidates)
+    best = int(np.argmax(accuracy))
+    return {
+        "thresholds": {name: float(values[best]) for name, values in candidates.items()},
+        "accuracy": float(accuracy[best]),
+        "per_emotion": {emotion: float(values[best]) for emotion, values in per_emotion.items()},
+        "candidates": len(accuracy)
+    }
+
+
+def save_thresholds(thresholds, settings=None):
+    """通过 Settings.save_settings 把阈值写回 settings.json"""
+    if settings is None:
+        from settings import Settings
+        settings = Settings()
+    settings.settings.update(thresholds)
+    settings.save_settings()
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在带标签的录音上校准分析阈值")
+    parser.add_argument('data', help="按情绪分目录的 WAV 文件夹，或 \"路径,情绪\" 格式的 CSV")
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument('--grid', type=int, default=None, help="网格搜索，每个阈值取的点数")
+    search.add_argument('--random', type=int, default=None, help="随机搜索的组合数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', default=None, help="特征缓存文件路径（sqlite）")
+    parser.add_argument('--save', action='store_true', help="把最佳阈值写入 settings.json")
+    parser.add_argument('--analysis-rate', type=int, default=0,
+                        help="内部分析采样率 (Hz)，需与 DogTranslator.analysis_rate 一致，默认 0 表示不降采样")
+    args = parser.parse_args(argv)
+
+    items = load_labeled(args.data)
+    if not items:
+        print("没有找到带标签的录音")
+        return 1
+    cache = None
+    if args.cache:
+        from feature_cache import FeatureCache
+        cache = FeatureCache(args.cache)
+    print(f"提取 {len(items)} 个文件的特征...")
+    features, labels = extract_dataset(items, cache, args.analysis_rate or None)
+
+    if args.grid:
+        candidates = grid_candidates(args.grid)
+    else:
+        candidates = random_candidates(args.random or 10000, seed=args.seed)
+    baseline = calibrate(features, labels, {name: np.array([value]) for name, value in DEFAULT_THRESHOLDS.items()})
+    report = calibrate(features, labels, candidates)
+
+    print(f"评估了 {report['candidates']} 组阈值")
+    print(f"默认阈值准确率: {baseline['accuracy']:.1%}，最佳准确率: {report['accuracy']:.1%}")
+    for name, value in report["thresholds"].items():
+        print(f"  {name}: {value:.6g}")
+    for emotion, value in report["per_emotion"].items():
+        print(f"  {emotion}: {value:.1%}")
+    if args.save:
+        save_thresholds(report["thresholds"])
+        print("已写入 settings.json")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
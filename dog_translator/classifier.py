@@ -0,0 +1,147 @@
+"""可替换的情绪分类器
+
+所有分类器都实现 predict(features, thresholds=None)：
+features 为 compute_features_batch 返回的 {特征名: (片段数,) 数组}（MFCC 为 (片段数, 26)），
+返回每个片段的 (情绪得分字典, 置信度) 列表。needs_mfcc 为 True 的分类器需要 MFCC 特征。
+
+用法示例（训练并保存模型，目录结构同 calibrate.py）:
+    python classifier.py data/ --output dog_model.npz
+"""
+import argparse
+import numpy as np
+from analysis import DEFAULT_CONFIDENCE, DEFAULT_THRESHOLDS, RULE_EMOTIONS, match_rules
+
+
+class RuleClassifier:
+    """默认分类器：按阈值规则判断，得分为固定常数"""
+    needs_mfcc = False
+
+    def __init__(self, thresholds=None):
+        self.thresholds = thresholds
+
+    def predict(self, features, thresholds=None):
+        thresholds = thresholds or self.thresholds or DEFAULT_THRESHOLDS
+        rule_ids = np.atleast_1d(match_rules(features, thresholds))
+        return [(dict(RULE_EMOTIONS[rule_id]), DEFAULT_CONFIDENCE) for rule_id in rule_ids]
+
+
+def model_inputs(features):
+    """把特征整理成模型输入矩阵 (片段数, 2 * N_MFCC + 5)：MFCC 统计量加取对数的频谱特征"""
+    spectral = [np.log1p(np.maximum(np.asarray(features[name], dtype=np.float64), 0))
+                for name in ("spectral_centroid", "spectral_bandwidth", "spectral_rolloff", "dominant_pitch")]
+    volume = np.log(np.asarray(features["volume"], dtype=np.float64) + 1e-6)
+    mfcc = np.asarray(features["mfcc"], dtype=np.float64).reshape(len(volume), -1)
+    return np.column_stack([mfcc] + spectral + [volume])
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class SoftmaxClassifier:
+    """纯 NumPy 的多类逻辑回归（softmax 回归），输入为 MFCC 和频谱特征
+
+    置信度为预测类别的概率；情绪得分为概率最高的 top_k 个类别。
+    """
+    needs_mfcc = True
+
+    def __init__(self, labels, weights, bias, mean, scale, top_k=3):
+        self.labels = list(labels)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.top_k = top_k
+
+    def predict_proba(self, features):
+        inputs = (model_inputs(features) - self.mean) / self.scale
+        return softmax(inputs @ self.weights + self.bias)
+
+    def predict(self, features, thresholds=None):
+        """批量推理，thresholds 对模型无意义，只为与 RuleClassifier 接口一致"""
+        probabilities = self.predict_proba(features)
+        top = np.argsort(-probabilities, axis=1)[:, :self.top_k]
+        predictions = []
+        for row, indices in zip(probabilities.tolist(), top.tolist()):
+            emotions = {self.labels[i]: row[i] for i in indices}
+            predictions.append((emotions, row[indices[0]]))
+        return predictions
+
+    @classmethod
+    def fit(cls, inputs, labels, epochs=500, learning_rate=0.5, l2=1e-3, top_k=3):
+        """在 (样本数, 维数) 的输入矩阵上用全批量梯度下降训练"""
+        classes = sorted(set(labels))
+        targets = np.eye(len(classes))[[classes.index(label) for label in labels]]
+        mean = inputs.mean(axis=0)
+        scale = inputs.std(axis=0)
+        scale[scale == 0] = 1
+        x = (inputs - mean) / scale
+        weights = np.zeros((x.shape[1], len(classes)))
+        bias = np.zeros(len(classes))
+        for _ in range(epochs):
+            error = (softmax(x @ weights + bias) - targets) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(classes, weights, bias, mean, scale, top_k)
+
+    def save(self, path):
+        np.savez(path, kind="softmax", labels=np.array(self.labels), weights=self.weights,
+                 bias=self.bias, mean=self.mean, scale=self.scale, top_k=self.top_k)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["labels"].tolist(), data["weights"], data["bias"],
+                       data["mean"], data["scale"], int(data["top_k"]))
+
+
+def load_classifier(path=None):
+    """加载 .npz 模型；path 为空时返回默认的规则分类器"""
+    if not path:
+        return RuleClassifier()
+    with np.load(path) as data:
+        kind = str(data["kind"])
+    if kind != "softmax":
+        raise ValueError(f"不支持的模型类型: {kind}")
+    return SoftmaxClassifier.load(path)
+
+
+def train(items, analysis_rate=None, **options):
+    """从 [(WAV 路径, 情绪), ...] 训练 SoftmaxClassifier（analysis_rate 与推理时的分析采样率一致）"""
+    from analysis import as_mono, compute_features
+    from audio_io import read_wav
+    from resample import to_analysis_rate
+    rows = []
+    for path, _ in items:
+        sample_rate, data = read_wav(path)
+        data, sample_rate = to_analysis_rate(as_mono(data), sample_rate, analysis_rate)
+        features = compute_features(data, sample_rate, mfcc=True)
+        rows.append(model_inputs({name: np.atleast_1d(value) for name, value in features.items()
+                                  if name != "rms_envelope"})[0])
+    return SoftmaxClassifier.fit(np.array(rows), [label for _, label in items], **options)
+
+
+def main(argv=None):
+    from calibrate import load_labeled
+    parser = argparse.ArgumentParser(description="从带标签的录音训练情绪分类模型")
+    parser.add_argument('data', help="按情绪分目录的 WAV 文件夹，或 \"路径,情绪\" 格式的 CSV")
+    parser.add_argument('--output', default='dog_model.npz', help="保存模型的 .npz 路径")
+    parser.add_argument('--epochs', type=int, default=500)
+    parser.add_argument('--analysis-rate', type=int, default=0,
+                        help="内部分析采样率 (Hz)，需与 DogTranslator.analysis_rate 一致，默认 0 表示不降采样")
+    args = parser.parse_args(argv)
+
+    items = load_labeled(args.data)
+    if not items:
+        print("没有找到带标签的录音")
+        return 1
+    model = train(items, args.analysis_rate or None, epochs=args.epochs)
+    model.save(args.output)
+    print(f"已用 {len(items)} 个样本训练 {len(model.labels)} 类模型，保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,57 @@
+import json
+import logging
+import queue
 import sqlite3
+import threading
 from datetime import datetime
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # 通知写入线程退出
+
 
 class DogTranslatorDB:
-    def __init__(self):
-        self.conn = sqlite3.connect('dog_records.db')
+    """分析结果数据库
+
+    save_record 同步写入一条记录；高吞吐场景先调用 start_writer()，
+    再用 enqueue() 把记录交给后台写入线程按批 executemany 提交。
+    每个线程使用各自的连接，可在工作线程中读写。
+    vector_index=True 时每条记录的特征向量同时写入 <db_path>.vectors.*（见 similarity.py），
+    可用 find_similar 查找相似的狗叫；同一数据库只应由一个进程写入索引。
+    """
+
+    def __init__(self, db_path='dog_records.db', batch_size=500, flush_interval=0.5, vector_index=False):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = None
+        self._writer = None
+        self._insert_lock = threading.Lock()  # 保证向量按记录 id 的顺序追加
         self.create_tables()
-    
+        self.vectors = None
+        if vector_index:
+            from similarity import VectorIndex
+            self.vectors = VectorIndex(db_path + '.vectors')
+            with self._insert_lock:
+                self.vectors.sync(self.conn)  # 补上索引之前写入的记录
+
+    @property
+    def conn(self):
+        """当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  # WAL 模式下只在检查点时 fsync
+        return conn
+
     def create_tables(self):
         self.conn.execute('''
             CREATE TABLE IF NOT EXISTS recordings (
@@ -17,17 +63,234 @@ class DogTranslatorDB:
                 features TEXT
             )
         ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(recordings)')]
+        if 'emotions' not in columns:  # 兼容旧数据库
+            self.conn.execute('ALTER TABLE recordings ADD COLUMN emotions TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_recordings_timestamp ON recordings (timestamp)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_recordings_emotion ON recordings (emotion, timestamp)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_recordings_audio_path ON recordings (audio_path)'
+                          ' WHERE audio_path IS NOT NULL')
         self.conn.commit()
-    
-    def save_record(self, result, audio_path=None):
-        sql = '''INSERT INTO recordings 
-                (timestamp, emotion, confidence, audio_path, features)
-                VALUES (?, ?, ?, ?, ?)'''
-        self.conn.execute(sql, (
-            datetime.now(),
+
+    _INSERT_SQL = '''INSERT INTO recordings
+                (timestamp, emotion, confidence, audio_path, features, emotions)
+                VALUES (?, ?, ?, ?, ?, ?)'''
+
+    @staticmethod
+    def _to_row(result, audio_path=None):
+        """把分析结果转换为一行数据，features 和 emotions 以 JSON 保存"""
+        timestamp = result.get('timestamp') or datetime.now()
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        return (
+            timestamp.isoformat(sep=' '),
             result['primary_emotion'][0],
             result['primary_emotion'][1],
             audio_path,
-            str(result['emotions'])
-        ))
-        self.conn.commit() 
\ No newline at end of file
+            json.dumps(result.get('features', {})),
+            json.dumps(result['emotions'], ensure_ascii=False)
+        )
+
+    def _insert(self, conn, rows, features_list=None):
+        """在一个事务中写入多行；启用向量索引时按插入得到的 id 追加特征向量"""
+        with metrics.timer("db_write"), self._insert_lock:
+            with conn:
+                conn.executemany(self._INSERT_SQL, rows)
+                # 事务持有写锁，AUTOINCREMENT 分配的 id 是连续的
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            if self.vectors is not None:
+                if features_list is None:
+                    from similarity import parse_features
+                    features_list = [parse_features(row[4]) for row in rows]
+                self.vectors.add_features(range(last_id - len(rows) + 1, last_id + 1), features_list)
+        metrics.count("db_rows_written", len(rows))
+
+    def save_record(self, result, audio_path=None):
+        """同步写入一条记录"""
+        self._insert(self.conn, [self._to_row(result, audio_path)], [result.get('features')])
+
+    def save_records(self, results, audio_paths=None):
+        """在一个事务中批量写入多条记录"""
+        audio_paths = audio_paths or [None] * len(results)
+        rows = [self._to_row(result, path) for result, path in zip(results, audio_paths)]
+        self._insert(self.conn, rows, [result.get('features') for result in results])
+
+    def clear_audio_path(self, audio_path):
+        """音频文件被删除后，把引用它的记录的 audio_path 置空，返回更新的记录数"""
+        with self.conn:
+            return self.conn.execute('UPDATE recordings SET audio_path = NULL WHERE audio_path = ?',
+                                     (audio_path,)).rowcount
+
+    def start_writer(self):
+        """启动后台写入线程"""
+        if self._writer is None:
+            self._queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+            self._writer.start()
+
+    def enqueue(self, result, audio_path=None):
+        """把记录放入写入队列，立即返回（需先调用 start_writer）"""
+        self._queue.put(self._to_row(result, audio_path))
+
+    def _write_loop(self):
+        conn = self._connect()
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            rows = []
+            count = 1
+            while True:
+                if item is _STOP:
+                    running = False
+                else:
+                    rows.append(item)
+                if len(rows) >= self.batch_size or not running:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                    count += 1
+                except queue.Empty:
+                    break
+            try:
+                if rows:
+                    self._insert(conn, rows)
+            except Exception:
+                # 任何错误（包括向量索引的 OSError）都不能让写入线程退出，否则 flush/close 会一直等待
+                logger.exception("写入数据库出错，丢弃 %d 条记录", len(rows))
+            finally:
+                for _ in range(count):
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """等待队列中的记录全部写入"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        """停止写入线程并关闭当前线程的连接"""
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+            self._queue = None
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _where(start=None, end=None, emotion=None):
+        clauses = []
+        params = []
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start.isoformat(sep=' '))
+        if end:
+            clauses.append('timestamp <= ?')
+            params.append(end.isoformat(sep=' '))
+        if emotion:
+            clauses.append('emotion = ?')
+            params.append(emotion)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query_range(self, start=None, end=None, emotion=None):
+        """按时间范围（和情绪）查询，返回游标，逐行读取而不是一次载入；同一时间的记录按写入先后排序"""
+        where, params = self._where(start, end, emotion)
+        return self.conn.execute(
+            'SELECT id, timestamp, emotion, confidence, audio_path, features FROM recordings'
+            + where + ' ORDER BY timestamp, id', params)
+
+    def fetch_page(self, limit=100, before=None, start=None, end=None, emotion=None):
+        """按时间从新到旧取一页记录，使用键集分页而不是 OFFSET
+
+        before 为上一页最后一行的 (timestamp, id)，为空时取第一页。
+        每页都沿时间索引（有情绪条件时沿 (emotion, timestamp) 索引）直接定位，
+        耗时与翻到第几页、总记录数都无关。
+        返回 [(id, timestamp, emotion, confidence, audio_path), ...]
+        """
+        where, params = self._where(start, end, emotion)
+        if before is not None:
+            where += (' AND ' if where else ' WHERE ') + '(timestamp, id) < (?, ?)'
+            params += list(before)
+        return self.conn.execute(
+            'SELECT id, timestamp, emotion, confidence, audio_path FROM recordings'
+            + where + ' ORDER BY timestamp DESC, id DESC LIMIT ?', params + [limit]).fetchall()
+
+    def emotions(self):
+        """出现过的主要情绪（沿情绪索引逐个跳跃，耗时只与情绪种类数有关）"""
+        rows = self.conn.execute('''
+            WITH RECURSIVE found(emotion) AS (
+                SELECT MIN(emotion) FROM recordings
+                UNION ALL
+                SELECT (SELECT MIN(emotion) FROM recordings WHERE emotion > found.emotion)
+                FROM found WHERE found.emotion IS NOT NULL
+            )
+            SELECT emotion FROM found WHERE emotion IS NOT NULL''')
+        return [row[0] for row in rows]
+
+    def emotion_histogram(self, start=None, end=None):
+        """各主要情绪出现的次数 {情绪: 次数}"""
+        where, params = self._where(start, end)
+        rows = self.conn.execute(
+            'SELECT emotion, COUNT(*) FROM recordings' + where + ' GROUP BY emotion ORDER BY 2 DESC',
+            params)
+        return dict(rows.fetchall())
+
+    def hourly_stats(self, start=None, end=None, emotion=None):
+        """按小时聚合: [(小时, 记录数, 平均置信度), ...]"""
+        where, params = self._where(start, end, emotion)
+        rows = self.conn.execute(
+            "SELECT strftime('%Y-%m-%d %H:00', timestamp) AS hour, COUNT(*), AVG(confidence)"
+            ' FROM recordings' + where + ' GROUP BY hour ORDER BY hour', params)
+        return rows.fetchall()
+
+    def find_similar(self, record_id=None, features=None, k=10):
+        """与某条记录（或一个特征字典）最相似的 k 条记录（需 vector_index=True）
+
+        返回 [(id, 相似度, 时间, 主要情绪, 音频路径), ...]，按相似度降序，不含 record_id 本身。
+        """
+        from similarity import embed_features
+        with self._insert_lock:
+            self.vectors.sync(self.conn)  # 其他连接写入而尚未索引的记录
+        if record_id is not None:
+            vector = self.vectors.vector(record_id)
+            if vector is None:
+                return []
+        else:
+            vector = embed_features([features])[0]
+        matches = self.vectors.query(vector, k, exclude=record_id)
+        if not matches:
+            return []
+        placeholders = ','.join('?' * len(matches))
+        rows = {row[0]: row[1:] for row in self.conn.execute(
+            'SELECT id, timestamp, emotion, audio_path FROM recordings WHERE id IN (' + placeholders + ')',
+            [match_id for match_id, _ in matches])}
+        return [(match_id, score) + rows[match_id] for match_id, score in matches if match_id in rows]
+
+
+class HistoryPager:
+    """按页顺序读取数据库中的历史记录，记住上一页末尾的键集位置"""
+
+    def __init__(self, db, page_size=200, start=None, end=None, emotion=None):
+        self.db = db
+        self.page_size = page_size
+        self.filters = {"start": start, "end": end, "emotion": emotion}
+        self.position = None  # 已读取的最后一行的 (timestamp, id)
+        self.loaded = 0
+        self.exhausted = False
+
+    def next_page(self):
+        """下一页记录，读完后返回空列表"""
+        if self.exhausted:
+            return []
+        rows = self.db.fetch_page(self.page_size, self.position, **self.filters)
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if rows:
+            self.position = (rows[-1][1], rows[-1][0])
+            self.loaded += len(rows)
+        return rows
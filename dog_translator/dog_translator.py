@@ -1,188 +1,232 @@
-from datetime import datetime
-import sounddevice as sd
+import logging
+import threading
 import numpy as np
-import scipy.io.wavfile as wav
+from analysis import analyze, analyze_channels, from_float
+from history import AnalysisHistory
+from metrics import metrics
+from resample import ANALYSIS_RATE
+
+logger = logging.getLogger(__name__)
 
 class DogTranslator:
     def __init__(self):
         self.sample_rate = 44100  # 采样率
+        # 整段分析的内部采样率，None 为按原采样率分析（整段降采样在实测中并不更快）
+        self.analysis_rate = None
+        # 流式分析（stream / monitor）的内部采样率：重叠窗口反复分析，先降采样是实测的净收益
+        self.stream_analysis_rate = ANALYSIS_RATE
         self.max_duration = 5     # 改为5秒，更合理的长度
-        self.recording = None     # 存储录音数据
-        self.analysis_history = [] # 历史记录
+        self.recording = None     # 存储录音数据，形状为 (采样点, 声道)
+        self.storage_dtype = 'float32'  # 录音缓冲区类型，'int16' 时内存减半（分析时按块换算）
+        self.channels = 1         # 每个输入设备录制的声道数
+        self.device = None        # 输入设备，None 为默认设备，列表表示同时使用多个设备
+        self.channel_ids = [0]    # 最近一次录音各声道的来源标识
+        self.analysis_history = AnalysisHistory(max_records=10000) # 历史记录（有上限）
+        self._stop_event = threading.Event()  # 用于取消正在进行的录音
+        self.feature_cache = None  # 可设为 feature_cache.FeatureCache，相同音频不再重复提取特征
+        self.classifier = None     # 情绪分类器，None 为阈值规则（见 classifier.py）
         
         # 添加分析阈值常量
-        self.HIGH_FREQ_THRESHOLD = 1000  # 高频阈值
+        self.HIGH_FREQ_THRESHOLD = 1000  # 高频阈值（频谱质心, Hz）
         self.HIGH_VOLUME_THRESHOLD = 0.01 # 高音量阈值
-        self.FREQ_STD_THRESHOLD = 1000   # 频率标准差阈值
+        self.FREQ_STD_THRESHOLD = 1000   # 频率标准差阈值（频谱带宽, Hz）
         self.VOLUME_CHANGE_THRESHOLD = 0.01 # 音量变化阈值
 
-    def start_recording(self):
-        """开始录音"""
+    def start_recording(self, source=None):
+        """开始录音，录满 max_duration 或调用 stop_recording 后返回
+
+        source 为空时使用麦克风；可以传入 streaming 中的其他音频源。
+        """
         try:
-            print("准备开始录音...")
-            # 列出可用的音频设备
-            print("\n可用的音频设备:")
-            print(sd.query_devices())
-            
-            # 获取默认设备信息
-            device_info = sd.query_devices(None, 'input')
-            print(f"\n使用的录音设备: {device_info['name']}")
+            logger.info("准备开始录音...")
+            if source is None:
+                import sounddevice as sd  # 只有使用麦克风时才需要 PortAudio
+                # 列出可用的音频设备
+                logger.info("可用的音频设备:\n%s", sd.query_devices())
+                
+                # 获取录音设备信息
+                devices = self.device if isinstance(self.device, (list, tuple)) else [self.device]
+                for device in devices:
+                    device_info = sd.query_devices(device, 'input')
+                    logger.info("使用的录音设备: %s (%d 声道)", device_info['name'], self.channels)
             
-            num_samples = int(self.max_duration * self.sample_rate)
-            print(f"预计录音时长: {self.max_duration}秒")
+            logger.info("预计录音时长: %s秒", self.max_duration)
             
-            print("\n请发出声音...")
-            self.recording = sd.rec(
-                num_samples,
-                samplerate=self.sample_rate,
-                channels=1,
-                blocking=True
-            )
-            print("录音完成")
+            logger.info("请发出声音...")
+            self.capture(source)
+            logger.info("录音完成")
             return True
         except Exception as e:
-            print(f"录音出错: {str(e)}")
+            logger.error("录音出错: %s", e)
             return False
+
+    def capture(self, source=None, cancel=None):
+        """逐块录音到预分配的缓冲区，可从其他线程取消
+
+        cancel 为 threading.Event，默认使用 stop_recording 控制的内部事件。
+        录音过程中 self.recording 始终指向已录制的部分，供界面实时显示。
+        source 为空时按 self.device / self.channels 打开麦克风，多声道时缓冲区为 (采样点, 声道)。
+        """
+        from streaming import open_input
+        if source is None:
+            source = open_input(self.sample_rate, self.device, self.channels)
+        if cancel is None:
+            cancel = self._stop_event
+            cancel.clear()
+        self.channel_ids = list(source.channel_ids)
+        buffer = np.zeros((int(self.max_duration * source.sample_rate), source.channels),
+                          dtype=self.storage_dtype)
+        written = 0
+        self.recording = buffer[:0]
+        blocks = source.blocks()
+        try:
+            with metrics.timer("capture"):
+                for block in blocks:
+                    count = min(len(block), len(buffer) - written)
+                    buffer[written:written + count] = from_float(block[:count], buffer.dtype).reshape(count, -1)
+                    written += count
+                    self.recording = buffer[:written]
+                    if written >= len(buffer) or cancel.is_set():
+                        break
+        finally:
+            blocks.close()
+            source.close()
+        metrics.count("samples_captured", written)
+        return self.recording
             
     def stop_recording(self):
-        """停止录音"""
+        """停止录音（取消正在进行的 capture）"""
         if self.recording is not None:
-            sd.stop()
+            self._stop_event.set()
             return True
         return False
     
-    def analyze_bark(self, audio_data):
-        """分析狗叫声"""
-        # 添加实际的声音特征分析
+    @property
+    def thresholds(self):
+        """当前分析阈值（传给 analysis.analyze 的字典）"""
+        return {
+            'high_freq_threshold': self.HIGH_FREQ_THRESHOLD,
+            'high_volume_threshold': self.HIGH_VOLUME_THRESHOLD,
+            'freq_std_threshold': self.FREQ_STD_THRESHOLD,
+            'volume_change_threshold': self.VOLUME_CHANGE_THRESHOLD
+        }
+
+    def apply_settings(self, settings):
+        """使用 Settings.settings 中的录音参数和分析阈值（例如校准后的结果）"""
+        self.sample_rate = settings.get('sample_rate', self.sample_rate)
+        self.analysis_rate = settings.get('analysis_rate', self.analysis_rate)
+        self.stream_analysis_rate = settings.get('stream_analysis_rate', self.stream_analysis_rate)
+        self.max_duration = settings.get('recording_duration', self.max_duration)
+        self.storage_dtype = settings.get('storage_dtype', self.storage_dtype)
+        self.HIGH_FREQ_THRESHOLD = settings.get('high_freq_threshold', self.HIGH_FREQ_THRESHOLD)
+        self.HIGH_VOLUME_THRESHOLD = settings.get('high_volume_threshold', self.HIGH_VOLUME_THRESHOLD)
+        self.FREQ_STD_THRESHOLD = settings.get('freq_std_threshold', self.FREQ_STD_THRESHOLD)
+        self.VOLUME_CHANGE_THRESHOLD = settings.get('volume_change_threshold', self.VOLUME_CHANGE_THRESHOLD)
+        if settings.get('classifier_model'):
+            self.load_classifier(settings['classifier_model'])
+
+    def load_classifier(self, path=None):
+        """加载训练好的 .npz 模型，path 为空时恢复阈值规则"""
+        from classifier import load_classifier
+        self.classifier = load_classifier(path) if path else None
+        return self.classifier
+
+    def analyze_bark(self, audio_data, sample_rate=None):
+        """分析狗叫声并写入历史记录，sample_rate 默认为录音采样率"""
         if audio_data is not None and len(audio_data) > 0:  # 确保有录音数据
-            print(f"录音数据长度: {len(audio_data)} 采样点")
-            print(f"平均音量: {np.mean(np.abs(audio_data)):.4f}")
-            
-            # 计算音频特征
-            frequencies = np.fft.fft(audio_data)
-            # 计算音量
-            volume = np.mean(np.abs(audio_data))
-            # 计算持续时间
-            duration = len(audio_data) / self.sample_rate
-            
-            print(f"音频持续时间: {duration:.2f} 秒")
-            
-            # 基于特征判断情绪
-            emotions = self._analyze_features(frequencies, volume, duration)
+            logger.debug("录音数据长度: %d 采样点", len(audio_data))
         else:
-            print("没有检测到有效的录音数据，使用默认值")
-            emotions = {
-                "happy": 0.7,
-                "hungry": 0.2,
-                "anxious": 0.1
-            }
-        
-        result = {
-            "timestamp": datetime.now(),
-            "emotions": emotions,
-            "primary_emotion": max(emotions.items(), key=lambda x: x[1]),
-            "confidence": 0.85,
-            "suggestions": self._get_suggestions(emotions)
-        }
+            logger.info("没有检测到有效的录音数据，使用默认值")
+
+        result = analyze(audio_data, sample_rate or self.sample_rate, self.thresholds, self.feature_cache,
+                         self.classifier, self.analysis_rate)
+
+        features = result["features"]
+        if features and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("平均音量: %.4f, 音频持续时间: %.2f 秒", features['volume'], features['duration'])
+            logger.debug("声音特征分析: 频谱质心 %.1f Hz, 频谱带宽 %.1f Hz, 滚降频率 %.1f Hz, "
+                         "主音高 %.1f Hz, 音量变化平均值 %.4f",
+                         features['spectral_centroid'], features['spectral_bandwidth'],
+                         features['spectral_rolloff'], features['dominant_pitch'], features['volume_change'])
         
         self.analysis_history.append(result)
         return result
+
+    def analyze_channels(self, audio_data, channel_ids=None):
+        """逐声道分析多声道录音，结果带 channel 标识并写入历史记录"""
+        audio_data = np.asarray(audio_data)
+        if channel_ids is None and audio_data.ndim == 2 and audio_data.shape[1] == len(self.channel_ids):
+            channel_ids = self.channel_ids
+        results = analyze_channels(audio_data, self.sample_rate, self.thresholds, channel_ids, self.classifier,
+                                   self.analysis_rate)
+        for result in results:
+            logger.info("声道 %s: %s (置信度: %.2f)", result['channel'], *result['primary_emotion'])
+            self.analysis_history.append(result)
+        return results
+
+    def analyze_frame(self, audio_data, sample_rate=None):
+        """分析单帧音频（流式和批量模式使用，不打印、不写入历史记录）"""
+        return analyze(audio_data, sample_rate or self.sample_rate, self.thresholds, classifier=self.classifier,
+                       analysis_rate=self.analysis_rate)
+
+    def analyze_file(self, filename):
+        """按文件本身的采样率分析 WAV 文件并写入历史记录"""
+        from audio_io import read_wav
+        sample_rate, data = read_wav(filename)
+        return self.analyze_bark(data, sample_rate)
+
+    def stream(self, source=None, window=0.5, hop=0.05):
+        """流式分析：返回逐个产出情绪结果的生成器（默认按 self.device / self.channels 打开麦克风）"""
+        from streaming import StreamingAnalyzer, open_input
+        if source is None:
+            source = open_input(self.sample_rate, self.device, self.channels)
+        return iter(StreamingAnalyzer(self, source, window, hop))
     
-    def _analyze_features(self, frequencies, volume, duration):
-        """改进的声音特征分析"""
-        emotions = {}
-        
-        # 添加更多声音特征分析
-        frequency_mean = np.mean(np.abs(frequencies))
-        frequency_std = np.std(np.abs(frequencies))
-        volume_changes = np.diff(np.abs(self.recording.flatten()))
-        volume_change_mean = np.mean(volume_changes)
-        
-        print(f"\n声音特征分析:")
-        print(f"频率平均值: {frequency_mean:.2f}")
-        print(f"频率标准差: {frequency_std:.2f}")
-        print(f"音量变化平均值: {volume_change_mean:.4f}")
-        
-        # 基于更多特征的情绪判断
-        if frequency_mean > self.HIGH_FREQ_THRESHOLD and volume_change_mean > self.VOLUME_CHANGE_THRESHOLD:
-            print("检测到高频率和大音量变化 -> 兴奋/开心")
-            emotions["excited"] = 0.9
-            emotions["happy"] = 0.7
-        elif frequency_std > self.FREQ_STD_THRESHOLD and volume > self.HIGH_VOLUME_THRESHOLD:
-            print("检测到频率波动和高音量 -> 焦虑/警觉")
-            emotions["anxious"] = 0.8
-            emotions["alert"] = 0.6
-        elif frequency_mean < self.HIGH_FREQ_THRESHOLD/2 and volume < self.HIGH_VOLUME_THRESHOLD/2:
-            emotions["calm"] = 0.8
-            emotions["sleepy"] = 0.6
-        elif volume_change_mean > self.VOLUME_CHANGE_THRESHOLD*2:
-            emotions["playful"] = 0.85
-            emotions["happy"] = 0.7
-        
-        # 如果没有检测到明显情绪，添加默认值
-        if not emotions:
-            emotions["neutral"] = 0.5
-        
-        return emotions
-    
-    def _get_suggestions(self, emotions):
-        """根据情绪生成建议"""
-        suggestions = []
-        primary_emotion = max(emotions.items(), key=lambda x: x[1])[0]
-        
-        emotion_suggestions = {
-            "happy": ["狗狗心情不错，可以和它玩耍互动", "可以给它最喜欢的玩具"],
-            "excited": ["狗狗很兴奋，可以带它出去散步", "可以和它玩投球游戏"],
-            "anxious": ["狗狗可能感到焦虑，多给予安抚和陪伴", "检查周围环境是否有让它紧张的因素"],
-            "alert": ["狗狗处于警觉状态，查看是否有异常情况", "确保环境安全"],
-            "calm": ["狗狗很放松，是互动的好时机", "可以进行一些轻松的训练"],
-            "sleepy": ["狗狗有点困了，可以让它休息", "确保它有舒适的睡觉区域"],
-            "playful": ["狗狗想要玩耍，陪它玩一会儿", "拿出它喜欢的玩具"],
-            "neutral": ["狗狗情绪平静", "保持正常的日常活动"],
-            "hungry": ["狗狗可能饿了，检查是否到喂食时间", "确保食物和水都充足"]
-        }
-        
-        if primary_emotion in emotion_suggestions:
-            suggestions.extend(emotion_suggestions[primary_emotion])
-        else:
-            suggestions.append("继续观察狗狗的状态")
-        
-        return suggestions
-    
+    def analyze_barks(self, audio_data):
+        """先检测狗叫起止，只分析有狗叫的片段，每次狗叫一个结果并写入历史记录"""
+        from onset import analyze_events
+        results = analyze_events(audio_data, self.sample_rate, self.thresholds, self.classifier, self.analysis_rate)
+        logger.info("检测到 %d 次狗叫", len(results))
+        for result in results:
+            self.analysis_history.append(result)
+        return results
+
+    def monitor(self, source=None, **options):
+        """持续监听：返回逐次狗叫产出结果的生成器（默认按 self.device / self.channels 打开麦克风）"""
+        from streaming import BarkStream, open_input
+        if source is None:
+            source = open_input(self.sample_rate, self.device, self.channels)
+        return iter(BarkStream(self, source, **options))
+
+    def record_continuously(self, directory, source=None, db=None, **options):
+        """启动长时间连续录音，分段写入 directory，返回已启动的 SegmentRecorder
+
+        options 见 recorder.SegmentRecorder（分段时长、格式、保留策略等）。
+        """
+        from recorder import SegmentRecorder
+        from streaming import open_input
+        if source is None:
+            source = open_input(self.sample_rate, self.device, self.channels)
+        return SegmentRecorder(self, source, directory, db=db, **options).start()
+
     def get_history(self, start_date=None, end_date=None):
         """获取历史记录"""
-        if not (start_date or end_date):
-            return self.analysis_history
-            
-        filtered_history = [
-            record for record in self.analysis_history
-            if (not start_date or record["timestamp"] >= start_date) and
-               (not end_date or record["timestamp"] <= end_date)
-        ]
-        return filtered_history
+        return self.analysis_history.query(start_date, end_date)
     
-    def export_report(self, format="txt"):
-        """导出分析报告"""
-        if format == "txt":
-            report = "狗语翻译分析报告\n"
-            report += "=" * 20 + "\n\n"
-            
-            for record in self.analysis_history:
-                report += f"时间: {record['timestamp']}\n"
-                report += f"主要情绪: {record['primary_emotion'][0]} (置信度: {record['primary_emotion'][1]:.2f})\n"
-                report += f"建议: {record['suggestions'][0]}\n"
-                report += "-" * 20 + "\n"
-            
-            with open("dog_analysis_report.txt", "w", encoding="utf-8") as f:
-                f.write(report)
-            return True
-        
-        return False
+    def export_report(self, format="txt", path=None, incremental=False):
+        """导出分析报告（txt/csv/jsonl/html），逐条写入文件"""
+        from report import FORMATS, export_report
+        if format not in FORMATS:
+            return False
+        path = path or f"dog_analysis_report.{format}"
+        export_report(self.analysis_history.iter_range, path, format, incremental)
+        return True
     
-    def save_recording(self, filename):
-        """保存录音到文件"""
+    def save_recording(self, filename, dtype='int16'):
+        """保存录音到文件，默认写 16 位 PCM（dtype='float32' 时写浮点 WAV）"""
+        from audio_io import write_wav
         if self.recording is not None:
-            wav.write(filename, self.sample_rate, self.recording)
+            write_wav(filename, self.recording, self.sample_rate, dtype)
             return True
         return False
 
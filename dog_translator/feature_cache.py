@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+from features import FEATURE_VERSION
+
+
+def cache_key(audio, sample_rate, analysis_rate=None):
+    """音频内容哈希 + 采样率 + 特征提取版本，内容相同的片段得到相同的键
+
+    需要降采样时键中另外包含分析采样率。
+    """
+    audio = np.ascontiguousarray(audio)
+    digest = hashlib.blake2b(digest_size=20)
+    header = f"{audio.dtype.str}|{audio.shape}|{int(sample_rate)}|{FEATURE_VERSION}"
+    if analysis_rate and sample_rate > analysis_rate:
+        header += f"|{int(analysis_rate)}"
+    digest.update(header.encode())
+    digest.update(audio.data)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """持久化的特征缓存（sqlite），按最近使用时间淘汰
+
+    只缓存提取出的标量特征；阈值改变时只需重新执行规则判断，不必重新做 FFT。
+    max_entries: 最多保存的条目数，超出时删除最久未使用的条目
+    """
+
+    def __init__(self, path='feature_cache.db', max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 批量分析时多个进程可能同时写入同一个缓存文件
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS features
+                             (key TEXT PRIMARY KEY, features TEXT, last_used REAL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_features_last_used ON features(last_used)')
+        self.conn.commit()
+        self._count = len(self)  # 估计的条目数，超过上限时再精确统计
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM features').fetchone()[0]
+
+    def get(self, key):
+        """按键读取特征字典，不存在时返回 None"""
+        with self._lock:
+            row = self.conn.execute('SELECT features FROM features WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute('UPDATE features SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, features):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?)',
+                                  (key, json.dumps(features), time.time()))
+                self._count += 1
+                if self.max_entries is not None and self._count > self.max_entries:
+                    self._evict()
+
+    def _evict(self):
+        count = self.conn.execute('SELECT COUNT(*) FROM features').fetchone()[0]
+        if count <= self.max_entries:
+            self._count = count
+            return
+        # 一次多删一些，避免之后每次写入都触发淘汰
+        excess = count - self.max_entries + self.max_entries // 10
+        self.conn.execute('''DELETE FROM features WHERE key IN
+                             (SELECT key FROM features ORDER BY last_used LIMIT ?)''', (excess,))
+        self._count = count - excess
+
+    def features(self, audio, sample_rate, mfcc=False, analysis_rate=None):
+        """返回音频的特征，命中缓存时不做任何 FFT（mfcc=True 时缓存中须有 MFCC）"""
+        from analysis import compute_features
+        key = cache_key(audio, sample_rate, analysis_rate)
+        features = self.get(key)
+        if features is None or (mfcc and "mfcc" not in features):
+            features = compute_features(audio, sample_rate, mfcc, analysis_rate)
+            features.pop("rms_envelope")
+            if mfcc:
+                features["mfcc"] = features["mfcc"].tolist()
+            self.put(key, features)
+        return features
+
+    def clear(self):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM features')
+            self._count = 0
+
+    def close(self):
+        self.conn.close()
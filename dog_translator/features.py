@@ -0,0 +1,303 @@
+import functools
+import threading
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from metrics import metrics
+
+FRAME_SIZE = 2048        # STFT 帧长（采样点）
+HOP_SIZE = 1024          # 帧移，50% 重叠
+ROLLOFF_PERCENT = 0.85   # 频谱滚降点：累计能量达到 85% 的频率
+PITCH_RANGE = (100, 4000)  # 搜索主音高的频率范围 (Hz)
+# 特征提取版本，修改特征算法时加一，使特征缓存中的旧结果失效
+FEATURE_VERSION = 1
+BATCH_BLOCK = 1 << 18    # 批量提取时每块最多处理的帧采样点数（约 1 MB，保持在缓存内）
+N_MELS = 40              # Mel 滤波器个数
+N_MFCC = 13              # MFCC 系数个数（特征为各系数的均值和标准差，共 2 * N_MFCC 维）
+FEATURE_BLOCK = 64       # 单段提取时每次处理的帧数，工作缓冲区约 2 MB，与音频长度无关
+MAX_WORK_ROWS = 256      # 线程缓存的工作缓冲区最多保留的行数，更大的请求临时分配、用完即释放
+
+_work = threading.local()  # 每个线程复用自己的工作缓冲区
+
+
+@functools.lru_cache(maxsize=32)
+def get_window(frame_size):
+    """按帧长缓存 Hann 窗"""
+    window = np.hanning(frame_size).astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+@functools.lru_cache(maxsize=32)
+def get_frequencies(frame_size, sample_rate):
+    """按 (帧长, 采样率) 缓存 rfft 各频点对应的频率 (Hz)"""
+    freqs = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+    freqs.flags.writeable = False
+    return freqs
+
+
+@functools.lru_cache(maxsize=32)
+def get_mel_basis(frame_size, sample_rate, n_mels=N_MELS, n_mfcc=N_MFCC):
+    """按 (帧长, 采样率) 缓存 Mel 三角滤波器组 (频点数, n_mels) 和正交 DCT-II 矩阵 (n_mels, n_mfcc)"""
+    freqs = get_frequencies(frame_size, sample_rate)
+    mel_points = np.linspace(0, 2595 * np.log10(1 + sample_rate / 2 / 700), n_mels + 2)
+    hz_points = 700 * (10 ** (mel_points / 2595) - 1)
+    lower, center, upper = hz_points[:-2, None], hz_points[1:-1, None], hz_points[2:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    filters = np.maximum(0, np.minimum(rising, falling)).T.astype(np.float32)
+
+    k = np.arange(n_mfcc)
+    n = np.arange(n_mels)
+    dct = np.cos(np.pi / n_mels * (n[:, None] + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    dct[:, 0] /= np.sqrt(2)
+    dct = dct.astype(np.float32)
+    filters.flags.writeable = False
+    dct.flags.writeable = False
+    return filters, dct
+
+
+def frame_mfcc(frame_power, sample_rate):
+    """逐帧功率谱 (..., 帧数, 频点数) -> 逐帧 MFCC (..., 帧数, N_MFCC)"""
+    filters, dct = get_mel_basis((frame_power.shape[-1] - 1) * 2, sample_rate)
+    return np.log(frame_power @ filters + 1e-10) @ dct
+
+
+def mfcc_stats(total, squares, count):
+    """由 MFCC 的累加和与平方和得到均值和标准差，拼成 (..., 2 * N_MFCC)"""
+    mean = total / count
+    return np.concatenate((mean, np.sqrt(np.maximum(squares / count - mean * mean, 0))), axis=-1)
+
+
+def get_work_buffers(rows, frame_size):
+    """当前线程可复用的工作缓冲区：(加窗帧, 频谱, 功率谱) 各 rows 行，只在需要更多行时重新分配
+
+    使用双精度：NumPy 对 float32 的 rfft 会在内部另外分配双精度副本，
+    直接用 float64 缓冲区配合 out= 反而没有额外分配，速度也更快。
+    超过 MAX_WORK_ROWS 行的请求不进入线程缓存，线程保留的内存有固定上限。
+    """
+    cached = getattr(_work, "buffers", None)
+    if cached is None or cached[0] != frame_size or len(cached[1]) < rows:
+        bins = frame_size // 2 + 1
+        buffers = (frame_size, np.empty((rows, frame_size)), np.empty((rows, bins), dtype=np.complex128),
+                   np.empty((rows, bins)))
+        if rows > MAX_WORK_ROWS:
+            return buffers[1:]
+        cached = _work.buffers = buffers
+    return tuple(buffer[:rows] for buffer in cached[1:])
+
+
+def pcm_scale(dtype):
+    """整数 PCM 换算到 [-1, 1] 的比例，浮点数据为 1"""
+    dtype = np.dtype(dtype)
+    return 1.0 / (float(np.iinfo(dtype).max) + 1) if dtype.kind == 'i' else 1.0
+
+
+def frame_signal(audio, frame_size=FRAME_SIZE, hop_size=HOP_SIZE):
+    """把信号沿最后一维切成重叠帧（视图，不复制），不足一帧时补零"""
+    if audio.shape[-1] < frame_size:
+        pad = [(0, 0)] * (audio.ndim - 1) + [(0, frame_size - audio.shape[-1])]
+        audio = np.pad(audio, pad)
+    return sliding_window_view(audio, frame_size, axis=-1)[..., ::hop_size, :]
+
+
+def count_frames(lengths, frame_size=FRAME_SIZE, hop_size=HOP_SIZE):
+    """每段信号的有效帧数（与 frame_signal 的切帧规则一致）"""
+    lengths = np.asarray(lengths)
+    return np.where(lengths < frame_size, 1, (lengths - frame_size) // hop_size + 1)
+
+
+def spectral_summary(power, freqs):
+    """由累加功率谱 (n, 频点数) 计算质心、带宽、滚降频率和主音高，返回 (n,) 数组"""
+    total = power.sum(axis=1)
+    safe_total = np.where(total > 0, total, 1.0)
+    centroid = power @ freqs / safe_total
+    bandwidth = np.sqrt(np.einsum('ij,ij->i', (freqs - centroid[:, None]) ** 2, power) / safe_total)
+    cumulative = np.cumsum(power, axis=1)
+    rolloff = freqs[np.argmax(cumulative >= ROLLOFF_PERCENT * total[:, None], axis=1)]
+    band = np.flatnonzero((freqs >= PITCH_RANGE[0]) & (freqs <= PITCH_RANGE[1]))
+    pitch = freqs[band[np.argmax(power[:, band], axis=1)]]
+
+    silent = total <= 0
+    return {
+        "spectral_centroid": np.where(silent, 0.0, centroid),
+        "spectral_bandwidth": np.where(silent, 0.0, bandwidth),
+        "spectral_rolloff": np.where(silent, 0.0, rolloff),
+        "dominant_pitch": np.where(silent, 0.0, pitch)
+    }
+
+
+class SpectrumAccumulator:
+    """逐块累加 STFT 帧的功率谱、RMS 包络和 MFCC 统计量，extract_features 与 StreamingFeatures 共用
+
+    帧按 FEATURE_BLOCK 行分块处理：整数 PCM 在加窗时才换算为浮点，
+    加窗帧、频谱和功率谱都写入复用的工作缓冲区，内存占用与音频长度无关。
+    """
+
+    def __init__(self, sample_rate, frame_size=FRAME_SIZE, mfcc=False):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.mfcc = mfcc
+        self.power = np.zeros(frame_size // 2 + 1)
+        self.envelopes = []  # 各块的逐帧能量
+        self.count = 0
+        if mfcc:
+            self.total = np.zeros(N_MFCC)
+            self.squares = np.zeros(N_MFCC)
+
+    def add(self, frames, scale=1.0):
+        """加入 (帧数, frame_size) 的帧（可以是视图），scale 为整数 PCM 的换算比例"""
+        window = get_window(self.frame_size) * scale
+        rows = min(len(frames), FEATURE_BLOCK)
+        if not rows:
+            return
+        windowed, spectrum, frame_power = get_work_buffers(rows, self.frame_size)
+        for start in range(0, len(frames), rows):
+            block = frames[start:start + rows]
+            n = len(block)
+            np.multiply(block, scale, out=windowed[:n])
+            self.envelopes.append(np.einsum('ij,ij->i', windowed[:n], windowed[:n]).astype(np.float32))
+            np.multiply(block, window, out=windowed[:n])
+            np.fft.rfft(windowed[:n], axis=1, out=spectrum[:n])
+            np.abs(spectrum[:n], out=frame_power[:n])
+            np.square(frame_power[:n], out=frame_power[:n])
+            self.power += frame_power[:n].sum(axis=0)
+            if self.mfcc:
+                coefficients = frame_mfcc(frame_power[:n], self.sample_rate)
+                self.total += coefficients.sum(axis=0)
+                self.squares += (coefficients * coefficients).sum(axis=0)
+        self.count += len(frames)
+
+    def features(self):
+        rms_envelope = np.concatenate(self.envelopes) if self.envelopes else np.zeros(0, dtype=np.float32)
+        rms_envelope /= self.frame_size
+        np.sqrt(rms_envelope, out=rms_envelope)
+        summary = spectral_summary(self.power[None, :], get_frequencies(self.frame_size, self.sample_rate))
+        features = {name: float(values[0]) for name, values in summary.items()}
+        features["rms_envelope"] = rms_envelope
+        features["rms"] = float(np.mean(rms_envelope))
+        if self.mfcc:
+            features["mfcc"] = mfcc_stats(self.total, self.squares, self.count)
+        return features
+
+
+@metrics.timed("fft")
+def extract_features(audio, sample_rate, frame_size=FRAME_SIZE, hop_size=HOP_SIZE, mfcc=False):
+    """基于加窗 rfft 的 STFT 提取频谱特征
+
+    返回的频率类特征单位都是 Hz：
+    spectral_centroid 频谱质心, spectral_bandwidth 频谱带宽,
+    spectral_rolloff 滚降频率, dominant_pitch 主音高,
+    rms_envelope 每帧 RMS 包络, rms 平均 RMS；
+    mfcc=True 时另外返回 mfcc（MFCC 均值和标准差，长度 2 * N_MFCC 的数组）
+    """
+    audio = np.asarray(audio).ravel()
+    if audio.dtype.kind == 'u':  # 8 位 WAV 是无符号的
+        audio = (audio.astype(np.float32) - 128) / 128
+    accumulator = SpectrumAccumulator(sample_rate, frame_size, mfcc)
+    accumulator.add(frame_signal(audio, frame_size, hop_size), pcm_scale(audio.dtype))
+    return accumulator.features()
+
+
+class StreamingFeatures:
+    """按块输入一维音频，增量提取与 extract_features 相同的特征
+
+    只保留不足一帧的尾部数据，输入可以来自逐块降采样等不便整段保存的来源。
+    各块的处理耗时累加后在 features() 中作为一次 fft 阶段记录，与 extract_features 的统计口径一致。
+    """
+
+    def __init__(self, sample_rate, frame_size=FRAME_SIZE, hop_size=HOP_SIZE, mfcc=False):
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.accumulator = SpectrumAccumulator(sample_rate, frame_size, mfcc)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.length = 0  # 已输入的采样点数
+        self.elapsed = 0.0  # 已花费的特征提取时间（秒）
+
+    def process(self, block):
+        start = time.perf_counter()
+        try:
+            self._process(block)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def _process(self, block):
+        block = np.asarray(block).ravel()
+        if block.dtype.kind == 'u':
+            block = (block.astype(np.float32) - 128) / 128
+        elif block.dtype.kind == 'i':
+            block = block.astype(np.float32) * np.float32(pcm_scale(block.dtype))
+        self.length += len(block)
+        data = np.concatenate((self.pending, block)) if len(self.pending) else block
+        if len(data) < self.frame_size:
+            self.pending = np.array(data, dtype=np.float32)
+            return
+        count = (len(data) - self.frame_size) // self.hop_size + 1
+        self.accumulator.add(sliding_window_view(data, self.frame_size)[::self.hop_size][:count])
+        self.pending = np.array(data[count * self.hop_size:], dtype=np.float32)
+
+    def features(self):
+        """输入结束时调用；不足一帧的音频与 frame_signal 一样补零成一帧"""
+        start = time.perf_counter()
+        if self.accumulator.count == 0:
+            self.accumulator.add(frame_signal(self.pending, self.frame_size, self.hop_size))
+        features = self.accumulator.features()
+        metrics.observe("fft", self.elapsed + time.perf_counter() - start)
+        return features
+
+
+@metrics.timed("fft")
+def extract_features_batch(clips, sample_rate, lengths=None, frame_size=FRAME_SIZE, hop_size=HOP_SIZE,
+                           mfcc=False):
+    """批量提取频谱特征：clips 为 (片段数, 采样点) 的补零数组
+
+    lengths 给出每个片段的有效长度（默认都是整行），补零部分的帧不参与统计。
+    返回与 extract_features 同名的 (片段数,) 特征数组（不含 rms_envelope），
+    mfcc=True 时 mfcc 为 (片段数, 2 * N_MFCC) 数组。
+    """
+    clips = np.asarray(clips, dtype=np.float32)
+    if lengths is None:
+        lengths = np.full(len(clips), clips.shape[1])
+    frames = frame_signal(clips, frame_size, hop_size)
+    n_clips, n_frames = frames.shape[:2]
+    valid = np.arange(n_frames) < count_frames(lengths, frame_size, hop_size)[:, None]
+
+    window = get_window(frame_size)
+    bins = frame_size // 2 + 1
+    power = np.zeros((n_clips, bins))
+    rms = np.zeros(n_clips)
+    if mfcc:
+        total = np.zeros((n_clips, N_MFCC))
+        squares = np.zeros((n_clips, N_MFCC))
+    # 按 (片段, 帧) 两个方向分块，每块最多 BATCH_BLOCK 个帧采样点：
+    # 短片段一次处理多段，长片段按帧切分，工作缓冲区大小与片段长度无关
+    rows = max(1, BATCH_BLOCK // frame_size)
+    step = max(1, rows // n_frames)
+    frame_step = min(n_frames, rows)
+    for start in range(0, n_clips, step):
+        for first in range(0, n_frames, frame_step):
+            block = frames[start:start + step, first:first + frame_step]
+            mask = valid[start:start + step, first:first + frame_step].astype(np.float32)
+            shape = block.shape[:2]
+            windowed, spectrum, frame_power = get_work_buffers(shape[0] * shape[1], frame_size)
+            windowed = windowed.reshape(shape + (frame_size,))
+            spectrum = spectrum.reshape(shape + (bins,))
+            frame_power = frame_power.reshape(shape + (bins,))
+            np.multiply(block, window, out=windowed)
+            np.fft.rfft(windowed, axis=2, out=spectrum)
+            np.abs(spectrum, out=frame_power)
+            np.square(frame_power, out=frame_power)
+            power[start:start + step] += np.einsum('cfb,cf->cb', frame_power, mask)
+            frame_rms = np.sqrt(np.einsum('cfs,cfs->cf', block, block) / frame_size)
+            rms[start:start + step] += (frame_rms * mask).sum(axis=1)
+            if mfcc:
+                coefficients = frame_mfcc(frame_power, sample_rate)
+                total[start:start + step] += np.einsum('cfk,cf->ck', coefficients, mask)
+                squares[start:start + step] += np.einsum('cfk,cf->ck', coefficients * coefficients, mask)
+
+    counts = valid.sum(axis=1)
+    features = spectral_summary(power, get_frequencies(frame_size, sample_rate))
+    features["rms"] = rms / counts
+    if mfcc:
+        features["mfcc"] = mfcc_stats(total, squares, counts[:, None])
+    return features
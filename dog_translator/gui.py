@@ -1,15 +1,107 @@
+import threading
 import tkinter as tk
+from datetime import datetime, timedelta
 from tkinter import ttk
+from database import DogTranslatorDB, HistoryPager
 from dog_translator import DogTranslator
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from settings import Settings
+from worker import CaptureWorker
+
+
+def parse_date(text, end=False):
+    """解析 "YYYY-MM-DD" 或 "YYYY-MM-DD HH:MM"，空字符串返回 None；end=True 时只有日期的输入取当天结束"""
+    text = text.strip()
+    if not text:
+        return None
+    value = datetime.fromisoformat(text)
+    if end and len(text) <= 10:
+        value += timedelta(days=1) - timedelta(microseconds=1)
+    return value
+
+
+class HistoryBrowser:
+    """数据库历史记录浏览窗口
+
+    Treeview 只装入已滚动到的页面：打开时只查询第一页，滚动接近底部时再按键集分页读取下一页，
+    打开耗时与历史记录总数无关。日期和情绪筛选都走数据库索引。
+    """
+
+    def __init__(self, parent, db, page_size=200):
+        self.db = db
+        self.page_size = page_size
+        self.pager = None
+        self.loading = False  # 已安排读取下一页，避免滚动时重复安排
+        self.window = tk.Toplevel(parent)
+        self.window.title("历史记录")
+
+        filters = ttk.Frame(self.window)
+        filters.pack(fill="x", padx=10, pady=5)
+        ttk.Label(filters, text="开始:").pack(side="left")
+        self.start_entry = ttk.Entry(filters, width=16)
+        self.start_entry.pack(side="left", padx=2)
+        ttk.Label(filters, text="结束:").pack(side="left")
+        self.end_entry = ttk.Entry(filters, width=16)
+        self.end_entry.pack(side="left", padx=2)
+        ttk.Label(filters, text="情绪:").pack(side="left")
+        self.emotion_box = ttk.Combobox(filters, width=10, state="readonly", values=[""] + db.emotions())
+        self.emotion_box.pack(side="left", padx=2)
+        ttk.Button(filters, text="查询", command=self.reload).pack(side="left", padx=5)
+
+        body = ttk.Frame(self.window)
+        body.pack(fill="both", expand=True, padx=10)
+        columns = ("timestamp", "emotion", "confidence", "audio_path")
+        self.tree = ttk.Treeview(body, columns=columns, show="headings", height=20)
+        for column, title, width in zip(columns, ("时间", "情绪", "置信度", "音频"), (170, 80, 60, 200)):
+            self.tree.heading(column, text=title)
+            self.tree.column(column, width=width, anchor="w")
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.status = ttk.Label(self.window, text="")
+        self.status.pack(anchor="w", padx=10, pady=5)
+        self.reload()
+
+    def reload(self):
+        """按当前筛选条件从第一页重新加载"""
+        try:
+            start = parse_date(self.start_entry.get())
+            end = parse_date(self.end_entry.get(), end=True)
+        except ValueError:
+            self.status.config(text="日期格式应为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM")
+            return
+        self.tree.delete(*self.tree.get_children())
+        self.pager = HistoryPager(self.db, self.page_size, start, end, self.emotion_box.get() or None)
+        self.load_page()
+
+    def load_page(self):
+        self.loading = False
+        for record_id, timestamp, emotion, confidence, audio_path in self.pager.next_page():
+            self.tree.insert("", "end", iid=str(record_id),
+                             values=(timestamp[:19], emotion, f"{confidence:.2f}", audio_path or ""))
+        suffix = "（已全部加载）" if self.pager.exhausted else "，滚动加载更多"
+        self.status.config(text=f"已加载 {self.pager.loaded} 条记录{suffix}")
+
+    def on_scroll(self, first, last):
+        """列表滚动（或内容变化）时更新滚动条，接近底部时读取下一页"""
+        self.scrollbar.set(first, last)
+        if self.pager and not self.pager.exhausted and not self.loading and float(last) > 0.9:
+            self.loading = True
+            self.window.after_idle(self.load_page)
+
 
 class DogTranslatorGUI:
-    def __init__(self):
+    def __init__(self, db_path='dog_records.db'):
         self.root = tk.Tk()
         self.root.title("狗语翻译器")
         self.translator = DogTranslator()
         self.translator.max_duration = 5  # 设置为5秒
+        self.translator.apply_settings(Settings().settings)  # settings.json 中的参数、阈值和分类模型
+        self.worker = CaptureWorker(self.translator)  # 录音和分析都在后台线程进行
+        self.db = DogTranslatorDB(db_path)  # 分析结果由后台线程写入数据库，历史窗口从数据库分页读取
+        self.db.start_writer()
+        self.poll_interval = 50  # 主线程检查后台结果的间隔 (ms)
         
         # 主录音按钮
         self.record_button = ttk.Button(
@@ -62,21 +154,43 @@ class DogTranslatorGUI:
     
     def toggle_recording(self):
         if not self.is_recording:
+            if not self.worker.start():
+                return  # 上一次的分析还没结束
             self.record_button.config(text="停止录音")
             self.progress["value"] = 0
-            self.translator.start_recording()
             self.is_recording = True
-            self.update_progress()
             # 开始可视化更新
             self.visualizer.start_animation()
+            self.root.after(self.poll_interval, self.poll_worker)
         else:
-            self.record_button.config(text="开始录音")
-            # 停止可视化更新
-            self.visualizer.stop_animation()
-            result = self.translator.analyze_bark(self.translator.recording)
-            self.show_result(result)
-            self.is_recording = False
+            # 只发出取消信号，分析在后台完成后由 poll_worker 显示
+            self.worker.stop()
+            self.finish_recording()
+            self.record_button.config(text="分析中...", state="disabled")
+
+    def finish_recording(self):
+        """录音结束（手动停止或录满）后恢复界面状态"""
+        self.is_recording = False
+        self.visualizer.stop_animation()
+
+    def poll_worker(self):
+        """在 Tk 主线程中处理后台线程送回的消息，每次只做少量工作"""
+        for kind, payload in self.worker.drain():
+            if self.is_recording:
+                self.finish_recording()
+            self.record_button.config(text="开始录音", state="normal")
             self.progress["value"] = 0
+            if kind == "result":
+                self.db.enqueue(payload)
+                self.show_result(payload)
+            else:
+                self.result_text.delete(1.0, tk.END)
+                self.result_text.insert(tk.END, f"录音出错: {payload}\n")
+        if self.is_recording:
+            self.update_progress()
+        # 先检查线程再检查队列：线程退出前一定已经放入了结果
+        if self.worker.busy() or not self.worker.messages.empty() or self.is_recording:
+            self.root.after(self.poll_interval, self.poll_worker)
     
     def show_result(self, result):
         self.result_text.delete(1.0, tk.END)
@@ -96,17 +210,25 @@ class DogTranslatorGUI:
             self.result_text.insert(tk.END, f"- {suggestion}\n")
     
     def show_history(self):
-        history_window = tk.Toplevel(self.root)
-        history_window.title("历史记录")
-        
-        history = self.translator.get_history()
-        history_text = tk.Text(history_window, height=20, width=50)
-        history_text.pack(pady=10)
-        
-        for record in history:
-            history_text.insert(tk.END, f"时间: {record['timestamp']}\n")
-            history_text.insert(tk.END, f"情绪: {record['primary_emotion'][0]}\n")
-            history_text.insert(tk.END, "-" * 40 + "\n")
+        """先显示已提交的记录；写入队列在后台线程中清空后再刷新窗口，刚分析完的结果也能看到"""
+        browser = HistoryBrowser(self.root, self.db)
+        flushed = threading.Event()
+
+        def flush():
+            self.db.flush()  # 等待写入线程，不能在界面线程中进行
+            flushed.set()
+
+        threading.Thread(target=flush, name='db-flush', daemon=True).start()
+        self.root.after(self.poll_interval, self.refresh_history, browser, flushed)
+
+    def refresh_history(self, browser, flushed):
+        """主线程定期检查后台 flush 是否完成，完成后重新加载历史窗口"""
+        if not browser.window.winfo_exists():
+            return
+        if flushed.is_set():
+            browser.reload()
+        else:
+            self.root.after(self.poll_interval, self.refresh_history, browser, flushed)
     
     def save_recording(self):
         """保存录音文件"""
@@ -122,13 +244,16 @@ class DogTranslatorGUI:
                 self.result_text.insert(tk.END, f"\n录音已保存到: {filename}\n")
     
     def update_progress(self):
-        if self.is_recording:
-            self.progress["value"] += 2
-            if self.progress["value"] < 100:
-                self.root.after(100, self.update_progress)
+        """按已录制的采样点数更新进度条"""
+        recording = self.translator.recording
+        if recording is not None:
+            total = self.translator.max_duration * self.translator.sample_rate
+            self.progress["value"] = min(100, 100 * len(recording) / total)
     
     def add_visualization(self):
         """添加声音可视化"""
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         self.fig, self.ax = plt.subplots()
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
         self.canvas.get_tk_widget().pack()
@@ -141,11 +266,16 @@ class DogTranslatorGUI:
                 self.root.after(100, update_plot)
     
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.db.close()
 
 if __name__ == "__main__":
     print("正在启动GUI应用...")
+    import logging
     import warnings
+    logging.basicConfig(level=logging.INFO, format="%(message)s")  # 录音过程的提示输出到控制台
     warnings.filterwarnings("ignore", category=UserWarning)
     try:
         app = DogTranslatorGUI()
@@ -0,0 +1,113 @@
+import bisect
+import threading
+from analysis import DEFAULT_EMOTIONS, RULE_EMOTIONS, get_suggestions
+
+# 规则分类只会产生这几种固定的情绪得分组合，每种只保存一份；
+# 分类器的得分是连续值，不做驻留，否则字典会无限增长
+_emotion_cache = {items: items for items in
+                  (tuple(emotions.items()) for emotions in RULE_EMOTIONS + [DEFAULT_EMOTIONS])}
+
+
+def _intern_emotions(emotions):
+    items = tuple(emotions.items())
+    return _emotion_cache.get(items, items)
+
+
+class HistoryRecord:
+    """紧凑的历史记录：只保存时间、情绪得分、置信度和声道，建议在读取时再生成"""
+    __slots__ = ("timestamp", "emotions", "confidence", "channel")
+
+    def __init__(self, timestamp, emotions, confidence, channel=None):
+        self.timestamp = timestamp
+        self.emotions = _intern_emotions(emotions)
+        self.confidence = confidence
+        self.channel = channel  # 多声道录音时的声道/来源标识
+
+    def to_dict(self):
+        """还原为 analyze_bark 返回的结果格式（不含 features）"""
+        emotions = dict(self.emotions)
+        result = {
+            "timestamp": self.timestamp,
+            "emotions": emotions,
+            "primary_emotion": max(emotions.items(), key=lambda x: x[1]),
+            "confidence": self.confidence,
+            "suggestions": get_suggestions(emotions)
+        }
+        if self.channel is not None:
+            result["channel"] = self.channel
+        return result
+
+
+class AnalysisHistory:
+    """有上限的历史记录，按时间排序，时间范围查询使用二分查找
+
+    max_records: 最多保留的记录数（None 表示不限）
+    max_age: 最长保留时间，单位秒（None 表示不限）
+    """
+
+    def __init__(self, max_records=10000, max_age=None):
+        self.max_records = max_records
+        self.max_age = max_age
+        self._timestamps = []  # 与 _records 平行的 POSIX 时间戳，保持有序
+        self._records = []
+        self._start = 0        # 已淘汰记录之后的第一个有效下标
+        self._lock = threading.Lock()  # 后台分析线程写入、界面线程读取
+
+    def __len__(self):
+        return len(self._records) - self._start
+
+    def __iter__(self):
+        with self._lock:
+            records = self._records[self._start:]
+        for record in records:
+            yield record.to_dict()
+
+    def append(self, result):
+        """添加一条分析结果，必要时淘汰最旧的记录"""
+        record = HistoryRecord(result["timestamp"], result["emotions"], result["confidence"],
+                               result.get("channel"))
+        timestamp = record.timestamp.timestamp()
+        with self._lock:
+            if not self._timestamps or timestamp >= self._timestamps[-1]:
+                self._timestamps.append(timestamp)
+                self._records.append(record)
+            else:
+                index = bisect.bisect_right(self._timestamps, timestamp, self._start)
+                self._timestamps.insert(index, timestamp)
+                self._records.insert(index, record)
+            self._evict(self._timestamps[-1])
+
+    def _evict(self, now):
+        if self.max_records is not None and len(self) > self.max_records:
+            self._start = len(self._records) - self.max_records
+        if self.max_age is not None:
+            cutoff = now - self.max_age
+            self._start = bisect.bisect_left(self._timestamps, cutoff, self._start)
+        # 已淘汰部分超过一半时再真正删除，均摊 O(1)
+        if self._start > 1024 and self._start * 2 > len(self._records):
+            del self._timestamps[:self._start]
+            del self._records[:self._start]
+            self._start = 0
+
+    def iter_range(self, start_date=None, end_date=None):
+        """逐条产出时间在 [start_date, end_date] 内的记录，O(log n) 定位区间"""
+        with self._lock:
+            low = self._start
+            high = len(self._records)
+            if start_date:
+                low = bisect.bisect_left(self._timestamps, start_date.timestamp(), low, high)
+            if end_date:
+                high = bisect.bisect_right(self._timestamps, end_date.timestamp(), low, high)
+            records = self._records[low:high]
+        for record in records:
+            yield record.to_dict()
+
+    def query(self, start_date=None, end_date=None):
+        """返回时间在 [start_date, end_date] 内的记录列表"""
+        return list(self.iter_range(start_date, end_date))
+
+    def clear(self):
+        with self._lock:
+            self._timestamps = []
+            self._records = []
+            self._start = 0
@@ -0,0 +1,140 @@
+"""分析服务的压测脚本：并发上传 WAV，统计延迟分位数和吞吐量
+
+用法示例:
+    python server.py --port 8765 &
+    python loadgen.py --port 8765 --concurrency 16 --requests 2000
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+import numpy as np
+from server import encode_frame, read_frame
+
+
+def make_wav(duration=0.5, sample_rate=22050, seed=0):
+    """生成一段带噪声的合成狗叫 WAV 文件字节"""
+    import scipy.io.wavfile as wav
+    from benchmark import synth_bark
+    rng = np.random.default_rng(seed)
+    audio = synth_bark(duration, sample_rate, 600, rng) + rng.standard_normal(int(duration * sample_rate)) * 0.01
+    out = io.BytesIO()
+    wav.write(out, sample_rate, (np.clip(audio, -1, 1) * 32767).astype(np.int16))
+    return out.getvalue()
+
+
+async def http_request(reader, writer, method, path, body=b"", content_type="audio/wav"):
+    """在保持连接上发送一个请求，返回 (状态码, JSON 内容)"""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += f"Content-Type: {content_type}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+    await writer.drain()
+
+    response = await reader.readuntil(b"\r\n\r\n")
+    status_line, *lines = response.decode("latin-1").rstrip("\r\n").split("\r\n")
+    length = 0
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    payload = await reader.readexactly(length)
+    return int(status_line.split(" ")[1]), json.loads(payload)
+
+
+async def run_load(host, port, concurrency=8, requests=200, body=None, path="/analyze"):
+    """用 concurrency 条保持连接共发送 requests 个分析请求，返回延迟和吞吐统计"""
+    body = body or make_wav()
+    latencies = []
+    statuses = {}
+    remaining = [requests]
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                status, _ = await http_request(reader, writer, "POST", path, body)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "ok": statuses.get(200, 0),
+        "rejected": statuses.get(503, 0),
+        "errors": requests - statuses.get(200, 0) - statuses.get(503, 0),
+        "seconds": elapsed,
+        "requests_per_sec": requests / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None
+    }
+
+
+async def stream_websocket(host, port, audio, sample_rate, blocksize=2048):
+    """通过 /ws 流式发送 int16 PCM，返回服务端逐次狗叫返回的结果列表"""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET /ws?rate={sample_rate}&dtype=int16 HTTP/1.1\r\nHost: localhost\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    response = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in response.split(b"\r\n", 1)[0]:
+        raise ConnectionError(f"WebSocket 握手失败: {response[:80]!r}")
+
+    pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+    async def send():
+        for start in range(0, len(pcm), blocksize):
+            writer.write(encode_frame(0x2, pcm[start:start + blocksize].tobytes(), mask=True))
+            await writer.drain()
+        writer.write(encode_frame(0x8, (1000).to_bytes(2, "big"), mask=True))
+        await writer.drain()
+
+    results = []
+    sender = asyncio.create_task(send())
+    try:
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                break
+            if opcode == 0x1:
+                results.append(json.loads(payload))
+        await sender
+    finally:
+        writer.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析服务压测")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=16, help="并发连接数")
+    parser.add_argument('--requests', type=int, default=1000, help="总请求数")
+    parser.add_argument('--duration', type=float, default=0.5, help="每个上传片段的时长（秒）")
+    args = parser.parse_args(argv)
+
+    body = make_wav(args.duration)
+    stats = asyncio.run(run_load(args.host, args.port, args.concurrency, args.requests, body))
+    print(f"请求 {stats['requests']} 个: 成功 {stats['ok']}，拒绝 {stats['rejected']}，失败 {stats['errors']}")
+    if stats["ok"]:
+        print(f"延迟 p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, "
+              f"吞吐量 {stats['requests_per_sec']:.1f} 请求/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,187 @@
+"""分析流水线的性能统计：分阶段计时、计数器和延迟直方图
+
+各模块通过全局的 metrics 记录数据：
+    with metrics.timer("rules"): ...      # 计时一个阶段
+    @metrics.timed("fft")                 # 计时整个函数
+    metrics.count("clips_analyzed", n)    # 累加计数器
+
+阶段: capture 录音, fft 短时傅里叶变换, features 特征提取（包含 fft）,
+rules 规则判断或模型推理, suggestions 生成建议, db_write 数据库写入。
+metrics.stats() 返回字典，metrics.prometheus_text() 返回 Prometheus 文本格式，
+metrics.enabled = False 时所有记录都变成空操作。
+"""
+import functools
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# 直方图的桶上界（秒），从 50 微秒到 10 秒
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """固定桶的延迟直方图，分位数按所在桶的上界估计"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一个桶是 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000
+        }
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """线程安全的计数器和分阶段延迟直方图"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds):
+        """记录一次阶段耗时（秒）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, stage):
+        """计时上下文管理器"""
+        return _Timer(self, stage) if self.enabled else _NULL_TIMER
+
+    def timed(self, stage):
+        """计时装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def stats(self):
+        """{"counters": {名称: 值}, "stages": {阶段: 次数/总耗时/均值/p50/p99/最大值（毫秒）}}"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "stages": {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+            }
+
+    def prometheus_text(self, prefix="dog_translator"):
+        """Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.count, h.total) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        if histograms:
+            name = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {name} 分析流水线各阶段耗时")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, (counts, count, total) in sorted(histograms.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS, counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.9g}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def profile_call(func, path=None, top=25, stream=None):
+    """在 cProfile 下运行 func()，把统计写入 path（可用 snakeviz 等工具查看）并打印耗时最多的函数"""
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        if path:
+            profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=stream or sys.stderr)
+        stats.sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,157 @@
+from collections import namedtuple
+import numpy as np
+from analysis import analyze_batch, as_mono, to_float
+from metrics import metrics
+
+DETECT_BLOCK = 1 << 16  # 整段检测时每次送入检测器的采样点数
+
+# 一次狗叫事件，start/end 为采样点位置（end 不含）
+BarkEvent = namedtuple("BarkEvent", ["start", "end"])
+
+
+class OnsetDetector:
+    """基于短时能量和过零率的狗叫起止检测，可逐块处理音频流
+
+    噪声底噪跟踪最小能量：遇到更安静的帧立即下降，否则缓慢上升。
+    能量高于底噪 threshold_db 且过零率不高（排除嘶嘶声）的帧视为有声帧，
+    有声帧之间的间隔短于 hangover 秒时合并为同一事件。
+    """
+
+    def __init__(self, sample_rate, frame_ms=10, threshold_db=12, floor_db=-60, zcr_max=0.5,
+                 min_duration=0.05, max_duration=2.0, hangover=0.1, noise_rise=0.002):
+        self.sample_rate = sample_rate
+        self.frame_size = max(1, int(sample_rate * frame_ms / 1000))
+        self.threshold_db = threshold_db
+        self.floor_db = floor_db          # 低于此能量 (dBFS) 的帧一律视为静音
+        self.zcr_max = zcr_max
+        self.min_samples = int(min_duration * sample_rate)
+        self.max_samples = int(max_duration * sample_rate)
+        self.hangover_samples = int(hangover * sample_rate)
+        self.noise_rise = noise_rise
+        self.noise_db = None
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._position = 0                # 已处理的（整帧）采样点数
+        self._start = None                # 当前事件的起点
+        self._last_active = None          # 当前事件最后一个有声帧的终点
+
+    def _zero_crossing_rate(self, frames):
+        signs = np.signbit(frames)
+        return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+
+    def _close(self, events):
+        if self._last_active - self._start >= self.min_samples:
+            events.append(BarkEvent(self._start, self._last_active))
+        self._start = None
+        self._last_active = None
+
+    def process(self, block):
+        """处理一块音频，返回这块数据中结束的事件列表"""
+        block = to_float(as_mono(block))
+        if len(self._pending):
+            block = np.concatenate((self._pending, block))
+        count = len(block) // self.frame_size
+        self._pending = block[count * self.frame_size:].copy()
+        if count == 0:
+            return []
+
+        frames = block[:count * self.frame_size].reshape(count, self.frame_size)
+        energy = np.einsum('ij,ij->i', frames, frames) / self.frame_size
+        energy_db = 10 * np.log10(energy + 1e-12)
+        if self.noise_db is None:
+            self.noise_db = float(energy_db[0])
+
+        # 底噪不会低于本块最小能量，低于 "最小能量 + 阈值" 的帧不可能有声，
+        # 只对其余帧计算过零率（静音帧记为 1，即视为非狗叫）
+        lowest = max(self.floor_db, min(self.noise_db, float(energy_db.min())) + self.threshold_db)
+        candidates = np.flatnonzero(energy_db > lowest)
+        zcr = np.ones(count)
+        zcr[candidates] = self._zero_crossing_rate(frames[candidates])
+
+        events = []
+        noise_db = self.noise_db
+        frame_end = self._position
+        # 逐帧判断需要顺序更新底噪，先转成 Python 浮点数列表以加快循环
+        for level, crossing in zip(energy_db.tolist(), zcr.tolist()):
+            frame_end += self.frame_size
+            loud = (level > noise_db + self.threshold_db and level > self.floor_db
+                    and crossing < self.zcr_max)
+            if level < noise_db:
+                noise_db = level
+            else:
+                noise_db += self.noise_rise * (level - noise_db)
+
+            if loud:
+                if self._start is None:
+                    self._start = frame_end - self.frame_size
+                self._last_active = frame_end
+                if frame_end - self._start >= self.max_samples:
+                    self._close(events)
+            elif self._start is not None and frame_end - self._last_active >= self.hangover_samples:
+                self._close(events)
+        self.noise_db = noise_db
+        self._position += count * self.frame_size
+        return events
+
+    def flush(self):
+        """音频结束时关闭尚未结束的事件"""
+        events = []
+        if self._start is not None:
+            self._close(events)
+        return events
+
+
+def detect_barks(audio, sample_rate, **options):
+    """把一段音频切分成狗叫事件列表（分块检测，int16 数据不必整体转换为浮点）"""
+    detector = OnsetDetector(sample_rate, **options)
+    audio = as_mono(audio)
+    events = []
+    for start in range(0, len(audio), DETECT_BLOCK):
+        events.extend(detector.process(audio[start:start + DETECT_BLOCK]))
+    return events + detector.flush()
+
+
+def add_event_times(result, event, sample_rate):
+    """在分析结果中记录事件的起止时间（秒）"""
+    result["start_time"] = event.start / sample_rate
+    result["end_time"] = event.end / sample_rate
+    return result
+
+
+def analyze_events(audio, sample_rate, thresholds=None, classifier=None, analysis_rate=None, **options):
+    """只分析检测到的狗叫片段，每个片段给出一个结果（静音部分不做 FFT）
+
+    analysis_rate 给出时逐块降采样，起止检测也在分析采样率上进行；
+    降采样后的音频只在环形缓冲区中保留最近一段，从中取出事件片段，不生成整段副本。
+    """
+    if analysis_rate and sample_rate > analysis_rate:
+        events, clips = _resampled_events(audio, sample_rate, int(analysis_rate), options)
+        sample_rate = int(analysis_rate)
+    else:
+        audio = as_mono(audio)
+        events = detect_barks(audio, sample_rate, **options)
+        clips = [audio[event.start:event.end] for event in events]
+    metrics.count("barks_detected", len(events))
+    if not events:
+        return []
+    results = analyze_batch(clips, sample_rate, thresholds, classifier)
+    return [add_event_times(result, event, sample_rate) for result, event in zip(results, events)]
+
+
+def _resampled_events(audio, sample_rate, analysis_rate, options):
+    """逐块降采样并检测事件，返回 (事件列表, 事件片段列表)"""
+    from resample import RESAMPLE_BLOCK, resample_blocks
+    from streaming import RingBuffer
+    detector = OnsetDetector(analysis_rate, **options)
+    # 事件结束时，它的起点距最新数据不超过 最大时长 + 静音保持时间 + 未处理的尾部
+    ring = RingBuffer(detector.max_samples + detector.hangover_samples + 2 * RESAMPLE_BLOCK)
+    events = []
+    clips = []
+    for block in resample_blocks(audio, sample_rate, analysis_rate):
+        ring.write(block)
+        finished = detector.process(block)
+        events.extend(finished)
+        clips.extend(ring.read(event.start, event.end) for event in finished)
+    finished = detector.flush()
+    events.extend(finished)
+    clips.extend(ring.read(event.start, event.end) for event in finished)
+    return events, clips
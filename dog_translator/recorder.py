@@ -0,0 +1,232 @@
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+from analysis import from_float
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # 通知写入线程退出
+
+
+class SegmentRecorder:
+    """长时间连续录音：按固定时长切分成轮转的 WAV/FLAC 分段文件
+
+    录音线程只把数据块复制进预分配的分段缓冲区，写满后交给后台写入线程，
+    磁盘写入、压缩、狗叫检测和数据库写入都在写入线程中完成，不会阻塞录音。
+    每次检测到的狗叫以分段文件路径作为 audio_path 写入数据库。
+
+    segment_seconds: 每个分段的时长（秒）
+    format: 'wav'（16 位 PCM）或 'flac'（需要 soundfile）
+    max_total_bytes / max_age: 保留策略，超出总大小或时间（秒）的最旧分段会被删除，
+        数据库中引用该分段的记录保留，audio_path 置空
+    """
+
+    def __init__(self, translator, source, directory, segment_seconds=60, format='wav',
+                 max_total_bytes=None, max_age=None, db=None, prefix='segment'):
+        if format not in ('wav', 'flac'):
+            raise ValueError(f"不支持的分段格式: {format}")
+        self._soundfile = None
+        if format == 'flac':
+            # 在这里就检查依赖，而不是让每个分段都在写入线程中失败
+            try:
+                import soundfile
+            except ImportError as e:
+                raise ImportError("flac 分段需要安装 soundfile") from e
+            self._soundfile = soundfile
+        self.translator = translator
+        self.source = source
+        self.directory = directory
+        self.segment_size = int(segment_seconds * source.sample_rate)
+        self.format = format
+        self.max_total_bytes = max_total_bytes
+        self.max_age = max_age
+        self.db = db
+        self.prefix = prefix
+
+        self.segments_written = 0
+        self.segments_deleted = 0
+        self.bytes_written = 0
+        self.barks_detected = 0
+        self.max_queue_depth = 0
+        self.errors = 0
+        self._queue = queue.Queue()   # 不设上限：写入慢时积压在内存中，而不是让录音丢帧
+        self._free = []               # 写完后回收的分段缓冲区
+        self._free_lock = threading.Lock()
+        self._files = deque()         # 现存分段 (路径, 大小, 开始时间)，按时间排序
+        self._capture_thread = None
+        self._writer_thread = None
+        os.makedirs(directory, exist_ok=True)
+        self._scan_existing()
+
+    def _scan_existing(self):
+        """把目录中已有的分段纳入保留策略，按文件名中的开始时间排序"""
+        files = []
+        for path in glob.glob(os.path.join(self.directory, f"{self.prefix}_*.{self.format}")):
+            files.append((path, os.path.getsize(path), self._segment_start(path)))
+        self._files.extend(sorted(files, key=lambda item: item[2]))
+
+    def _segment_start(self, path):
+        """分段的开始时间：由 _segment_path 写在文件名中（mtime 是写完的时间）；
+        文件名不是本程序生成的格式时才退回使用 mtime"""
+        stamp = os.path.basename(path)[len(self.prefix) + 1:-len(self.format) - 1]
+        try:
+            return datetime.strptime(stamp, '%Y%m%d_%H%M%S_%f').timestamp()
+        except ValueError:
+            return os.path.getmtime(path)
+
+    @property
+    def dropped_frames(self):
+        """音频源因消费不及时而丢弃的采样点数（麦克风以外的音频源为 0）"""
+        return getattr(self.source, 'dropped_blocks', 0) * self.source.blocksize
+
+    @property
+    def queue_depth(self):
+        """等待写入的分段数"""
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "segments_written": self.segments_written,
+            "segments_deleted": self.segments_deleted,
+            "bytes_written": self.bytes_written,
+            "barks_detected": self.barks_detected,
+            "dropped_frames": self.dropped_frames,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "errors": self.errors
+        }
+
+    def start(self):
+        self._writer_thread = threading.Thread(target=self._write_loop, name='segment-writer', daemon=True)
+        self._writer_thread.start()
+        self._capture_thread = threading.Thread(target=self._capture_loop, name='segment-capture', daemon=True)
+        self._capture_thread.start()
+        return self
+
+    def stop(self):
+        """停止录音，未满的最后一个分段也会写出"""
+        self.source.close()
+        self.join()
+
+    def join(self, timeout=None):
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout)
+        if self._writer_thread is not None:
+            self._writer_thread.join(timeout)
+
+    def _new_buffer(self):
+        with self._free_lock:
+            if self._free:
+                return self._free.pop()
+        return np.empty((self.segment_size, self.source.channels), dtype=np.int16)
+
+    def _submit(self, buffer, count, started):
+        self._queue.put((buffer, count, started))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def _capture_loop(self):
+        buffer = self._new_buffer()
+        written = 0
+        started = time.time()
+        blocks = self.source.blocks()
+        try:
+            for block in blocks:
+                block = block.reshape(len(block), -1)
+                while len(block):
+                    count = min(len(block), self.segment_size - written)
+                    buffer[written:written + count] = from_float(block[:count], np.int16)
+                    written += count
+                    block = block[count:]
+                    if written == self.segment_size:
+                        self._submit(buffer, written, started)
+                        started += written / self.source.sample_rate
+                        buffer = self._new_buffer()
+                        written = 0
+        finally:
+            blocks.close()
+            if written:
+                self._submit(buffer, written, started)
+            self._queue.put(_STOP)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            buffer, count, started = item
+            try:
+                self._write_segment(buffer[:count], started)
+            except Exception:
+                self.errors += 1
+                logger.exception("写入分段出错")
+            with self._free_lock:
+                self._free.append(buffer)
+
+    def _segment_path(self, started):
+        stamp = datetime.fromtimestamp(started).strftime('%Y%m%d_%H%M%S_%f')
+        return os.path.join(self.directory, f"{self.prefix}_{stamp}.{self.format}")
+
+    def _write_segment(self, audio, started):
+        path = self._segment_path(started)
+        if self.format == 'flac':
+            self._soundfile.write(path, audio, self.source.sample_rate, subtype='PCM_16')
+        else:
+            from audio_io import write_wav
+            write_wav(path, audio, self.source.sample_rate)
+        size = os.path.getsize(path)
+        self.segments_written += 1
+        self.bytes_written += size
+        self._files.append((path, size, started))
+
+        self._record_barks(audio, started, path)
+        self._apply_retention()
+
+    def _record_barks(self, audio, started, path):
+        """检测分段中的狗叫，每次狗叫以分段路径写入数据库"""
+        from onset import analyze_events
+        translator = self.translator
+        results = analyze_events(audio, self.source.sample_rate, translator.thresholds, translator.classifier,
+                                 translator.analysis_rate)
+        begin = datetime.fromtimestamp(started)
+        for result in results:
+            result["timestamp"] = begin + timedelta(seconds=result["start_time"])
+            # 事件在分段文件中的位置随特征一起保存
+            result["features"]["start_time"] = result["start_time"]
+            result["features"]["end_time"] = result["end_time"]
+            translator.analysis_history.append(result)
+        self.barks_detected += len(results)
+        if self.db is not None and results:
+            self.db.save_records(results, [path] * len(results))
+
+    def _apply_retention(self):
+        total = sum(size for _, size, _ in self._files)
+        now = time.time()
+        while len(self._files) > 1:
+            path, size, started = self._files[0]
+            too_big = self.max_total_bytes is not None and total > self.max_total_bytes
+            too_old = self.max_age is not None and now - started > self.max_age
+            if not (too_big or too_old):
+                break
+            try:
+                os.remove(path)
+                self.segments_deleted += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # 文件仍在：留在列表中计入总大小，下一个分段写完后重试
+                logger.warning("删除分段 %s 失败: %s", path, e)
+                break
+            self._files.popleft()
+            total -= size
+            if self.db is not None:
+                self.db.clear_audio_path(path)
+
+    def segment_files(self):
+        """现存的分段文件路径（按时间排序）"""
+        return [path for path, _, _ in self._files]
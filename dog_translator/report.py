@@ -0,0 +1,163 @@
+import csv
+import html
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from analysis import get_suggestions
+
+
+def normalize_record(record):
+    """把历史记录字典或数据库行统一成 (时间, 情绪, 置信度, 建议)
+
+    数据库行的格式与 DogTranslatorDB.query_range 返回的一致：
+    (id, timestamp, emotion, confidence, audio_path, features)
+    """
+    if isinstance(record, dict):
+        emotion, score = record["primary_emotion"]
+        return record["timestamp"], emotion, score, record["suggestions"][0]
+    timestamp, emotion, score = record[1], record[2], record[3]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp, emotion, score, get_suggestions({emotion: score})[0]
+
+
+def _write_txt(rows, out, header):
+    if header:
+        out.write("狗语翻译分析报告\n")
+        out.write("=" * 20 + "\n\n")
+    for timestamp, emotion, score, suggestion in rows:
+        out.write(f"时间: {timestamp}\n")
+        out.write(f"主要情绪: {emotion} (置信度: {score:.2f})\n")
+        out.write(f"建议: {suggestion}\n")
+        out.write("-" * 20 + "\n")
+        yield timestamp
+
+
+def _write_csv(rows, out, header):
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(["timestamp", "emotion", "confidence", "suggestion"])
+    for timestamp, emotion, score, suggestion in rows:
+        writer.writerow([timestamp.isoformat(sep=' '), emotion, f"{score:.2f}", suggestion])
+        yield timestamp
+
+
+def _write_jsonl(rows, out, header):
+    for timestamp, emotion, score, suggestion in rows:
+        out.write(json.dumps({
+            "timestamp": timestamp.isoformat(sep=' '),
+            "emotion": emotion,
+            "confidence": score,
+            "suggestion": suggestion
+        }, ensure_ascii=False) + "\n")
+        yield timestamp
+
+
+def _write_html(rows, out, header):
+    out.write('<!DOCTYPE html>\n<html lang="zh"><head><meta charset="utf-8">'
+              '<title>狗语翻译分析报告</title><style>'
+              'body{font-family:sans-serif;margin:2em}'
+              'table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:4px 8px}'
+              '</style></head><body>\n<h1>狗语翻译分析报告</h1>\n'
+              '<table><tr><th>时间</th><th>主要情绪</th><th>置信度</th><th>建议</th></tr>\n')
+    counts = Counter()
+    for timestamp, emotion, score, suggestion in rows:
+        counts[emotion] += 1
+        out.write(f"<tr><td>{timestamp}</td><td>{html.escape(emotion)}</td>"
+                  f"<td>{score:.2f}</td><td>{html.escape(suggestion)}</td></tr>\n")
+        yield timestamp
+    # 汇总在逐行写完后才知道，放在表格之后
+    out.write("</table>\n<h2>情绪统计</h2>\n<table><tr><th>情绪</th><th>次数</th></tr>\n")
+    for emotion, count in counts.most_common():
+        out.write(f"<tr><td>{html.escape(emotion)}</td><td>{count}</td></tr>\n")
+    out.write(f"</table>\n<p>共 {sum(counts.values())} 条记录</p>\n</body></html>\n")
+
+
+_WRITERS = {"txt": _write_txt, "csv": _write_csv, "jsonl": _write_jsonl, "html": _write_html}
+FORMATS = tuple(_WRITERS)
+
+
+def write_report(records, out, format="txt", since=None, header=True, skip=None):
+    """把记录逐条写入任意可写对象，不在内存中拼接整份报告
+
+    records 可以是历史记录字典或数据库游标，须按时间（同一时间按写入先后）排序。
+    since 之前的记录会被跳过；时间等于 since 的记录跳过前 skip 条（上次已导出的），
+    skip 为 None 时全部跳过。
+    返回 (写入条数, 最后一条记录的时间, 该时间已导出的总条数)。
+    """
+    rows = map(normalize_record, records)
+    if since is not None:
+        rows = _after(rows, since, skip)
+    count = 0
+    last = None
+    tied = 0
+    for timestamp in _WRITERS[format](rows, out, header):
+        count += 1
+        if timestamp != last:
+            last = timestamp
+            tied = (skip or 0) if timestamp == since else 0
+        tied += 1
+    return count, last, tied
+
+
+def _after(rows, since, skip):
+    """跳过 since 之前的记录和时间等于 since 的前 skip 条记录"""
+    seen = 0
+    for row in rows:
+        if row[0] < since:
+            continue
+        if row[0] == since:
+            seen += 1
+            if skip is None or seen <= skip:
+                continue
+        yield row
+
+
+def _state_path(path):
+    return path + ".state"
+
+
+def load_last_export(path):
+    """读取上次导出到 path 的位置: (最后一条记录的时间, 该时间已导出的条数)
+
+    没有导出过时返回 (None, None)；旧版本的状态文件没有条数，返回 (时间, None)。
+    """
+    try:
+        with open(_state_path(path), encoding="utf-8") as f:
+            state = json.load(f)
+        return datetime.fromisoformat(state["last_timestamp"]), state.get("last_count")
+    except (FileNotFoundError, KeyError, ValueError):
+        return None, None
+
+
+def export_report(records, path, format="txt", incremental=False):
+    """导出报告到文件
+
+    records 也可以是函数 records(since)，用于按上次导出时间只查询新记录（须包含时间等于 since 的记录）。
+    incremental=True 时只追加上次导出之后的新记录（html 是完整文档，总是重写）；
+    状态文件同时记下最后时间已导出的条数，与上次最后一条同一时间的新记录不会漏掉。
+    返回写入的记录条数。
+    """
+    if format not in FORMATS:
+        raise ValueError(f"不支持的报告格式: {format}")
+    incremental = incremental and format != "html"
+    since, skip = load_last_export(path) if incremental else (None, None)
+    if callable(records):
+        records = records(since)
+    append = incremental and os.path.exists(path) and os.path.getsize(path) > 0
+
+    with open(path, "a" if append else "w", encoding="utf-8", newline="") as out:
+        count, last, tied = write_report(records, out, format, since, header=not append, skip=skip)
+
+    if last is not None:
+        with open(_state_path(path), "w", encoding="utf-8") as f:
+            json.dump({"last_timestamp": last.isoformat(), "last_count": tied}, f)
+    elif not incremental and os.path.exists(_state_path(path)):
+        os.remove(_state_path(path))
+    return count
+
+
+def export_db_report(db, path, format="txt", incremental=False):
+    """从 DogTranslatorDB 按时间顺序流式导出报告"""
+    return export_report(lambda since: db.query_range(start=since), path, format, incremental)
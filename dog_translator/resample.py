@@ -0,0 +1,138 @@
+"""多相重采样：抗混叠滤波后把音频降到分析采样率
+
+狗叫的特征都在 8 kHz 以下，按 16 kHz 分析时 FFT 和特征提取的计算量约为 44.1 kHz 的 1/2.7。
+滤波器系数按 (输入采样率, 输出采样率) 缓存；scipy.signal 在第一次重采样时才导入。
+整段分析时重采样本身的开销抵消了特征提取的节省（见 benchmark.bench_resample），
+因此默认只在流式分析中降采样（DogTranslator.stream_analysis_rate）。
+"""
+import functools
+import math
+import time
+import numpy as np
+from analysis import as_mono, to_float
+from metrics import metrics
+
+ANALYSIS_RATE = 16000  # 默认的内部分析采样率 (Hz)
+# 抗混叠 FIR 滤波器的半长（以较大的重采样因子为单位）：scipy 默认 10，
+# 取 6 时计算量减少 40%，阻带衰减仍在 70 dB 左右，6 kHz 处的通带损失约 0.05 dB
+FILTER_HALF_WIDTH = 6
+KAISER_BETA = 5.0
+RESAMPLE_BLOCK = 1 << 16  # 长音频逐块重采样时每块的输入采样点数
+
+
+@functools.lru_cache(maxsize=32)
+def get_resample_filter(input_rate, output_rate):
+    """返回 (上采样因子, 下采样因子, 只读的 float32 FIR 系数)，系数用 float32 使滤波也按 float32 进行"""
+    from scipy.signal import firwin
+    divisor = math.gcd(input_rate, output_rate)
+    up, down = output_rate // divisor, input_rate // divisor
+    max_rate = max(up, down)
+    taps = firwin(2 * FILTER_HALF_WIDTH * max_rate + 1, 1.0 / max_rate, window=('kaiser', KAISER_BETA))
+    taps = taps.astype(np.float32)
+    taps.setflags(write=False)
+    return up, down, taps
+
+
+@metrics.timed("resample")
+def resample(audio, input_rate, output_rate, axis=0):
+    """把 audio 从 input_rate 重采样到 output_rate，返回 float32（整数 PCM 先换算到 [-1, 1]）"""
+    from scipy.signal import resample_poly
+    input_rate, output_rate = int(input_rate), int(output_rate)
+    audio = to_float(audio)
+    if input_rate == output_rate:
+        return audio
+    up, down, taps = get_resample_filter(input_rate, output_rate)
+    return resample_poly(audio, up, down, axis=axis, window=taps).astype(np.float32, copy=False)
+
+
+def to_analysis_rate(audio, sample_rate, analysis_rate=None, axis=0):
+    """需要时把音频降到分析采样率，返回 (音频, 采样率)
+
+    analysis_rate 为空或不低于原采样率时原样返回（不做上采样，低采样率的录音按原样分析）。
+    """
+    if not analysis_rate or sample_rate <= analysis_rate:
+        return audio, sample_rate
+    return resample(audio, sample_rate, analysis_rate, axis), int(analysis_rate)
+
+
+def resample_blocks(audio, input_rate, output_rate, block=RESAMPLE_BLOCK):
+    """逐块产出 audio（一维或 (N, 声道)）降到 output_rate 后的单声道 float32 数据
+
+    不超过 block 的音频一次重采样；更长的音频经 StreamResampler 逐块处理，
+    整段的浮点副本和重采样结果都不会同时驻留内存，拼接起来与 resample 的结果相同。
+    各块的重采样耗时累加后在结束时作为一次 resample 阶段记录。
+    """
+    if len(audio) <= block:
+        yield resample(as_mono(audio), input_rate, output_rate)
+        return
+    resampler = StreamResampler(input_rate, output_rate)
+    elapsed = 0.0
+    for start in range(0, len(audio), block):
+        began = time.perf_counter()
+        out = resampler.process(as_mono(audio[start:start + block]))
+        elapsed += time.perf_counter() - began
+        if len(out):
+            yield out
+    began = time.perf_counter()
+    out = resampler.flush()
+    metrics.observe("resample", elapsed + time.perf_counter() - began)
+    yield out
+
+
+class StreamResampler:
+    """分块输入的多相重采样，输出与对整段调用 resample 相同
+
+    保留滤波器需要的输入历史，每个输出采样点只计算一次，
+    流式分析时每个采样点只重采样一次，而不是每个重叠窗口都重采样一遍。
+    """
+
+    def __init__(self, input_rate, output_rate):
+        from scipy.signal import upfirdn
+        self._upfirdn = upfirdn
+        self.input_rate, self.output_rate = int(input_rate), int(output_rate)
+        self.up, self.down, taps = get_resample_filter(self.input_rate, self.output_rate)
+        self.taps = taps * np.float32(self.up)
+        self.half = (len(taps) - 1) // 2
+        # 分段起点 s 须满足 s * up ≡ half (mod down)，分段的输出才落在全局的输出网格上
+        self._phase = self.half * pow(self.up, -1, self.down) % self.down
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._start = 0        # _buffer[0] 在输入中的位置
+        self.total_in = 0
+        self.total_out = 0
+
+    def _segment_start(self, output):
+        """能完整计算 output 及之后输出的最晚分段起点"""
+        first = (output * self.down - self.half) // self.up
+        return first - (first - self._phase) % self.down
+
+    def process(self, block):
+        """输入一块一维音频，返回已能确定的输出采样点"""
+        block = to_float(np.asarray(block).ravel())
+        self._buffer = np.concatenate((self._buffer, block))
+        self.total_in += len(block)
+        last = (self.total_in * self.up - 1 - self.half) // self.down
+        if last < self.total_out:
+            return np.zeros(0, dtype=np.float32)
+
+        start = self._segment_start(self.total_out)
+        if start < self._start:  # 只在开头发生：起点之前视为静音
+            self._buffer = np.concatenate((np.zeros(self._start - start, dtype=np.float32), self._buffer))
+            self._start = start
+        offset = (self.half - start * self.up) // self.down
+        filtered = self._upfirdn(self.taps, self._buffer[start - self._start:], self.up, self.down)
+        out = filtered[self.total_out + offset:last + offset + 1].astype(np.float32, copy=False)
+        self.total_out = last + 1
+
+        keep = self._segment_start(self.total_out)
+        if keep > self._start:
+            self._buffer = self._buffer[keep - self._start:]
+            self._start = keep
+        return out
+
+    def flush(self):
+        """输入结束：补零算出剩余的输出，总长度与 resample 相同"""
+        expected = -(-self.total_in * self.up // self.down)
+        total_in = self.total_in
+        out = self.process(np.zeros(self.half // self.up + self.down + 1, dtype=np.float32))
+        self.total_in = total_in
+        return out[:max(0, expected - (self.total_out - len(out)))]
@@ -0,0 +1,523 @@
+"""狗语翻译分析服务：基于 asyncio 的本地 HTTP / WebSocket 接口
+
+接口:
+    GET  /health                       服务状态
+    GET  /stats                        批处理、排队和各分析阶段的统计
+    GET  /metrics                      Prometheus 文本格式的计数器和阶段耗时直方图
+    POST /analyze                      上传 WAV 文件，或 ?rate=44100&dtype=int16 的原始 PCM
+    GET  /history?start=...&end=...    内存中的历史记录（ISO 时间）
+    GET  /db/records?start=&end=&emotion=&limit=   数据库记录（需 --db）
+    GET  /db/histogram, /db/hourly     数据库聚合统计
+    GET  /ws?rate=44100&dtype=int16    WebSocket：发送二进制 PCM 块，每检测到一次狗叫返回一条 JSON
+
+同时到达的分析请求（设置了 DogTranslator.analysis_rate 时先降到该采样率）
+合并成一次 analyze_batch 调用，在线程池中执行。
+
+用法示例:
+    python server.py --port 8765 --db dog_records.db --model dog_model.npz
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+import numpy as np
+from analysis import analyze, analyze_batch, as_mono, to_float
+from metrics import metrics, profile_call
+from resample import RESAMPLE_BLOCK, resample
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+PCM_DTYPES = ("int16", "float32")
+
+
+class ServerBusy(Exception):
+    """在途请求数已达上限"""
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def to_json(payload):
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def encode_frame(opcode, payload, mask=False):
+    """编码一个 WebSocket 帧（客户端发出的帧必须加掩码）"""
+    length = len(payload)
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += length.to_bytes(2, "big")
+    else:
+        header.append(mask_bit | 127)
+        header += length.to_bytes(8, "big")
+    if mask:
+        key = np.random.bytes(4)
+        header += key
+        payload = _apply_mask(payload, key)
+    return bytes(header) + payload
+
+
+def _apply_mask(payload, key):
+    if not payload:
+        return b""
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    value = int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+    return value.to_bytes(len(payload), "big")
+
+
+async def read_frame(reader, max_size=1 << 24):
+    """读取一条完整的 WebSocket 消息（合并分片），返回 (opcode, payload)"""
+    opcode = None
+    chunks = []
+    size = 0
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), "big")
+        size += length
+        if size > max_size:
+            raise ValueError("WebSocket 消息过大")
+        key = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if key:
+            payload = _apply_mask(payload, key)
+        frame_opcode = first & 0x0F
+        if frame_opcode >= 0x8:  # 控制帧可以夹在分片之间
+            return frame_opcode, payload
+        if frame_opcode:
+            opcode = frame_opcode
+        chunks.append(payload)
+        if first & 0x80:
+            return opcode, b"".join(chunks)
+
+
+def decode_audio(body, content_type="", rate=None, dtype="int16"):
+    """把上传的 WAV 文件或原始 PCM 字节解码为 (采样率, 数组)"""
+    if body[:4] == b"RIFF" or "wav" in content_type:
+        import scipy.io.wavfile as wav
+        return wav.read(io.BytesIO(body))
+    if rate is None:
+        raise ValueError("原始 PCM 数据需要 rate 参数")
+    if dtype not in PCM_DTYPES:
+        raise ValueError(f"不支持的 PCM 类型: {dtype}")
+    if len(body) % np.dtype(dtype).itemsize:
+        raise ValueError("PCM 数据长度与采样类型不符")
+    return int(rate), np.frombuffer(body, dtype=dtype)
+
+
+def _parse_time(params, name):
+    value = params.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+
+class MicroBatcher:
+    """把并发到达的分析请求合并成批，在线程池中调用 analyze_batch
+
+    max_batch: 每批最多的请求数
+    max_delay: 第一个请求到达后最多再等待多少秒凑批
+    max_in_flight: 排队加正在分析的请求上限（背压）
+    """
+
+    def __init__(self, thresholds=None, max_batch=32, max_delay=0.005, max_in_flight=256, executor=None,
+                 classifier=None, analysis_rate=None):
+        self.thresholds = thresholds
+        self.classifier = classifier
+        self.analysis_rate = analysis_rate
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_in_flight = max_in_flight
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis')
+        self.in_flight = 0
+        self.requests = 0
+        self.batches = 0
+        self.rejected = 0
+        self._queue = None
+        self._slots = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=True)
+
+    def full(self):
+        return self.in_flight >= self.max_in_flight
+
+    async def submit(self, audio, sample_rate, wait=True):
+        """提交一段音频并等待分析结果
+
+        wait=False 时队列已满会立即抛出 ServerBusy（HTTP 返回 503），
+        否则等待空位，读取端因此暂停接收数据，形成 TCP 层的背压。
+        """
+        if not wait and self.full():
+            self.rejected += 1
+            raise ServerBusy()
+        await self._slots.acquire()
+        self.in_flight += 1
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((audio, sample_rate, future))
+        try:
+            return await future
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self._analyze, batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _analyze(self, batch):
+        """先降到分析采样率再按采样率分组，每组一次向量化分析，结果按提交顺序返回
+
+        需要降采样的长音频（超过 RESAMPLE_BLOCK）单独经 analyze 逐块降采样和提取特征，不参与分组。
+        """
+        groups = {}
+        clips = {}
+        results = [None] * len(batch)
+        for index, (audio, sample_rate, _) in enumerate(batch):
+            if self.analysis_rate and sample_rate > self.analysis_rate:
+                if len(audio) > RESAMPLE_BLOCK:
+                    results[index] = analyze(audio, sample_rate, self.thresholds, classifier=self.classifier,
+                                             analysis_rate=self.analysis_rate)
+                    continue
+                audio, sample_rate = resample(as_mono(audio), sample_rate, self.analysis_rate), self.analysis_rate
+            clips[index] = audio
+            groups.setdefault(sample_rate, []).append(index)
+        for sample_rate, indices in groups.items():
+            group = [clips[i] for i in indices]
+            for i, result in zip(indices, analyze_batch(group, sample_rate, self.thresholds, self.classifier)):
+                results[i] = result
+        return results
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected
+        }
+
+
+class AnalysisServer:
+    """把 DogTranslator 作为共享服务运行：分析结果写入它的历史记录（以及数据库）"""
+
+    def __init__(self, translator, host="127.0.0.1", port=8765, db=None, max_batch=32,
+                 max_delay=0.005, max_in_flight=256, max_body=16 << 20):
+        self.translator = translator
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_body = max_body
+        self.batcher = MicroBatcher(translator.thresholds, max_batch, max_delay, max_in_flight,
+                                    classifier=translator.classifier, analysis_rate=translator.analysis_rate)
+        self.started = None
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        if self.db is not None:
+            self.db.start_writer()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = time.time()
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.close()
+        if self.db is not None:
+            self.db.close()
+
+    def _record(self, result, audio_path=None):
+        self.translator.analysis_history.append(result)
+        if self.db is not None:
+            self.db.enqueue(result, audio_path)
+
+    async def analyze(self, audio, sample_rate, wait=True):
+        result = await self.batcher.submit(audio, sample_rate, wait)
+        self._record(result)
+        return result
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                try:
+                    method, target, _ = request_line.split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "无效的请求行"}, False)
+                    break
+                headers = {}
+                for line in lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+
+                if headers.get("upgrade", "").lower() == "websocket" and url.path == "/ws":
+                    await self._websocket(reader, writer, headers, params)
+                    break
+
+                length = int(headers.get("content-length") or 0)
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": "上传的数据过大"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self._route(method, url.path, params, headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        """payload 为字符串时按纯文本返回，否则编码为 JSON"""
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = to_json(payload)
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    async def _route(self, method, path, params, headers, body):
+        try:
+            if path == "/analyze":
+                if method != "POST":
+                    return 405, {"error": "请使用 POST 上传音频"}
+                sample_rate, audio = decode_audio(body, headers.get("content-type", ""),
+                                                  params.get("rate"), params.get("dtype", "int16"))
+                return 200, await self.analyze(audio, sample_rate, wait=False)
+            if method != "GET":
+                return 405, {"error": "只支持 GET"}
+            if path == "/health":
+                return 200, {"status": "ok", "uptime": time.time() - self.started}
+            if path == "/stats":
+                return 200, dict(self.batcher.stats(), history=len(self.translator.analysis_history),
+                                 pipeline=metrics.stats())
+            if path == "/metrics":
+                return 200, metrics.prometheus_text()
+            if path == "/history":
+                return 200, self.translator.get_history(_parse_time(params, "start"), _parse_time(params, "end"))
+            if path.startswith("/db/"):
+                return await self._db_route(path, params)
+            return 404, {"error": f"未知路径: {path}"}
+        except ServerBusy:
+            return 503, {"error": "服务繁忙，请稍后重试"}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def _db_route(self, path, params):
+        if self.db is None:
+            return 404, {"error": "服务未配置数据库"}
+        start = _parse_time(params, "start")
+        end = _parse_time(params, "end")
+        emotion = params.get("emotion")
+        if path == "/db/records":
+            limit = int(params.get("limit", 1000))
+
+            def query():
+                cursor = self.db.query_range(start, end, emotion)
+                return [{"id": row[0], "timestamp": row[1], "emotion": row[2], "confidence": row[3],
+                         "audio_path": row[4], "features": json.loads(row[5] or "{}")}
+                        for row in cursor.fetchmany(limit)]
+        elif path == "/db/histogram":
+            def query():
+                return self.db.emotion_histogram(start, end)
+        elif path == "/db/hourly":
+            def query():
+                return [{"hour": hour, "count": count, "avg_confidence": avg}
+                        for hour, count, avg in self.db.hourly_stats(start, end, emotion)]
+        else:
+            return 404, {"error": f"未知路径: {path}"}
+        # sqlite 查询在线程池中执行，不阻塞事件循环（连接按线程创建）
+        return 200, await asyncio.get_running_loop().run_in_executor(None, query)
+
+    async def _websocket(self, reader, writer, headers, params):
+        """流式接收 PCM 块，用起止检测切出狗叫后提交给批处理器"""
+        from onset import OnsetDetector, add_event_times
+        from streaming import RingBuffer
+
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        sample_rate = int(params.get("rate", self.translator.sample_rate))
+        dtype = params.get("dtype", "int16")
+        if dtype not in PCM_DTYPES:
+            writer.write(encode_frame(0x8, (1003).to_bytes(2, "big") + "不支持的 PCM 类型".encode()))
+            await writer.drain()
+            return
+        max_duration = 2.0
+        detector = OnsetDetector(sample_rate, max_duration=max_duration)
+        ring = RingBuffer(int((max_duration + 1) * sample_rate) + (1 << 16))
+
+        async def send_events(events):
+            clips = [ring.read(event.start, event.end) for event in events]
+            results = await asyncio.gather(*(self.batcher.submit(clip, sample_rate) for clip in clips))
+            for event, result in zip(events, results):
+                self._record(result)
+                writer.write(encode_frame(0x1, to_json(add_event_times(result, event, sample_rate))))
+            await writer.drain()
+
+        while True:
+            try:
+                opcode, payload = await read_frame(reader)
+            except ValueError:
+                writer.write(encode_frame(0x8, (1009).to_bytes(2, "big")))
+                break
+            if opcode == 0x8:
+                await send_events(detector.flush())
+                writer.write(encode_frame(0x8, payload[:2]))
+                break
+            if opcode == 0x9:
+                writer.write(encode_frame(0xA, payload))
+            elif opcode == 0x2:
+                if len(payload) % np.dtype(dtype).itemsize:
+                    writer.write(encode_frame(0x8, (1007).to_bytes(2, "big")))
+                    break
+                block = to_float(np.frombuffer(payload, dtype=dtype))
+                # 一次性写入的数据不能超过环形缓冲区容量
+                for start in range(0, len(block), 1 << 16):
+                    chunk = block[start:start + (1 << 16)]
+                    ring.write(chunk)
+                    events = detector.process(chunk)
+                    if events:
+                        await send_events(events)
+        await writer.drain()
+
+
+def make_translator(model=None):
+    """按 settings.json 创建 DogTranslator，model 给出时覆盖设置中的分类模型"""
+    from dog_translator import DogTranslator
+    from settings import Settings
+    translator = DogTranslator()
+    translator.apply_settings(Settings().settings)
+    if model:
+        translator.load_classifier(model)
+    return translator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="狗语翻译分析服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default=None, help="写入的 sqlite 数据库路径")
+    parser.add_argument('--max-batch', type=int, default=32, help="每批最多合并的请求数")
+    parser.add_argument('--max-delay', type=float, default=0.005, help="凑批最长等待时间（秒）")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="在途请求上限，超出返回 503")
+    parser.add_argument('--model', default=None, help="训练好的分类模型（.npz），默认使用 settings.json 中的设置")
+    parser.add_argument('--profile', default=None, metavar='PATH', help="用 cProfile 运行并把统计写入 PATH")
+    parser.add_argument('--log-level', default='INFO', help="日志级别（DEBUG 时输出每次分析的特征）")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    translator = make_translator(args.model)
+    db = None
+    if args.db:
+        from database import DogTranslatorDB
+        db = DogTranslatorDB(args.db)
+
+    async def run():
+        server = AnalysisServer(translator, args.host, args.port, db,
+                                args.max_batch, args.max_delay, args.max_in_flight)
+        await server.start()
+        print(f"分析服务已启动: http://{server.host}:{server.port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        if args.profile:
+            profile_call(lambda: asyncio.run(run()), args.profile)
+        else:
+            asyncio.run(run())
+    except KeyboardInterrupt:
+        print("服务已停止")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,10 +5,13 @@ class Settings:
         self.default_settings = {
             'recording_duration': 5,
             'sample_rate': 44100,
+            'analysis_rate': None,
+            'stream_analysis_rate': 16000,
             'high_freq_threshold': 1000,
             'high_volume_threshold': 0.01,
             'freq_std_threshold': 1000,
-            'volume_change_threshold': 0.01
+            'volume_change_threshold': 0.01,
+            'classifier_model': None
         }
         self.load_settings()
         
@@ -0,0 +1,249 @@
+"""跨进程共享的音频环形缓冲区：一个录音生产者，多个消费者进程各自按自己的节奏读取
+
+共享内存的布局：64 字节的 int64 头部（见 HEADER_FIELDS），之后是 (capacity, channels) 的 float32 采样点。
+写入位置 write_seq 是累计写入的帧数，也是每一帧的序号：第 n 帧位于 data[n % capacity]。
+生产者先写数据再更新 write_seq，消费者只读不写，互相之间不需要锁。
+消费者落后超过 capacity 帧时，被覆盖的数据计入 dropped_frames，然后从最旧的有效帧继续读。
+
+用法示例:
+    ring = SharedAudioRing(capacity=10 * 44100, sample_rate=44100)
+    RingProducer(open_input(44100), ring).start()
+    # 在其他进程中:
+    for result in BarkStream(DogTranslator(), RingConsumer(ring.name)): ...
+"""
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from analysis import to_float
+
+MAGIC = 0x444F4752494E4731  # "DOGRING1"
+HEADER_FIELDS = ("magic", "capacity", "channels", "sample_rate", "blocksize", "write_seq", "closed")
+HEADER_BYTES = 64
+_CAPACITY, _CHANNELS, _SAMPLE_RATE, _BLOCKSIZE, _WRITE_SEQ, _CLOSED = range(1, 7)
+
+
+class SharedAudioRing:
+    """共享内存中的单生产者环形缓冲区
+
+    name 为空时创建新的共享内存（需要 capacity，单位为帧），否则按名称连接已有的缓冲区。
+    其他进程通过 ring.name 连接；创建者调用 close() 时释放共享内存。
+    """
+
+    def __init__(self, name=None, capacity=None, sample_rate=44100, channels=1, blocksize=1024):
+        self.owner = name is None
+        if self.owner:
+            size = HEADER_BYTES + int(capacity) * channels * 4
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.header = np.ndarray(len(HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+            self.header[:] = (MAGIC, capacity, channels, sample_rate, blocksize, 0, 0)
+        else:
+            self.shm = _attach(name)
+            self.header = np.ndarray(len(HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+            if self.header[0] != MAGIC:
+                self.shm.close()
+                raise ValueError(f"{name} 不是音频环形缓冲区")
+        self.capacity = int(self.header[_CAPACITY])
+        self.channels = int(self.header[_CHANNELS])
+        self.sample_rate = int(self.header[_SAMPLE_RATE])
+        self.blocksize = int(self.header[_BLOCKSIZE])
+        self.data = np.ndarray((self.capacity, self.channels), dtype=np.float32,
+                               buffer=self.shm.buf, offset=HEADER_BYTES)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        """累计写入的帧数（下一帧的序号）"""
+        return int(self.header[_WRITE_SEQ])
+
+    @property
+    def closed(self):
+        """生产者已结束，不会再有新数据"""
+        return bool(self.header[_CLOSED])
+
+    def write(self, block):
+        """写入一块音频（一维或 (帧数, channels)），超过容量时只保留最后 capacity 帧"""
+        block = to_float(block).reshape(len(block), -1)
+        seq = self.write_seq
+        count = len(block)
+        if count > self.capacity:
+            block = block[-self.capacity:]
+        start = (seq + count - len(block)) % self.capacity
+        first = min(len(block), self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:len(block) - first] = block[first:]
+        # 数据写完后再发布新的序号，消费者看到序号时数据已经就绪
+        self.header[_WRITE_SEQ] = seq + count
+
+    def finish(self):
+        """标记生产者结束，消费者读完剩余数据后退出"""
+        self.header[_CLOSED] = 1
+
+    def latest(self, count):
+        """最近 count 帧的副本（按时间顺序，单声道时为一维），用于界面显示等只关心最新数据的场合"""
+        end = self.write_seq
+        count = min(count, end, self.capacity)
+        latest = self.data[np.arange(end - count, end) % self.capacity]
+        return latest[:, 0] if self.channels == 1 else latest
+
+    def close(self):
+        """断开共享内存；创建者同时释放它（仍有视图在使用时，映射在视图释放后才解除）"""
+        if self.shm is None:
+            return
+        self.header = self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+def _attach(name):
+    """连接已有的共享内存，不登记到 resource_tracker：共享内存由创建者释放，
+    否则消费者进程退出时 resource_tracker 会把它删除（Python 3.13 起可用 track=False）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class RingConsumer:
+    """从共享环形缓冲区读取音频的音频源，接口与 streaming 中的音频源相同
+
+    blocks() 产出的是共享内存上的视图（不复制），只在下一次迭代之前有效；需要保留的数据请自行复制。
+    start='latest' 从连接时的最新位置开始读，'oldest' 从缓冲区中最旧的有效帧开始读。
+    """
+
+    def __init__(self, ring, start='latest', poll_interval=None):
+        self._owns_ring = isinstance(ring, str)
+        self.ring = SharedAudioRing(ring) if self._owns_ring else ring
+        self.sample_rate = self.ring.sample_rate
+        self.channels = self.ring.channels
+        self.blocksize = self.ring.blocksize
+        self.channel_ids = list(range(self.channels))
+        # 没有新数据时的等待间隔，默认为一个数据块时长的 1/4
+        self.poll_interval = poll_interval or self.blocksize / self.sample_rate / 4
+        seq = self.ring.write_seq
+        self.position = max(0, seq - self.ring.capacity) if start == 'oldest' else seq
+        self.overruns = 0        # 落后超过容量的次数
+        self.dropped_frames = 0  # 因此丢失的帧数
+        self.torn_blocks = 0     # 使用期间被生产者覆盖的数据块数
+        self._stop_event = threading.Event()
+        self._running = False
+
+    @property
+    def dropped_blocks(self):
+        """丢失的数据块数（与 MicrophoneSource.dropped_blocks 含义一致）"""
+        return -(-self.dropped_frames // self.blocksize)
+
+    @property
+    def lag(self):
+        """尚未读取的帧数"""
+        return self.ring.write_seq - self.position
+
+    def stats(self):
+        return {
+            "position": self.position,
+            "lag": self.lag,
+            "overruns": self.overruns,
+            "dropped_frames": self.dropped_frames,
+            "torn_blocks": self.torn_blocks
+        }
+
+    def blocks(self):
+        """按序产出最多 blocksize 帧的数据块，生产者结束并读完后返回"""
+        ring = self.ring
+        self._running = True
+        try:
+            while not self._stop_event.is_set():
+                end = ring.write_seq
+                oldest = end - ring.capacity
+                if self.position < oldest:
+                    self.overruns += 1
+                    self.dropped_frames += oldest - self.position
+                    self.position = oldest
+                if self.position >= end:
+                    if ring.closed and ring.write_seq == end:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                start = self.position % ring.capacity
+                count = min(end - self.position, ring.capacity - start, self.blocksize)
+                block = ring.data[start:start + count]
+                self.position += count
+                yield block[:, 0] if self.channels == 1 else block
+                # 消费者处理这一块期间，生产者是否已经绕回来覆盖了它
+                if ring.write_seq - ring.capacity > self.position - count:
+                    self.torn_blocks += 1
+        finally:
+            self._running = False
+            if self._owns_ring and self._stop_event.is_set():  # close() 在读取过程中被调用
+                ring.close()
+
+    def close(self):
+        """停止读取（可从其他线程调用）"""
+        self._stop_event.set()
+        if self._owns_ring and not self._running:
+            self.ring.close()
+
+
+class RingProducer:
+    """后台线程：从音频源逐块读取并写入共享环形缓冲区，音频源结束时标记缓冲区结束"""
+
+    def __init__(self, source, ring):
+        self.source = source
+        self.ring = ring
+        self.frames_written = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ring-producer', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        blocks = self.source.blocks()
+        try:
+            for block in blocks:
+                self.ring.write(block)
+                self.frames_written += len(block)
+        finally:
+            blocks.close()
+            self.ring.finish()
+
+    def stop(self):
+        self.source.close()
+        self.join()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def analysis_worker(ring_name, results, start='oldest'):
+    """分析进程的入口：从共享环形缓冲区检测狗叫，结果逐个放入 results 队列，结束时放入 None
+
+    用 multiprocessing.Process(target=analysis_worker, args=(ring.name, queue)) 启动，
+    分析在独立的进程（和 CPU 核）上进行，音频不经过管道复制。
+    """
+    from dog_translator import DogTranslator
+    from streaming import BarkStream
+    consumer = RingConsumer(ring_name, start)
+    try:
+        for result in BarkStream(DogTranslator(), consumer):
+            results.put(result)
+    finally:
+        consumer.close()
+        results.put(None)
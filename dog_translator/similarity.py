@@ -0,0 +1,176 @@
+"""“找相似的狗叫”：数据库记录的特征向量索引
+
+每条记录的标量特征（频谱质心、带宽、滚降、主音高、音量、RMS、时长）取对数、
+按固定的参考值中心化后归一化为长度 EMBEDDING_DIM 的 float32 单位向量，
+追加写入与 sqlite 数据库并列的两个文件：
+    <path>.f32  (记录数, EMBEDDING_DIM) 的 float32 矩阵
+    <path>.ids  对应的记录 id (int64)，按 id 递增
+查询时以内存映射方式分块读取矩阵，余弦相似度就是向量点积，内存占用与记录数无关。
+"""
+import json
+import os
+import threading
+import numpy as np
+
+# (特征名, 参考值)：对数域中减去参考值的对数，使典型的狗叫落在原点附近，余弦相似度才有区分度
+EMBEDDING_FEATURES = (
+    ("spectral_centroid", 1500.0),
+    ("spectral_bandwidth", 1200.0),
+    ("spectral_rolloff", 3000.0),
+    ("dominant_pitch", 600.0),
+    ("volume", 0.05),
+    ("rms", 0.05),
+    ("duration", 0.5),
+)
+# 补零到 8 维：每行 32 字节，float32 矩阵-向量乘比 7 维快约 1/3
+EMBEDDING_DIM = 8
+QUERY_CHUNK = 1 << 18  # 每次参与点积的行数，得分缓冲区约 1 MB
+
+
+def embed_features(features_list):
+    """把特征字典列表转换为 (n, EMBEDDING_DIM) 的单位向量；缺少的特征按参考值计（该维为 0）"""
+    rows = np.empty((len(features_list), len(EMBEDDING_FEATURES)), dtype=np.float64)
+    for i, features in enumerate(features_list):
+        rows[i] = [features.get(name, reference) if features else reference
+                   for name, reference in EMBEDDING_FEATURES]
+    references = np.array([reference for _, reference in EMBEDDING_FEATURES])
+    vectors = np.zeros((len(rows), EMBEDDING_DIM), dtype=np.float32)
+    vectors[:, :rows.shape[1]] = np.log((np.maximum(rows, 0) + 1e-4) / (references + 1e-4))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def parse_features(text):
+    """数据库 features 列 -> 特征字典（旧记录无法解析时返回空字典）"""
+    try:
+        features = json.loads(text) if text else {}
+    except ValueError:
+        return {}
+    return features if isinstance(features, dict) else {}
+
+
+class VectorIndex:
+    """只追加的特征向量索引，支持增量写入和分块 kNN 查询
+
+    同一时间只应有一个线程/进程写入；查询会自动映射写入后新增的行。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        for suffix in ('.f32', '.ids'):
+            if not os.path.exists(path + suffix):
+                open(path + suffix, 'ab').close()
+        self._truncate()
+
+    def _file_count(self):
+        return min(os.path.getsize(self.path + '.f32') // (4 * EMBEDDING_DIM),
+                   os.path.getsize(self.path + '.ids') // 8)
+
+    def _truncate(self):
+        """丢弃写了一半（两个文件长度不一致）的尾部"""
+        count = self._file_count()
+        for suffix, row_bytes in (('.f32', 4 * EMBEDDING_DIM), ('.ids', 8)):
+            with open(self.path + suffix, 'r+b') as f:
+                f.truncate(count * row_bytes)
+
+    def _refresh(self):
+        """文件中的行数超过已映射的行数时重新映射"""
+        count = self._file_count()
+        if count != len(self._ids):
+            if count:
+                self._vectors = np.memmap(self.path + '.f32', np.float32, 'r', shape=(count, EMBEDDING_DIM))
+                self._ids = np.memmap(self.path + '.ids', np.int64, 'r', shape=(count,))
+            else:
+                self._vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+                self._ids = np.zeros(0, dtype=np.int64)
+        return self._vectors, self._ids
+
+    def __len__(self):
+        with self._lock:
+            return len(self._refresh()[1])
+
+    @property
+    def last_id(self):
+        """已索引的最大记录 id，没有记录时为 0"""
+        with self._lock:
+            ids = self._refresh()[1]
+            return int(ids[-1]) if len(ids) else 0
+
+    def add(self, ids, vectors):
+        """追加一批记录（ids 须大于已有的 id），vectors 为 embed_features 的输出"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), EMBEDDING_DIM)
+        if not len(ids):
+            return
+        with self._lock:
+            with open(self.path + '.f32', 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.path + '.ids', 'ab') as f:
+                f.write(ids.tobytes())
+
+    def add_features(self, ids, features_list):
+        self.add(ids, embed_features(features_list))
+
+    def sync(self, conn, batch=10000):
+        """把数据库中尚未索引的记录（id 大于 last_id）补进索引，返回补入的条数"""
+        cursor = conn.execute('SELECT id, features FROM recordings WHERE id > ? ORDER BY id', (self.last_id,))
+        added = 0
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return added
+            self.add_features([row[0] for row in rows], [parse_features(row[1]) for row in rows])
+            added += len(rows)
+
+    def vector(self, record_id):
+        """按记录 id 取出向量，未索引时返回 None"""
+        with self._lock:
+            vectors, ids = self._refresh()
+        i = np.searchsorted(ids, record_id)
+        if i < len(ids) and ids[i] == record_id:
+            return np.array(vectors[i])
+        return None
+
+    def query(self, vector, k=10, exclude=None, chunk=QUERY_CHUNK):
+        """返回与 vector 余弦相似度最高的 k 条记录 [(记录 id, 相似度), ...]，按相似度降序
+
+        矩阵按 chunk 行分块做点积；已有 k 个候选后，每块只挑出超过当前第 k 名的行，
+        通常只有极少数，不必对整块做 argpartition。exclude 为要排除的记录 id。
+        """
+        with self._lock:
+            vectors, ids = self._refresh()
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        keep = k + (1 if exclude is not None else 0)
+        best_scores = np.zeros(0, dtype=np.float32)
+        best_rows = np.zeros(0, dtype=np.int64)
+        scores = np.empty(min(chunk, len(ids)), dtype=np.float32)
+        for start in range(0, len(ids), chunk):
+            block = vectors[start:start + chunk]
+            block_scores = np.dot(block, query, out=scores[:len(block)])
+            if len(best_scores) >= keep:
+                rows = np.flatnonzero(block_scores > best_scores.min())
+            elif len(block) > keep:
+                rows = np.argpartition(block_scores, len(block) - keep)[len(block) - keep:]
+            else:
+                rows = np.arange(len(block))
+            best_scores = np.concatenate((best_scores, block_scores[rows]))
+            best_rows = np.concatenate((best_rows, rows + start))
+            if len(best_scores) > keep:
+                top = np.argpartition(best_scores, len(best_scores) - keep)[len(best_scores) - keep:]
+                best_scores, best_rows = best_scores[top], best_rows[top]
+        order = np.argsort(-best_scores, kind='stable')
+        results = []
+        for i in order:
+            record_id = int(ids[best_rows[i]])
+            if record_id == exclude:
+                continue
+            results.append((record_id, float(best_scores[i])))
+            if len(results) == k:
+                break
+        return results
@@ -0,0 +1,293 @@
+import queue
+import threading
+import time
+import numpy as np
+from analysis import as_mono, to_float
+from metrics import metrics
+from onset import OnsetDetector, add_event_times
+
+
+class RingBuffer:
+    """环形缓冲区，只保留最近 capacity 个采样点"""
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        self.total_written = 0  # 累计写入的采样点数
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    def write(self, data):
+        """写入一段采样点，覆盖最旧的数据"""
+        data = np.asarray(data, dtype=self.buffer.dtype).ravel()
+        count = len(data)
+        if count > self.capacity:
+            data = data[-self.capacity:]
+        with self.lock:
+            start = (self.total_written + count - len(data)) % self.capacity
+            end = start + len(data)
+            if end <= self.capacity:
+                self.buffer[start:end] = data
+            else:
+                first = self.capacity - start
+                self.buffer[start:] = data[:first]
+                self.buffer[:end - self.capacity] = data[first:]
+            self.total_written += count
+
+    def latest(self, count):
+        """按时间顺序返回最近 count 个采样点的副本"""
+        with self.lock:
+            count = min(count, len(self))
+            end = self.total_written % self.capacity
+            start = end - count
+            if start >= 0:
+                return self.buffer[start:end].copy()
+            return np.concatenate((self.buffer[start:], self.buffer[:end]))
+
+    def read(self, start, end):
+        """按绝对采样点位置读取 [start, end)，数据必须仍在缓冲区内"""
+        with self.lock:
+            if start < self.total_written - len(self) or end > self.total_written:
+                raise ValueError("请求的数据已不在环形缓冲区内")
+            first = start % self.capacity
+            count = end - start
+            if first + count <= self.capacity:
+                return self.buffer[first:first + count].copy()
+            return np.concatenate((self.buffer[first:], self.buffer[:first + count - self.capacity]))
+
+
+class ArraySource:
+    """由内存中的数组提供音频（用于测试，不需要声卡）
+
+    channels=1 时产出一维数据块；多声道时产出 (采样点, channels) 数据块，
+    取 data 的前 channels 列。
+    """
+
+    def __init__(self, data, sample_rate, blocksize=1024, realtime=False, channels=1):
+        self.data = np.asarray(data)
+        if self.data.ndim > 1:
+            self.data = self.data[:, 0] if channels == 1 else self.data[:, :channels]
+        elif channels != 1:
+            raise ValueError("一维数据只能作为单声道音频源")
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.realtime = realtime  # 为 True 时按真实录音速度产出数据块
+        self.channels = channels
+        self.channel_ids = list(range(channels))
+
+    def blocks(self):
+        """按 blocksize 逐块产出浮点音频"""
+        interval = self.blocksize / self.sample_rate
+        next_time = time.perf_counter()
+        for start in range(0, len(self.data), self.blocksize):
+            if self.realtime:
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+            yield to_float(self.data[start:start + self.blocksize])
+
+    def close(self):
+        pass
+
+
+class WavFileSource(ArraySource):
+    """从 WAV 文件读取音频（内存映射，不一次性载入）"""
+
+    def __init__(self, filename, blocksize=1024, realtime=False, channels=1):
+        import scipy.io.wavfile as wav
+        sample_rate, data = wav.read(filename, mmap=True)
+        super().__init__(data, sample_rate, blocksize, realtime, channels)
+
+
+class MicrophoneSource:
+    """麦克风输入：sd.InputStream 回调把数据块放入队列
+
+    channels 大于 1 时（多声道声卡）产出 (采样点, channels) 数据块。
+    """
+
+    def __init__(self, sample_rate=44100, blocksize=1024, device=None, max_queue=64, channels=1):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.device = device
+        self.channels = channels
+        name = "default" if device is None else device
+        self.channel_ids = [f"{name}:{channel}" for channel in range(channels)]
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped_blocks = 0  # 消费太慢时丢弃的数据块数
+        self._stop_event = threading.Event()
+
+    def _callback(self, indata, frames, time, status):
+        try:
+            self.queue.put_nowait(indata[:, 0].copy() if self.channels == 1 else indata.copy())
+        except queue.Full:
+            self.dropped_blocks += 1
+
+    def blocks(self):
+        import sounddevice as sd
+        self._stop_event.clear()
+        stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.blocksize,
+            device=self.device,
+            channels=self.channels,
+            dtype='float32',
+            callback=self._callback
+        )
+        with stream:
+            while not self._stop_event.is_set():
+                try:
+                    yield self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+    def close(self):
+        self._stop_event.set()
+
+
+class MultiDeviceSource:
+    """把多个音频源（例如多块声卡）按采样点对齐，合并成 (采样点, 总声道数) 数据块
+
+    各音频源的采样率必须相同；任意一个音频源结束时整体结束。
+    """
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        rates = {source.sample_rate for source in self.sources}
+        if len(rates) != 1:
+            raise ValueError("所有音频源的采样率必须相同")
+        self.sample_rate = rates.pop()
+        self.blocksize = max(source.blocksize for source in self.sources)
+        self.channels = sum(source.channels for source in self.sources)
+        self.channel_ids = [f"{index}:{channel_id}" for index, source in enumerate(self.sources)
+                            for channel_id in source.channel_ids]
+
+    def blocks(self):
+        generators = [source.blocks() for source in self.sources]
+        pending = [np.zeros((0, source.channels), dtype=np.float32) for source in self.sources]
+        try:
+            while True:
+                # 只从数据最少的音频源读取下一块，再输出各源都已到达的公共部分
+                shortest = min(len(block) for block in pending)
+                for index, generator in enumerate(generators):
+                    if len(pending[index]) > shortest:
+                        continue
+                    block = next(generator, None)
+                    if block is None:
+                        return
+                    block = block.reshape(len(block), -1)
+                    pending[index] = np.concatenate((pending[index], block)) if len(pending[index]) else block
+                count = min(len(block) for block in pending)
+                if count:
+                    yield np.hstack([block[:count] for block in pending])
+                    pending = [block[count:] for block in pending]
+        finally:
+            for generator in generators:
+                generator.close()
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+def open_input(sample_rate=44100, device=None, channels=1, blocksize=1024):
+    """打开麦克风输入：device 为列表时同时打开多个设备并合并声道"""
+    if isinstance(device, (list, tuple)):
+        return MultiDeviceSource(MicrophoneSource(sample_rate, blocksize, item, channels=channels)
+                                 for item in device)
+    return MicrophoneSource(sample_rate, blocksize, device, channels=channels)
+
+
+def open_resampler(translator, sample_rate):
+    """分析采样率低于音频源时返回 (StreamResampler, 分析采样率)，否则返回 (None, 原采样率)"""
+    analysis_rate = getattr(translator, 'stream_analysis_rate', None)
+    if not analysis_rate or sample_rate <= analysis_rate:
+        return None, sample_rate
+    from resample import StreamResampler
+    return StreamResampler(sample_rate, analysis_rate), int(analysis_rate)
+
+
+def resampled_blocks(source, resampler):
+    """逐块读取音频源，需要时先降采样：每个采样点只重采样一次，重叠窗口直接使用降采样后的数据
+
+    两条路径都产出一维浮点数据：多声道数据块先混成单声道，否则写入环形缓冲区时会被展平成交错的声道。
+    """
+    if resampler is None:
+        for block in source.blocks():
+            yield to_float(as_mono(block))
+        return
+    for block in source.blocks():
+        with metrics.timer("resample"):
+            block = resampler.process(as_mono(block))
+        if len(block):
+            yield block
+    tail = resampler.flush()
+    if len(tail):
+        yield tail
+
+
+class StreamingAnalyzer:
+    """流式分析：在重叠窗口上每隔 hop 秒分析一次，逐个产出情绪结果"""
+
+    def __init__(self, translator, source, window=0.5, hop=0.05):
+        self.translator = translator
+        self.source = source
+        self.resampler, self.sample_rate = open_resampler(translator, source.sample_rate)
+        self.window_size = int(window * self.sample_rate)
+        self.hop_size = max(1, int(hop * self.sample_rate))
+        self.ring = RingBuffer(self.window_size)
+
+    def __iter__(self):
+        return self.results()
+
+    def results(self):
+        """生成器：每积累 hop 个新采样点就分析最近一个窗口"""
+        next_at = self.window_size
+        for block in resampled_blocks(self.source, self.resampler):
+            # 按 hop 边界切分数据块，保证大数据块也不会漏掉分析点
+            while len(block) > 0:
+                take = min(len(block), next_at - self.ring.total_written)
+                self.ring.write(block[:take])
+                block = block[take:]
+                if self.ring.total_written == next_at:
+                    result = self.translator.analyze_frame(self.ring.latest(self.window_size), self.sample_rate)
+                    result["stream_time"] = next_at / self.sample_rate
+                    yield result
+                    next_at += self.hop_size
+
+    def stop(self):
+        """停止流式分析"""
+        self.source.close()
+
+
+class BarkStream:
+    """流式狗叫检测：起止检测器切出完整的狗叫事件后只分析该片段"""
+
+    def __init__(self, translator, source, max_duration=2.0, **options):
+        self.translator = translator
+        self.source = source
+        self.resampler, self.sample_rate = open_resampler(translator, source.sample_rate)
+        self.detector = OnsetDetector(self.sample_rate, max_duration=max_duration, **options)
+        # 事件在 hangover 之后才结束，缓冲区要能容纳最长事件再多一点
+        capacity = int((max_duration + 1) * self.sample_rate) + source.blocksize
+        self.ring = RingBuffer(capacity)
+
+    def __iter__(self):
+        return self.results()
+
+    def _analyze(self, event):
+        audio = self.ring.read(event.start, event.end)
+        result = self.translator.analyze_frame(audio, self.sample_rate)
+        return add_event_times(result, event, self.sample_rate)
+
+    def results(self):
+        """生成器：每检测到一次完整的狗叫就产出一个结果"""
+        for block in resampled_blocks(self.source, self.resampler):
+            self.ring.write(block)
+            for event in self.detector.process(block):
+                yield self._analyze(event)
+        for event in self.detector.flush():
+            yield self._analyze(event)
+
+    def stop(self):
+        self.source.close()
@@ -1,4 +1,8 @@
 from dog_translator import DogTranslator
+import numpy as np
+import json
+import os
+import tempfile
 import time
 
 def test_recording():
@@ -24,6 +28,10 @@ def test_recording():
     print(f"\n历史记录数量: {len(history)}")
 
 def test_full_features():
+    """完整流程测试：录音 5 秒（合成音频源，不需要声卡也不等待）、保存、分析、导出报告"""
+    from benchmark import kennel_audio
+    from streaming import ArraySource
+
     translator = DogTranslator()
     
     # 设置录音时长为5秒
@@ -34,27 +42,978 @@ def test_full_features():
     print(f"预期采样点数: {expected_samples}")
     
     print("\n开始录音测试...")
-    translator.start_recording()
+    audio, _ = kennel_audio(6, translator.sample_rate, seed=2)
+    translator.capture(ArraySource(audio, translator.sample_rate))
     
     # 验证录音长度
-    if translator.recording is not None:
-        actual_samples = len(translator.recording)
-        print(f"\n实际采样点数: {actual_samples}")
-        print(f"实际录音时长: {actual_samples/translator.sample_rate:.2f}秒")
-    
-    # 保存录音
-    translator.save_recording("test_bark.wav")
+    actual_samples = len(translator.recording)
+    print(f"\n实际采样点数: {actual_samples}")
+    print(f"实际录音时长: {actual_samples/translator.sample_rate:.2f}秒")
+    assert actual_samples == expected_samples
     
-    # 分析并显示结果
-    result = translator.analyze_bark(translator.recording)
-    print("\n详细分析结果:")
-    for emotion, score in result["emotions"].items():
-        print(f"{emotion}: {score:.2f}")
-    print(f"\n建议: {result['suggestions'][0]}")
-    
-    # 导出报告
-    translator.export_report()
-    print("\n报告已导出到 dog_analysis_report.txt")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 保存录音
+        assert translator.save_recording(os.path.join(tmp, "test_bark.wav"))
+        
+        # 分析并显示结果
+        result = translator.analyze_bark(translator.recording)
+        print("\n详细分析结果:")
+        for emotion, score in result["emotions"].items():
+            print(f"{emotion}: {score:.2f}")
+        print(f"\n建议: {result['suggestions'][0]}")
+        
+        # 导出报告
+        report_path = os.path.join(tmp, "dog_analysis_report.txt")
+        assert translator.export_report("txt", report_path)
+        with open(report_path, encoding="utf-8") as f:
+            assert f.read().count("主要情绪:") == 1
+        print(f"\n报告已导出到 {report_path}")
+
+def test_spectral_features():
+    """频谱特征测试：纯音的质心和主音高应接近其频率"""
+    from features import extract_features
+
+    sample_rate = 44100
+    t = np.arange(sample_rate) / sample_rate
+    tone = (0.5 * np.sin(2 * np.pi * 1500 * t)).astype(np.float32)
+    features = extract_features(tone.reshape(-1, 1), sample_rate)
+    print(f"频谱质心: {features['spectral_centroid']:.1f} Hz")
+    assert abs(features["spectral_centroid"] - 1500) < 50
+    assert abs(features["dominant_pitch"] - 1500) < 25
+    assert abs(features["rms"] - 0.5 / np.sqrt(2)) < 0.01
+
+    silence = extract_features(np.zeros(100), sample_rate)
+    assert silence["spectral_centroid"] == 0.0
+
+def test_pure_analyze():
+    """无状态分析测试：不依赖 self.recording，可并发调用"""
+    from concurrent.futures import ThreadPoolExecutor
+    from analysis import analyze
+
+    rng = np.random.default_rng(1)
+    clips = [(rng.standard_normal(22050) * 8000).astype(np.int16) for _ in range(4)]
+
+    # int16 与对应的 float32 (N, 1) 数组结果一致
+    pcm = analyze(clips[0], 22050)
+    floats = analyze((clips[0] / 32768.0).astype(np.float32).reshape(-1, 1), 22050)
+    assert pcm["emotions"] == floats["emotions"]
+    assert abs(pcm["features"]["spectral_centroid"] - floats["features"]["spectral_centroid"]) < 1
+
+    # 没有录音时 analyze_bark 也不应出错
+    translator = DogTranslator()
+    assert translator.recording is None
+    assert translator.analyze_bark(clips[1])["emotions"]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parallel = list(executor.map(lambda clip: analyze(clip, 22050), clips))
+    serial = [analyze(clip, 22050) for clip in clips]
+    assert [r["features"] for r in parallel] == [r["features"] for r in serial]
+
+def test_analyze_batch():
+    """向量化批量分析应与逐个 analyze 的结果一致（含长短不一的片段）"""
+    from analysis import analyze, analyze_batch
+
+    rng = np.random.default_rng(2)
+    clips = [(rng.standard_normal(n) * scale).astype(np.float32)
+             for n, scale in [(4000, 0.001), (9000, 0.3), (1500, 0.05), (12000, 0.02)]]
+    batch = analyze_batch(clips, 16000)
+    for clip, result in zip(clips, batch):
+        single = analyze(clip, 16000)
+        assert result["emotions"] == single["emotions"]
+        assert abs(result["features"]["spectral_centroid"] - single["features"]["spectral_centroid"]) < 1e-2
+        assert result["features"]["duration"] == single["features"]["duration"]
+
+    stacked = np.stack([clip[:1500] for clip in clips])
+    assert len(analyze_batch(stacked, 16000)) == 4
+    assert analyze_batch([], 16000) == [] and analyze_batch(np.zeros((0, 1500)), 16000) == []
+
+def test_history():
+    """历史记录测试：容量上限、时间淘汰和时间范围查询"""
+    from datetime import datetime, timedelta
+    from history import AnalysisHistory
+
+    base = datetime(2025, 1, 1)
+    history = AnalysisHistory(max_records=100)
+    for i in range(250):
+        history.append({"timestamp": base + timedelta(minutes=i),
+                        "emotions": {"calm": 0.8, "sleepy": 0.6}, "confidence": 0.85})
+    assert len(history) == 100
+
+    records = history.query(base + timedelta(minutes=200), base + timedelta(minutes=209))
+    assert len(records) == 10
+    assert records[0]["primary_emotion"] == ("calm", 0.8)
+    assert records[0]["suggestions"]
+    assert history.query(end_date=base + timedelta(minutes=149)) == []
+
+    aged = AnalysisHistory(max_records=None, max_age=60)
+    for i in range(10):
+        aged.append({"timestamp": base + timedelta(seconds=30 * i),
+                     "emotions": {"neutral": 0.5}, "confidence": 0.85})
+    assert len(aged) == 3
+
+    # 规则得分共享同一份元组，分类器的连续得分不进入驻留字典
+    import history as history_module
+    cached = len(history_module._emotion_cache)
+    for i in range(50):
+        aged.append({"timestamp": base, "emotions": {"calm": 0.5 + i / 1000}, "confidence": 0.5})
+    assert len(history_module._emotion_cache) == cached
+    assert history._records[-1].emotions is history._records[-2].emotions
+
+    translator = DogTranslator()
+    translator.analyze_bark(np.zeros(4410, dtype=np.float32))
+    assert len(translator.get_history()) == 1
+    assert len(translator.get_history(start_date=datetime.now() + timedelta(days=1))) == 0
+
+def test_database():
+    """数据库测试：后台批量写入、JSON 特征和 SQL 聚合查询"""
+    from datetime import datetime
+    from database import DogTranslatorDB
+    from benchmark import make_results
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DogTranslatorDB(os.path.join(tmp, "records.db"), batch_size=100)
+        db.start_writer()
+        for result in make_results(3000):
+            db.enqueue(result)
+        db.flush()
+
+        assert db.emotion_histogram() == {"calm": 1000, "excited": 1000, "neutral": 1000}
+        hourly = db.hourly_stats()
+        assert hourly[0][:2] == ("2025-01-01 00:00", 3000)
+
+        rows = db.query_range(datetime(2025, 1, 1, 0, 0, 10), datetime(2025, 1, 1, 0, 0, 19), "calm").fetchall()
+        assert len(rows) == 3
+        assert json.loads(rows[0][5])["volume"] == 0.01
+        assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        # 写入出错（非 sqlite 异常）时记录日志并继续，flush 不会卡住
+        def failing_insert(conn, rows):
+            raise OSError("磁盘已满")
+        insert = db._insert
+        db._insert = failing_insert
+        db.enqueue(make_results(1)[0])
+        db.flush()
+        db._insert = insert
+        db.enqueue(make_results(1)[0])
+        db.flush()
+        assert sum(db.emotion_histogram().values()) == 3001
+        db.close()
+
+def test_history_pages():
+    """历史记录分页：键集分页不重不漏、筛选走索引、情绪列表"""
+    from datetime import datetime
+    from database import DogTranslatorDB, HistoryPager
+    from benchmark import make_results
+    from gui import parse_date
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DogTranslatorDB(os.path.join(tmp, "records.db"))
+        results = make_results(3000)
+        for result in results[:10]:  # 同一时间的多条记录靠 id 区分先后
+            result["timestamp"] = results[0]["timestamp"]
+        db.save_records(results)
+
+        pager = HistoryPager(db, page_size=256)
+        rows = []
+        while not pager.exhausted:
+            rows.extend(pager.next_page())
+        assert pager.loaded == 3000 and len({row[0] for row in rows}) == 3000
+        assert [row[0] for row in rows] == list(range(3000, 0, -1))
+
+        start, end = parse_date("2025-01-01 00:10"), parse_date("2025-01-01 00:19")
+        pager = HistoryPager(db, 150, start, end, "calm")
+        filtered = pager.next_page() + pager.next_page()
+        assert len(filtered) == 181 and pager.exhausted and pager.next_page() == []
+        assert all(row[2] == "calm" and "00:10:00" <= row[1][11:] <= "00:19:00" for row in filtered)
+        assert parse_date("2025-01-01", end=True) == datetime(2025, 1, 1, 23, 59, 59, 999999)
+        assert db.emotions() == ["calm", "excited", "neutral"]
+
+        for emotion, before in ((None, ("2025-01-01 00:30:00", 5)), ("calm", ("2025-01-01 00:30:00", 5))):
+            where, params = db._where(start, None, emotion)
+            plan = db.conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM recordings" + where + " AND (timestamp, id) < (?, ?)"
+                " ORDER BY timestamp DESC, id DESC LIMIT 10", params + list(before)).fetchall()
+            detail = " ".join(row[-1] for row in plan)
+            assert "INDEX" in detail and "TEMP B-TREE" not in detail
+        db.close()
+
+def test_export_report():
+    """报告导出测试：增量追加、CSV/JSONL/HTML 以及从数据库导出"""
+    from datetime import timedelta
+    from benchmark import make_results
+    from database import DogTranslatorDB
+    from report import export_db_report
+
+    results = make_results(6)
+    translator = DogTranslator()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.txt")
+        for result in results[:4]:
+            translator.analysis_history.append(result)
+        assert translator.export_report("txt", path, incremental=True)
+        for result in results[4:]:
+            translator.analysis_history.append(result)
+        translator.export_report("txt", path, incremental=True)
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        assert text.count("狗语翻译分析报告") == 1
+        assert text.count("主要情绪:") == 6
+
+        translator.export_report("csv", os.path.join(tmp, "report.csv"))
+        with open(os.path.join(tmp, "report.csv"), encoding="utf-8") as f:
+            assert len(f.readlines()) == 7
+        assert not translator.export_report("pdf", os.path.join(tmp, "report.pdf"))
+
+        db = DogTranslatorDB(os.path.join(tmp, "records.db"))
+        db.save_records(results)
+        html_path = os.path.join(tmp, "report.html")
+        assert export_db_report(db, html_path, "html") == 6
+        with open(html_path, encoding="utf-8") as f:
+            assert "共 6 条记录" in f.read()
+        jsonl_path = os.path.join(tmp, "report.jsonl")
+        export_db_report(db, jsonl_path, "jsonl", incremental=True)
+        db.save_record(dict(results[0], timestamp=results[-1]["timestamp"] + timedelta(seconds=1)))
+        assert export_db_report(db, jsonl_path, "jsonl", incremental=True) == 1
+
+        # 与上次最后一条同一时间的新记录也要导出，已导出的不重复
+        last_time = results[-1]["timestamp"] + timedelta(seconds=1)
+        db.save_records([dict(results[1], timestamp=last_time), dict(results[2], timestamp=last_time)])
+        assert export_db_report(db, jsonl_path, "jsonl", incremental=True) == 2
+        assert export_db_report(db, jsonl_path, "jsonl", incremental=True) == 0
+        db.save_record(dict(results[3], timestamp=last_time))
+        assert export_db_report(db, jsonl_path, "jsonl", incremental=True) == 1
+        with open(jsonl_path, encoding="utf-8") as f:
+            assert len(f.readlines()) == 10
+        db.close()
+
+        translator.analysis_history.append(dict(results[0], timestamp=results[-1]["timestamp"]))
+        assert translator.export_report("txt", path, incremental=True)
+        with open(path, encoding="utf-8") as f:
+            assert f.read().count("主要情绪:") == 7
+
+def run_event_loop(worker, interval=0.01, stop_after=None, timeout=5):
+    """无界面的事件循环模拟：像 root.after 一样定期 drain，返回 (消息, 后台仍在运行时的空轮询次数)"""
+    messages = []
+    idle_polls = 0
+    start = time.perf_counter()
+    while not messages and time.perf_counter() - start < timeout:
+        if stop_after is not None and time.perf_counter() - start > stop_after:
+            worker.stop()
+        busy = worker.busy()
+        messages.extend(worker.drain())
+        if not messages and busy:
+            idle_polls += 1
+        time.sleep(interval)
+    return messages, idle_polls
+
+def test_capture_worker():
+    """后台录音测试：主线程不被录音和分析阻塞，停止能真正取消录音"""
+    from streaming import ArraySource
+    from worker import CaptureWorker
+
+    translator = DogTranslator()
+    translator.max_duration = 1
+    sample_rate = translator.sample_rate
+    audio = (np.random.default_rng(3).standard_normal(sample_rate) * 0.05).astype(np.float32)
+
+    worker = CaptureWorker(translator)
+    worker.start(ArraySource(audio, sample_rate, blocksize=441, realtime=True))
+    # drain 不等待后台线程：录音进行中立即返回空列表
+    assert worker.drain() == [] and worker.busy()
+    messages, idle_polls = run_event_loop(worker, stop_after=0.3)
+    print(f"录音期间事件循环空轮询次数: {idle_polls}")
+
+    assert messages and messages[0][0] == "result"
+    assert len(translator.recording) < sample_rate  # 录音在 0.3 秒左右被取消
+    assert idle_polls > 1  # 录音和分析期间事件循环一直在运转
+    assert len(translator.get_history()) == 1
+    worker.join()
+    assert not worker.busy()
+
+def test_visualizer():
+    """可视化测试（Agg 后端）：包络只重算新增列，没有新数据时跳过"""
+    from types import SimpleNamespace
+    from visualizer import AudioVisualizer
+
+    buffer = np.linspace(-1, 1, 1000, dtype=np.float32).reshape(-1, 1)
+    translator = SimpleNamespace(sample_rate=1000, max_duration=1, recording=buffer[:250])
+    visualizer = AudioVisualizer(translator, width=10)
+    visualizer.update_plot(0)
+    visualizer.render()
+    assert visualizer._columns_done == 3
+
+    translator.recording = buffer[:1000]
+    visualizer.update_plot(1)
+    visualizer.update_plot(2)
+    assert visualizer.frames_rendered == 2 and visualizer.frames_skipped == 1
+    assert np.allclose(visualizer.envelope_min, buffer[::100, 0])
+    assert np.allclose(visualizer.envelope_max, buffer[99::100, 0])
+
+def test_streaming():
+    """流式分析测试（合成信号，不需要声卡）"""
+    from streaming import ArraySource, RingBuffer
+
+    # 环形缓冲区回绕后应按时间顺序返回最新数据
+    ring = RingBuffer(4)
+    ring.write([1, 2, 3])
+    ring.write([4, 5, 6])
+    assert list(ring.latest(4)) == [3, 4, 5, 6]
+
+    translator = DogTranslator()
+    sample_rate = translator.sample_rate
+    t = np.arange(sample_rate) / sample_rate
+    audio = (0.5 * np.sin(2 * np.pi * 800 * t)).astype(np.float32)
+
+    source = ArraySource(audio, sample_rate, blocksize=4096)
+    results = list(translator.stream(source, window=0.5, hop=0.05))
+    print(f"流式分析结果数量: {len(results)}")
+    # 1 秒音频，0.5 秒窗口，50ms 步长 -> 11 个结果
+    assert len(results) == 11
+    assert results[0]["stream_time"] == 0.5
+    assert all(result["emotions"] for result in results)
+    assert translator.get_history() == []
+
+    # 双声道音频源在降采样和不降采样两条路径上都先混成单声道，结果与单声道相同
+    stereo = np.stack((audio, audio), axis=1)
+    for analysis_rate in (translator.stream_analysis_rate, None):
+        translator.stream_analysis_rate = analysis_rate
+        mono = list(translator.stream(ArraySource(audio, sample_rate, blocksize=4096), window=0.5, hop=0.05))
+        mixed = list(translator.stream(ArraySource(stereo, sample_rate, blocksize=4096, channels=2),
+                                       window=0.5, hop=0.05))
+        assert len(mixed) == len(mono) == 11
+        for a, b in zip(mixed, mono):
+            assert abs(a["features"]["spectral_centroid"] - b["features"]["spectral_centroid"]) < 1e-3
+            assert abs(a["features"]["duration"] - 0.5) < 1e-3
+
+def test_batch():
+    """批量分析测试（进程池 + JSONL 输出）"""
+    import scipy.io.wavfile as wav
+    from batch import find_wav_files, run_batch
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(0)
+        for i in range(3):
+            audio = (rng.standard_normal(22050) * 3000).astype(np.int16)
+            wav.write(os.path.join(tmp, f"bark_{i}.wav"), 22050, audio)
+
+        files = find_wav_files([tmp])
+        output = os.path.join(tmp, "results.jsonl")
+        stats = run_batch(files, workers=1, chunksize=2, output=output)
+        print(f"批量分析吞吐量: {stats['files_per_sec']:.1f} 文件/秒")
+
+        with open(output, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert stats["files"] == 3 and stats["errors"] == 0
+        assert [os.path.basename(r["file"]) for r in records] == ["bark_0.wav", "bark_1.wav", "bark_2.wav"]
+        assert records[0]["features"]["duration"] == 1.0
+
+def test_onset():
+    """狗叫起止检测测试（只分析有狗叫的片段）"""
+    from benchmark import kennel_audio
+    from onset import detect_barks
+    from streaming import ArraySource
+
+    translator = DogTranslator()
+    sample_rate = translator.sample_rate
+    audio, positions = kennel_audio(10, sample_rate, seed=1)
+    events = detect_barks(audio, sample_rate)
+    print(f"检测到的狗叫: {len(events)} / {len(positions)}")
+    assert len(events) == len(positions)
+    for event, (start, end) in zip(events, positions):
+        assert abs(event.start - start) < 0.02 * sample_rate
+        assert abs(event.end - end) < 0.15 * sample_rate
+
+    results = translator.analyze_barks(audio)
+    assert len(results) == len(positions)
+    assert results[0]["start_time"] < results[0]["end_time"]
+    assert len(translator.get_history()) == len(positions)
+
+    source = ArraySource(audio, sample_rate, blocksize=1024)
+    streamed = list(translator.monitor(source))
+    assert [r["start_time"] for r in streamed] == [r["start_time"] for r in results]
+
+def test_feature_cache():
+    """特征缓存测试：相同音频只提取一次特征，改阈值只重新判断规则"""
+    from analysis import analyze, rescore
+    from feature_cache import FeatureCache
+
+    rng = np.random.default_rng(4)
+    clips = [(rng.standard_normal(22050) * 0.2).astype(np.float32) for _ in range(3)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FeatureCache(os.path.join(tmp, "cache.db"), max_entries=2)
+        first = analyze(clips[0], 22050, cache=cache)
+        second = analyze(clips[0].copy(), 22050, cache=cache)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert first["emotions"] == second["emotions"] == analyze(clips[0], 22050)["emotions"]
+        assert analyze(clips[0], 44100, cache=cache) and cache.misses == 2
+
+        # 新阈值下批量重新判断与完整分析一致
+        thresholds = {'high_freq_threshold': 100000, 'high_volume_threshold': 0.01,
+                      'freq_std_threshold': 100, 'volume_change_threshold': 0.01}
+        rescored = rescore([first["features"]], thresholds)
+        assert rescored[0]["emotions"] == analyze(clips[0], 22050, thresholds)["emotions"]
+
+        # 超出上限时淘汰最久未使用的条目
+        analyze(clips[0], 22050, cache=cache)
+        analyze(clips[1], 22050, cache=cache)
+        assert len(cache) == 2
+        analyze(clips[0], 22050, cache=cache)
+        assert cache.hits == 3
+        cache.close()
+
+def write_labeled_set(folder, classes=(("calm", 300, 0.002), ("anxious", 3000, 0.5)), count=4, seed=5):
+    """按情绪分目录写入合成录音：每类为 (情绪, 频率, 幅度)，噪声幅度与音量成比例"""
+    import scipy.io.wavfile as wav
+    rng = np.random.default_rng(seed)
+    t = np.arange(22050) / 22050
+    for label, freq, amplitude in classes:
+        os.makedirs(os.path.join(folder, label))
+        for i in range(count):
+            tone = np.sin(2 * np.pi * freq * (1 + 0.05 * i) * t) * amplitude
+            noise = rng.standard_normal(len(t)) * amplitude * 0.4
+            wav.write(os.path.join(folder, label, f"{i}.wav"), 22050, ((tone + noise) * 32767).astype(np.int16))
+
+def test_calibrate():
+    """阈值校准测试：一次广播评估多组阈值，最佳结果写回 settings.json"""
+    import scipy.io.wavfile as wav
+    from analysis import analyze
+    from calibrate import calibrate, extract_dataset, grid_candidates, load_labeled, save_thresholds, sweep
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_labeled_set(tmp)
+        features, labels = extract_dataset(load_labeled(tmp))
+        candidates = grid_candidates(4)
+        accuracy, per_emotion = sweep(features, labels, candidates)
+        assert accuracy.shape == (256,) and set(per_emotion) == {"anxious", "calm"}
+
+        # 广播结果与逐组完整分析一致
+        index = int(np.argmax(accuracy))
+        thresholds = {name: values[index] for name, values in candidates.items()}
+        predicted = [analyze(wav.read(path)[1], 22050, thresholds)["primary_emotion"][0]
+                     for path, _ in load_labeled(tmp)]
+        assert np.mean(np.array(predicted) == labels) == accuracy[index]
+
+        report = calibrate(features, labels, candidates)
+        print(f"校准准确率: {report['accuracy']:.0%}")
+        assert report["accuracy"] == 1.0
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            save_thresholds(report["thresholds"])
+            with open("settings.json") as f:
+                saved = json.load(f)
+        finally:
+            os.chdir(cwd)
+        assert saved["high_freq_threshold"] == report["thresholds"]["high_freq_threshold"]
+        assert saved["sample_rate"] == 44100
+
+        translator = DogTranslator()
+        translator.apply_settings(saved)
+        assert translator.thresholds == report["thresholds"]
+
+def test_classifier():
+    """可替换分类器测试：训练 softmax 模型、保存为 npz、批量推理"""
+    import scipy.io.wavfile as wav
+    from analysis import analyze, analyze_batch, compute_features_batch, stack_clips
+    from calibrate import load_labeled
+    from classifier import RuleClassifier, SoftmaxClassifier, load_classifier, train
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_labeled_set(tmp, (("calm", 300, 0.01), ("anxious", 3000, 0.3), ("playful", 900, 0.1)), count=6)
+        items = load_labeled(tmp)
+        model_path = os.path.join(tmp, "model.npz")
+        train(items).save(model_path)
+        model = load_classifier(model_path)
+        assert isinstance(model, SoftmaxClassifier) and model.labels == ["anxious", "calm", "playful"]
+        assert isinstance(load_classifier(None), RuleClassifier)
+
+        clips = [wav.read(path)[1] for path, _ in items]
+        results = analyze_batch(clips, 22050, classifier=model)
+        predicted = [r["primary_emotion"][0] for r in results]
+        print(f"模型预测: {predicted}")
+        assert predicted == [label for _, label in items]
+        assert all(r["confidence"] == r["primary_emotion"][1] for r in results)
+        single = analyze(clips[0], 22050, classifier=model)
+        assert abs(single["confidence"] - results[0]["confidence"]) < 1e-3
+
+        # 规则分类器与不传分类器的结果一致
+        assert analyze_batch(clips, 22050, classifier=RuleClassifier())[0]["emotions"] == \
+            analyze_batch(clips, 22050)[0]["emotions"]
+
+        # 批量推理对每个片段给出结果（耗时见 benchmark.bench_classifier）
+        stacked, lengths = stack_clips(clips * 20)
+        features = compute_features_batch(stacked, 22050, lengths, mfcc=True)
+        predictions = model.predict(features)
+        assert [max(emotions, key=emotions.get) for emotions, _ in predictions] == \
+            [label for _, label in items] * 20
+
+        translator = DogTranslator()
+        translator.sample_rate = 22050
+        translator.apply_settings({"classifier_model": model_path})
+        assert translator.analyze_bark(clips[-1])["primary_emotion"][0] == "playful"
+
+        # 服务启动时读取 settings.json，--model 覆盖其中的模型
+        from server import make_translator
+        from settings import Settings
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            assert make_translator().classifier is None and Settings().settings["classifier_model"] is None
+            assert isinstance(make_translator(model_path).classifier, SoftmaxClassifier)
+            settings = dict(Settings().settings, classifier_model=model_path)
+            with open("settings.json", "w") as f:
+                json.dump(settings, f)
+            assert isinstance(make_translator().classifier, SoftmaxClassifier)
+        finally:
+            os.chdir(cwd)
+
+def test_multichannel():
+    """多声道 / 多设备录音测试（合成音频源，不需要声卡）"""
+    from analysis import analyze
+    from benchmark import synth_bark
+    from streaming import ArraySource, MultiDeviceSource
+
+    translator = DogTranslator()
+    translator.max_duration = 1
+    sample_rate = translator.sample_rate
+    rng = np.random.default_rng(3)
+    t = np.arange(sample_rate) / sample_rate
+    audio = np.zeros((sample_rate, 3), dtype=np.float32)
+    audio[:, 0] = rng.standard_normal(sample_rate) * 0.001
+    audio[:8820, 1] = synth_bark(0.2, sample_rate, 500, rng)
+    audio[:, 2] = 0.5 * np.sin(2 * np.pi * 3000 * t)
+
+    recording = translator.capture(ArraySource(audio, sample_rate, blocksize=1000, channels=3))
+    assert recording.shape == (sample_rate, 3)
+    results = translator.analyze_channels(recording)
+    assert [r["channel"] for r in results] == [0, 1, 2]
+    for i, result in enumerate(results):
+        expected = analyze(audio[:, i], sample_rate, analysis_rate=translator.analysis_rate)
+        assert result["emotions"] == expected["emotions"]
+    assert [r["channel"] for r in translator.get_history()] == [0, 1, 2]
+
+    # 两个块大小不同的设备按采样点对齐合并
+    source = MultiDeviceSource([ArraySource(audio[:, :2], sample_rate, 1000, channels=2),
+                                ArraySource(audio[:, 2], sample_rate, 700)])
+    assert source.channel_ids == ["0:0", "0:1", "1:0"]
+    recording = translator.capture(source)
+    assert np.array_equal(recording, audio[:len(recording)])
+    assert len(recording) >= sample_rate - 1000
+
+    # 流式分析和持续监听同样按 device / channels 打开输入
+    import streaming
+    opened = []
+
+    def fake_open_input(rate, device=None, channels=1, blocksize=1024):
+        opened.append((rate, device, channels))
+        return ArraySource(audio[:, :channels], rate, 1000, channels=channels)
+
+    open_input = streaming.open_input
+    streaming.open_input = fake_open_input
+    try:
+        translator.device, translator.channels = ["a", "b"], 2
+        assert list(translator.stream(window=0.5, hop=0.25))
+        list(translator.monitor())
+    finally:
+        streaming.open_input = open_input
+    assert opened == [(sample_rate, ["a", "b"], 2)] * 2
+
+def test_memory_usage():
+    """int16 存储与内存映射测试：分析长录音时（包括默认的降采样路径）峰值内存只是输入的一小部分"""
+    import tracemalloc
+    from analysis import analyze, compute_features
+    from audio_io import read_wav, write_wav
+    from resample import ANALYSIS_RATE, resample
+    from streaming import ArraySource
+
+    sample_rate = 44100
+    rng = np.random.default_rng(6)
+    audio = (rng.standard_normal(sample_rate * 60) * 0.1).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long.wav")
+        write_wav(path, audio, sample_rate)
+        assert os.path.getsize(path) == 44 + 2 * len(audio)
+        _, data = read_wav(path)
+        assert data.dtype == np.int16 and isinstance(data.base, np.memmap) or hasattr(data, "_mmap")
+
+        for analysis_rate in (ANALYSIS_RATE, None):
+            analyze(data[:sample_rate * 10], sample_rate, analysis_rate=analysis_rate)  # 预热工作缓冲区和滤波器
+            tracemalloc.start()
+            result = analyze(data, sample_rate, analysis_rate=analysis_rate)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"分析采样率 {analysis_rate}: 输入 {data.nbytes / 1e6:.1f} MB, 分析峰值内存 {peak / 1e6:.2f} MB")
+            assert peak < data.nbytes / 4
+            if analysis_rate:
+                expected = compute_features(resample(audio, sample_rate, analysis_rate), analysis_rate)
+            else:
+                expected = compute_features(audio, sample_rate)
+            for name in ("spectral_centroid", "volume", "rms", "duration"):
+                assert abs(result["features"][name] - expected[name]) <= 1e-3 * abs(expected[name])
+        del data, _
+
+        translator = DogTranslator()
+        translator.max_duration = 1
+        translator.storage_dtype = "int16"
+        recording = translator.capture(ArraySource(audio, sample_rate))
+        assert recording.dtype == np.int16
+        assert translator.save_recording(os.path.join(tmp, "clip.wav"))
+        assert os.path.getsize(os.path.join(tmp, "clip.wav")) == 44 + 2 * len(recording)
+
+def test_work_buffers():
+    """长片段批量提取按帧分块：线程保留的工作缓冲区有固定上限，结果与逐段提取一致"""
+    import features
+    from analysis import analyze_channels
+
+    sample_rate = 16000
+    rng = np.random.default_rng(8)
+    audio = (rng.standard_normal((sample_rate * 120, 2)) * 0.1).astype(np.float32)
+    results = analyze_channels(audio, sample_rate)
+    retained = sum(buffer.nbytes for buffer in features._work.buffers[1:])
+    print(f"输入 {audio.nbytes / 1e6:.1f} MB, 保留的工作缓冲区 {retained / 1e6:.1f} MB")
+    assert retained < 16e6
+    for channel, result in enumerate(results):
+        expected = features.extract_features(audio[:, channel], sample_rate)
+        for name in ("spectral_centroid", "spectral_bandwidth", "rms"):
+            assert abs(result["features"][name] - expected[name]) <= 1e-4 * abs(expected[name])
+
+def test_segment_recorder():
+    """连续分段录音测试：分段轮转、保留策略、狗叫写入数据库"""
+    from benchmark import kennel_audio
+    from database import DogTranslatorDB
+    from recorder import SegmentRecorder
+    from streaming import ArraySource
+
+    translator = DogTranslator()
+    sample_rate = 22050
+    audio, positions = kennel_audio(12, sample_rate, seed=7)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DogTranslatorDB(os.path.join(tmp, "records.db"))
+        segment_bytes = 44 + 2 * 5 * sample_rate
+        recorder = translator.record_continuously(
+            os.path.join(tmp, "segments"), ArraySource(audio, sample_rate, blocksize=1000), db=db,
+            segment_seconds=5, max_total_bytes=2 * segment_bytes)
+        recorder.join(timeout=10)
+
+        stats = recorder.stats()
+        print(f"分段录音统计: {stats}")
+        assert stats["segments_written"] == 3 and stats["segments_deleted"] == 1
+        assert stats["dropped_frames"] == 0 and stats["queue_depth"] == 0 and stats["errors"] == 0
+        assert stats["barks_detected"] == len(positions)
+        files = recorder.segment_files()
+        assert len(files) == 2 and all(os.path.exists(path) for path in files)
+        assert os.path.getsize(files[-1]) == 44 + 2 * 2 * sample_rate
+
+        rows = list(db.query_range())
+        assert len(rows) == len(positions)
+        # 被保留策略删除的分段不再被引用，它的狗叫记录仍在，audio_path 为空
+        assert rows[0][4] is None and 0 <= json.loads(rows[0][5])["start_time"] < 5
+        assert sorted({row[4] for row in rows if row[4] is not None}) == files
+        db.close()
+
+        # 重新打开目录时，已有分段的开始时间取自文件名而不是修改时间
+        os.utime(files[0], (time.time() + 3600, time.time() + 3600))
+        reopened = SegmentRecorder(translator, ArraySource(audio, sample_rate), os.path.join(tmp, "segments"))
+        assert reopened.segment_files() == files
+        assert abs(reopened._files[0][2] - recorder._files[0][2]) < 1e-3
+
+        # 删除失败的分段留在列表中并计入总大小，之后重试
+        directory = os.path.join(tmp, "retry")
+        recorder = SegmentRecorder(translator, ArraySource(audio, sample_rate), directory, max_total_bytes=10)
+        stuck = os.path.join(directory, "segment_stuck.wav")
+        os.makedirs(stuck)  # 目录无法用 os.remove 删除
+        recorder._files.extend([(stuck, 100, 0.0), (os.path.join(directory, "segment_new.wav"), 100, 1.0)])
+        recorder._apply_retention()
+        assert recorder.segment_files()[0] == stuck and recorder.segments_deleted == 0
+        os.rmdir(stuck)
+        recorder._apply_retention()
+        assert len(recorder.segment_files()) == 1
+
+        # 缺少 soundfile 时 flac 格式在创建时就报错
+        import importlib.util
+        if importlib.util.find_spec("soundfile") is None:
+            try:
+                SegmentRecorder(translator, ArraySource(audio, sample_rate), os.path.join(tmp, "flac"), format='flac')
+                assert False, "应当抛出 ImportError"
+            except ImportError:
+                pass
+
+def test_metrics():
+    """性能统计测试：分阶段计时、计数器、Prometheus 文本和关闭统计"""
+    from analysis import analyze, analyze_batch
+    from database import DogTranslatorDB
+    from metrics import metrics
+
+    sample_rate = 22050
+    t = np.linspace(0, 0.5, sample_rate // 2, endpoint=False)
+    clip = (0.3 * np.sin(2 * np.pi * 800 * t)).astype(np.float32)
+    metrics.reset()
+    try:
+        analyze(clip, sample_rate)
+        results = analyze_batch([clip, clip[:5000]], sample_rate)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DogTranslatorDB(os.path.join(tmp, "records.db"))
+            db.save_records(results)
+            db.close()
+
+        stats = metrics.stats()
+        print(f"各阶段耗时: {stats['stages']}")
+        assert stats["counters"]["clips_analyzed"] == 3
+        assert stats["counters"]["db_rows_written"] == 2
+        assert stats["stages"]["fft"]["count"] == 2 and stats["stages"]["features"]["count"] == 2
+        assert stats["stages"]["rules"]["count"] == 2 and stats["stages"]["suggestions"]["count"] == 3
+        assert stats["stages"]["features"]["total_ms"] >= stats["stages"]["fft"]["total_ms"]
+
+        text = metrics.prometheus_text()
+        assert "dog_translator_clips_analyzed_total 3" in text
+        assert 'dog_translator_stage_seconds_count{stage="fft"} 2' in text
+        assert 'dog_translator_stage_seconds_bucket{stage="fft",le="+Inf"} 2' in text
+
+        # 降采样路径：长片段逐块降采样、逐块提取特征，各阶段每个片段仍各记一次
+        from resample import ANALYSIS_RATE, RESAMPLE_BLOCK
+        from streaming import ArraySource
+        metrics.reset()
+        long_clip = np.tile(clip, 2 * RESAMPLE_BLOCK // len(clip) + 1)
+        analyze(long_clip, sample_rate, analysis_rate=ANALYSIS_RATE)
+        analyze(clip, sample_rate, analysis_rate=ANALYSIS_RATE)
+        stages = metrics.stats()["stages"]
+        assert stages["resample"]["count"] == 2 and stages["fft"]["count"] == 2
+        assert stages["features"]["total_ms"] >= stages["fft"]["total_ms"] + stages["resample"]["total_ms"]
+
+        # 默认设置：整段按原采样率分析，流式分析降采样
+        metrics.reset()
+        translator = DogTranslator()
+        translator.analyze_bark(clip, sample_rate)
+        assert "resample" not in metrics.stats()["stages"]
+        assert metrics.stats()["stages"]["fft"]["count"] == 1
+        list(translator.stream(ArraySource(clip, sample_rate), window=0.25, hop=0.05))
+        stages = metrics.stats()["stages"]
+        assert stages["resample"]["count"] > 0 and stages["fft"]["count"] > 1
+
+        analyzed = metrics.stats()["counters"]["clips_analyzed"]
+        metrics.enabled = False
+        analyze(clip, sample_rate)
+        assert metrics.stats()["counters"]["clips_analyzed"] == analyzed
+    finally:
+        metrics.enabled = True
+        metrics.reset()
+
+def test_benchmark_suite():
+    """基准测试套件：无声卡运行、JSON 输出和结果比较"""
+    import copy
+    from benchmark import SIGNAL_KINDS, compare, main, run_suite, synth_signal
+
+    for kind in SIGNAL_KINDS:
+        assert synth_signal(kind, 0.5, 8000).shape == (4000, 1)
+    report = run_suite(["analyze_bark", "export_report"], quick=True)
+    json.dumps(report)
+    assert report["results"]["export_report"]["records"] == 5000
+    assert len(report["results"]["analyze_bark"]) == 2 * len(SIGNAL_KINDS)
+
+    # 基准结果快一倍时，当前结果应被判为退化
+    baseline = copy.deepcopy(report)
+    baseline["results"]["export_report"]["csv"]["ms"] /= 2
+    rows = {name: regressed for name, _, _, _, regressed in compare(report, baseline)}
+    assert rows["export_report.csv.ms"] and not rows["export_report.txt.ms"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.json")
+        assert main(["--quick", "--only", "fft", "--output", path]) == 0
+        with open(path, encoding="utf-8") as f:
+            assert "fft" in json.load(f)["results"]
+        assert main(["--quick", "--only", "fft", "--compare", path, "--tolerance", "10"]) == 0
+
+def test_lazy_imports():
+    """导入分析核心和服务模块时不加载声卡、绘图和界面库"""
+    from benchmark import IMPORT_MODULES, import_profile
+
+    for module in IMPORT_MODULES:
+        profile = import_profile(module)
+        print(f"import {module}: {profile['ms']:.1f} ms（不含 numpy {profile['without_numpy_ms']:.1f} ms）")
+        assert profile["heavy"] == [], f"{module} 加载了 {profile['heavy']}"
+
+def test_resample():
+    """降采样测试：抗混叠、流式与整段结果一致、任意采样率的 WAV 按实际时长和频率分析"""
+    from audio_io import write_wav
+    from benchmark import kennel_audio
+    from onset import analyze_events, detect_barks
+    from resample import StreamResampler, get_resample_filter, resample, resample_blocks
+    from streaming import ArraySource, BarkStream
+
+    assert get_resample_filter(44100, 16000) is get_resample_filter(44100, 16000)
+    assert get_resample_filter(44100, 16000)[:2] == (160, 441)
+
+    sample_rate = 44100
+    t = np.arange(sample_rate) / sample_rate
+    tone = resample(np.sin(2 * np.pi * 1000 * t), sample_rate, 16000)
+    alias = resample(np.sin(2 * np.pi * 12000 * t), sample_rate, 16000)
+    assert len(tone) == 16000
+    assert abs(np.abs(tone[1000:-1000]).max() - 1) < 0.01
+    assert np.abs(alias[1000:-1000]).max() < 0.001  # 12 kHz 高于新的奈奎斯特频率，应被滤除
+
+    rng = np.random.default_rng(9)
+    noise = rng.standard_normal(sample_rate).astype(np.float32)
+    resampler = StreamResampler(sample_rate, 16000)
+    blocks, start = [], 0
+    while start < len(noise):
+        size = int(rng.integers(1, 4000))
+        blocks.append(resampler.process(noise[start:start + size]))
+        start += size
+    blocks.append(resampler.flush())
+    assert np.allclose(np.concatenate(blocks), resample(noise, sample_rate, 16000), atol=1e-5)
+
+    translator = DogTranslator()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for rate in (22050, 48000):
+            path = os.path.join(tmp, f"tone_{rate}.wav")
+            t = np.arange(2 * rate) / rate
+            write_wav(path, 0.5 * np.sin(2 * np.pi * 1500 * t), rate)
+            results.append(translator.analyze_file(path))
+        for result in results:
+            assert abs(result["features"]["duration"] - 2.0) < 1e-3
+            assert abs(result["features"]["dominant_pitch"] - 1500) < 20
+        assert abs(results[0]["features"]["spectral_centroid"] - results[1]["features"]["spectral_centroid"]) < 50
+
+    # 流式狗叫检测在 16 kHz 上进行，事件时间仍以秒为单位
+    audio, positions = kennel_audio(5, sample_rate, bark_fraction=0.15, seed=6)
+    events = list(BarkStream(translator, ArraySource(audio, sample_rate, blocksize=1024)))
+    assert len(events) == len(positions)
+    assert abs(events[0]["start_time"] - positions[0][0] / sample_rate) < 0.02
+
+    # 整段分析时逐块降采样（多声道 int16 输入），事件和片段与先整段降采样再检测一致
+    stereo = (np.stack((audio, audio), axis=1) * 32767).astype(np.int16)
+    offline = resample(stereo.mean(axis=1) / 32768, sample_rate, 16000)
+    assert np.allclose(np.concatenate(list(resample_blocks(stereo, sample_rate, 16000))), offline, atol=1e-5)
+    results = analyze_events(stereo, sample_rate, analysis_rate=16000)
+    expected = detect_barks(offline, 16000)
+    assert [(r["start_time"], r["end_time"]) for r in results] == [(e.start / 16000, e.end / 16000) for e in expected]
+
+def test_vector_index():
+    """相似狗叫索引：分块 kNN 与暴力搜索一致、随写入增量更新、重新打开时补齐索引"""
+    from database import DogTranslatorDB
+    from similarity import VectorIndex, embed_features
+
+    rng = np.random.default_rng(3)
+    features_list = [{"spectral_centroid": float(c), "spectral_bandwidth": float(b), "volume": float(v),
+                      "duration": float(d)}
+                     for c, b, v, d in zip(rng.uniform(300, 4000, 500), rng.uniform(200, 2000, 500),
+                                           rng.uniform(0.005, 0.5, 500), rng.uniform(0.1, 2, 500))]
+    vectors = embed_features(features_list)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-6)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(os.path.join(tmp, "index"))
+        index.add(np.arange(1, 501), vectors)
+        expected = np.argsort(-(vectors @ vectors[7]))[:5] + 1
+        assert [i for i, _ in index.query(vectors[7], k=5, chunk=64)] == expected.tolist()
+        assert [i for i, _ in index.query(vectors[7], k=4, exclude=8)] == expected[1:].tolist()
+
+        path = os.path.join(tmp, "records.db")
+        db = DogTranslatorDB(path, vector_index=True)
+        results = [{"primary_emotion": ("calm", 0.8), "emotions": {"calm": 0.8}, "features": features}
+                   for features in features_list]
+        db.save_records(results[:300])
+        db.save_record(results[300])
+        db.start_writer()
+        for result in results[301:]:
+            db.enqueue(result)
+        db.flush()
+        assert len(db.vectors) == 500 and db.vectors.last_id == 500
+
+        similar = db.find_similar(8, k=4)
+        assert [row[0] for row in similar] == expected[1:].tolist()
+        assert similar[0][3] == "calm" and similar[0][1] > similar[-1][1]
+        assert db.find_similar(features=features_list[7], k=1)[0][0] == 8
+        db.close()
+
+        # 索引文件丢失或落后时，打开数据库会从 sqlite 补齐
+        os.remove(path + ".vectors.f32")
+        db = DogTranslatorDB(path, vector_index=True)
+        assert len(db.vectors) == 500
+        assert [row[0] for row in db.find_similar(8, k=4)] == expected[1:].tolist()
+        db.close()
+
+def test_shared_ring():
+    """共享内存环形缓冲区：合成生产者、溢出检测、跨进程零拷贝读取"""
+    import multiprocessing
+    import threading
+    from benchmark import kennel_audio
+    from shared_ring import RingConsumer, RingProducer, SharedAudioRing, analysis_worker
+    from streaming import ArraySource
+
+    # 消费者落后超过容量时跳到最旧的有效帧，并记录丢失的帧数
+    ring = SharedAudioRing(capacity=1000, sample_rate=8000, blocksize=100)
+    consumer = RingConsumer(ring, start="oldest")
+    data = np.arange(3500, dtype=np.float32)
+    for start in range(0, len(data), 250):
+        ring.write(data[start:start + 250])
+    ring.finish()
+    received = np.concatenate([block.copy() for block in consumer.blocks()])
+    assert np.array_equal(received, data[2500:])
+    assert consumer.overruns == 1 and consumer.dropped_frames == 2500 and consumer.dropped_blocks == 25
+    assert np.array_equal(ring.latest(300), data[-300:])
+    ring.close()
+
+    sample_rate = 44100
+    audio, positions = kennel_audio(5, sample_rate, bark_fraction=0.15, seed=6)
+    ring = SharedAudioRing(capacity=len(audio) + sample_rate, sample_rate=sample_rate, blocksize=1024)
+    try:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=analysis_worker, args=(ring.name, results))
+        process.start()
+        local = RingConsumer(ring.name, start="oldest")
+        copies = []
+        reader = threading.Thread(target=lambda: copies.extend(block.copy() for block in local.blocks()))
+        reader.start()
+        producer = RingProducer(ArraySource(audio, sample_rate, blocksize=1000), ring).start()
+        producer.join()
+        reader.join(30)
+        events = list(iter(lambda: results.get(timeout=60), None))
+        process.join(30)
+    finally:
+        ring.close()
+    assert producer.frames_written == len(audio)
+    assert np.array_equal(np.concatenate(copies), audio)
+    assert local.stats()["dropped_frames"] == 0 and local.stats()["lag"] == 0 and local.torn_blocks == 0
+    local.close()
+    assert process.exitcode == 0 and len(events) == len(positions)
+    assert abs(events[0]["start_time"] - positions[0][0] / sample_rate) < 0.02
+
+def test_server():
+    """分析服务测试（本机 HTTP 批处理 + WebSocket 流式检测）"""
+    import asyncio
+    from benchmark import kennel_audio
+    from loadgen import http_request, run_load, stream_websocket
+    from server import AnalysisServer
+
+    translator = DogTranslator()
+    sample_rate = translator.sample_rate
+    audio, positions = kennel_audio(5, sample_rate, seed=2)
+
+    async def scenario():
+        server = await AnalysisServer(translator, port=0, max_batch=16).start()
+        try:
+            stats = await run_load("127.0.0.1", server.port, concurrency=8, requests=40)
+            events = await stream_websocket("127.0.0.1", server.port, audio, sample_rate)
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            status, history = await http_request(reader, writer, "GET", "/history")
+            missing, _ = await http_request(reader, writer, "GET", "/nothing")
+            writer.close()
+            return stats, events, status, history, missing, server.batcher.stats()
+        finally:
+            await server.close()
+
+    stats, events, status, history, missing, batching = asyncio.run(scenario())
+    print(f"吞吐量: {stats['requests_per_sec']:.1f} 请求/秒, 平均批大小: {batching['mean_batch_size']:.1f}")
+    assert stats["ok"] == 40
+    assert batching["batches"] < batching["requests"]
+    assert len(events) == len(positions)
+    assert abs(events[0]["start_time"] - positions[0][0] / sample_rate) < 0.02
+    assert status == 200 and len(history) == 40 + len(positions)
+    assert missing == 404
 
 if __name__ == "__main__":
     test_full_features() 
\ No newline at end of file
@@ -1,50 +1,154 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+from analysis import to_float
+from features import get_window, pcm_scale
+
 
 class AudioVisualizer:
-    def __init__(self, translator, gui):
+    """实时声音可视化
+
+    波形按屏幕宽度抽取为每列的最小/最大值包络（画成一个填充多边形），只重算新增的列；
+    频谱只对最新的 spectrum_size 个采样点做 rfft；没有新数据时跳过重算。
+    gui 为空时使用 Agg 画布，可在无界面环境下运行。
+    matplotlib 在创建可视化时才导入，导入本模块本身不加载绘图库。
+    """
+
+    def __init__(self, translator, gui=None, width=800, spectrum_size=2048):
         self.translator = translator
         self.gui = gui
+        self.width = width              # 波形的列数（约等于屏幕像素宽度）
+        self.spectrum_size = spectrum_size
+        self.frames_rendered = 0        # 实际重算的帧数
+        self.frames_skipped = 0         # 没有新数据而跳过的帧数
+        self._last_key = None
+        self._columns_done = 0
+        self._background = None
         self.setup_plot()
         self.animation = None
-        
+
     def setup_plot(self):
         """设置声音可视化图表"""
-        self.fig, (self.wave_ax, self.freq_ax) = plt.subplots(2, 1, figsize=(8, 6))
-        self.wave_line, = self.wave_ax.plot([], [], lw=2)
-        self.freq_line, = self.freq_ax.plot([], [], lw=2)
-        
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Polygon
+        self.fig = Figure(figsize=(8, 6))
+        self.wave_ax, self.freq_ax = self.fig.subplots(2, 1)
+
+        # 预分配包络多边形：上边沿为各列最大值，下边沿倒序为各列最小值
+        columns = np.arange(self.width)
+        self.wave_xy = np.zeros((self.width * 2, 2))
+        self.wave_xy[:, 0] = np.concatenate((columns, columns[::-1]))
+        self.envelope_max = self.wave_xy[:self.width, 1]
+        self.envelope_min = self.wave_xy[self.width:, 1][::-1]
+        self.wave_line = Polygon(self.wave_xy, closed=True, lw=0, animated=True)
+        self.wave_ax.add_patch(self.wave_line)
+
+        self.freq_x = np.fft.rfftfreq(self.spectrum_size, 1.0 / self.translator.sample_rate)
+        self.spectrum = np.full(len(self.freq_x), np.nan)
+        self.freq_line, = self.freq_ax.plot(self.freq_x, self.spectrum, lw=1, animated=True)
+
         # 设置坐标轴
         self.wave_ax.set_title('声波形态')
+        self.wave_ax.set_xlim(0, self.width)
         self.wave_ax.set_ylim(-1, 1)
         self.freq_ax.set_title('频率分布')
-        
+        self.freq_ax.set_xlim(0, self.freq_x[-1])
+        self.freq_ax.set_ylim(-100, 0)
+        self.freq_ax.set_xlabel('Hz')
+        self.freq_ax.set_ylabel('dB')
+
         # 创建画布
-        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.gui.root)
+        if self.gui is not None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self.canvas = FigureCanvasTkAgg(self.fig, master=self.gui.root)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.canvas = FigureCanvasAgg(self.fig)
+
+    def _samples_per_column(self):
+        total = int(self.translator.max_duration * self.translator.sample_rate)
+        return max(1, -(-total // self.width))
+
+    def _update_envelope(self, data):
+        """只重算上次之后新增（以及上次未填满）的列"""
+        per_column = self._samples_per_column()
+        first = max(0, self._columns_done - 1)
+        last = min(self.width, -(-len(data) // per_column))
+        if last <= first:
+            return
+        chunk = data[first * per_column:last * per_column]
+        full = len(chunk) // per_column
+        if full:
+            blocks = chunk[:full * per_column].reshape(full, per_column)
+            self.envelope_min[first:first + full] = blocks.min(axis=1)
+            self.envelope_max[first:first + full] = blocks.max(axis=1)
+        if first + full < last:  # 末尾未填满的一列
+            tail = chunk[full * per_column:]
+            self.envelope_min[first + full] = tail.min()
+            self.envelope_max[first + full] = tail.max()
+        # int16 录音只换算各列的极值
+        scale = pcm_scale(data.dtype)
+        if scale != 1.0:
+            self.envelope_min[first:last] *= scale
+            self.envelope_max[first:last] *= scale
+        self._columns_done = last
+
+    def _update_spectrum(self, data):
+        """对最新窗口做 rfft，结果写入预分配的数组"""
+        latest = to_float(data[-self.spectrum_size:])
+        if len(latest) < self.spectrum_size:
+            latest = np.pad(latest, (0, self.spectrum_size - len(latest)))
+        window = get_window(self.spectrum_size)
+        magnitude = np.abs(np.fft.rfft(latest * window)) * (2.0 / window.sum())
+        np.log10(magnitude + 1e-10, out=self.spectrum)
+        self.spectrum *= 20
 
     def update_plot(self, frame):
         """更新声音可视化"""
-        if self.translator.recording is not None:
-            # 更新波形图
-            data = self.translator.recording.flatten()
-            self.wave_line.set_data(range(len(data)), data)
-            self.wave_ax.set_xlim(0, len(data))
-            
-            # 更新频谱图
-            freq_data = np.abs(np.fft.fft(data))
-            self.freq_line.set_data(range(len(freq_data)), freq_data)
-            self.freq_ax.set_xlim(0, len(freq_data))
-            
-        return self.wave_line, self.freq_line 
+        recording = self.translator.recording
+        if recording is None or len(recording) == 0:
+            self.frames_skipped += 1
+            return self.wave_line, self.freq_line
+
+        data = recording[:, 0] if recording.ndim == 2 else recording
+        # 同一块缓冲区且长度不变说明没有新数据
+        key = (data.__array_interface__['data'][0], len(data))
+        if key == self._last_key:
+            self.frames_skipped += 1
+            return self.wave_line, self.freq_line
+        if self._last_key is None or key[0] != self._last_key[0] or key[1] < self._last_key[1]:
+            self.reset()
+        self._last_key = key
+
+        self._update_envelope(data)
+        self._update_spectrum(data)
+        self.wave_line.set_xy(self.wave_xy)
+        self.freq_line.set_ydata(self.spectrum)
+        self.frames_rendered += 1
+        return self.wave_line, self.freq_line
+
+    def reset(self):
+        """新的录音开始时清空波形"""
+        self.wave_xy[:, 1] = 0
+        self._columns_done = 0
+        self._last_key = None
+
+    def render(self):
+        """手动 blit 一帧（无界面模式和基准测试使用）"""
+        if self._background is None:
+            self.canvas.draw()
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.canvas.restore_region(self._background)
+        self.fig.draw_artist(self.wave_line)
+        self.fig.draw_artist(self.freq_line)
+        self.canvas.blit(self.fig.bbox)
 
     def start_animation(self):
         """开始动画"""
+        from matplotlib.animation import FuncAnimation
         self.animation = FuncAnimation(
             self.fig, self.update_plot,
-            interval=100,  # 每100ms更新一次
-            blit=True
+            interval=33,  # 约 30 FPS
+            blit=True,
+            cache_frame_data=False
         )
 
     def stop_animation(self):
@@ -54,4 +158,4 @@ class AudioVisualizer:
 
     def get_canvas(self):
         """获取画布"""
-        return self.canvas 
\ No newline at end of file
+        return self.canvas
@@ -0,0 +1,54 @@
+import queue
+import threading
+
+
+class CaptureWorker:
+    """在后台线程中录音并分析，结果通过线程安全队列交回 Tk 主线程
+
+    主线程用 root.after 定期调用 drain() 取出消息：
+    ("result", 分析结果) 或 ("error", 错误信息)。
+    """
+
+    def __init__(self, translator):
+        self.translator = translator
+        self.messages = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self, source=None):
+        """开始后台录音，source 为空时使用麦克风"""
+        if self.busy():
+            return False
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(source, self._cancel), name='capture-worker', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """取消录音，已录制的部分仍会在后台分析"""
+        self._cancel.set()
+
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, source, cancel):
+        try:
+            recording = self.translator.capture(source, cancel)
+            result = self.translator.analyze_bark(recording)
+            self.messages.put(("result", result))
+        except Exception as e:
+            self.messages.put(("error", str(e)))
+
+    def drain(self):
+        """取出队列中的全部消息（不阻塞）"""
+        items = []
+        while True:
+            try:
+                items.append(self.messages.get_nowait())
+            except queue.Empty:
+                return items
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)